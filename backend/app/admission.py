@@ -0,0 +1,203 @@
+import math
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Optional, Tuple
+
+from .metrics import ADMISSION_REJECTIONS
+
+# --- Admission Control (from Environment Variables) ---
+# Per-user token buckets: sustained requests per minute and burst size, per scope ("chat", "embed").
+# A rate of 0 disables that limit.
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", 30))
+RATE_LIMIT_CHAT_BURST = int(os.getenv("RATE_LIMIT_CHAT_BURST", 10))
+RATE_LIMIT_EMBED_PER_MINUTE = float(os.getenv("RATE_LIMIT_EMBED_PER_MINUTE", 120))
+RATE_LIMIT_EMBED_BURST = int(os.getenv("RATE_LIMIT_EMBED_BURST", 30))
+# Requests handled at once per model_choice ("embed" is /ai/embed/); 0 means no cap
+MAX_CONCURRENT_OPENAI = int(os.getenv("MAX_CONCURRENT_OPENAI", 32))
+MAX_CONCURRENT_FLAN_T5 = int(os.getenv("MAX_CONCURRENT_FLAN_T5", 16))
+MAX_CONCURRENT_EMBEDDING = int(os.getenv("MAX_CONCURRENT_EMBEDDING", 32))
+MAX_CONCURRENT_EMBED = int(os.getenv("MAX_CONCURRENT_EMBED", 32))
+# Inference-heavy requests handled at once across all of the above; 0 means no cap
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", 64))
+# Seconds suggested to clients in the Retry-After header when a concurrency cap is hit
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 1))
+
+
+class AdmissionRejected(Exception):
+    """A request turned away before any work was done: 429 (rate limit) or 503 (concurrency cap), with Retry-After."""
+
+    def __init__(self, detail: str, status_code: int, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """
+    In-memory token buckets, one per key, each refilled at `rate_per_minute` up to `burst` tokens.
+
+    This is the per-process backend of the AdmissionController; a shared one (e.g. Redis) only needs
+    the same take() and stats() methods.
+    """
+
+    # Buckets are pruned once there are this many; a full bucket is the same as a missing one
+    PRUNE_AT = 10000
+
+    def __init__(self, rate_per_minute: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        """:param clock: Seconds from a monotonic source; tests pass a fake one."""
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._buckets: Dict[Hashable, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: Hashable, cost: float = 1.0) -> float:
+        """
+        Takes `cost` tokens from the bucket of `key`.
+        :returns: 0 if they were taken, else the seconds until they would be available
+        """
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                if len(self._buckets) > self.PRUNE_AT:
+                    self._prune(now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / self.rate
+
+    def _prune(self, now: float):
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * self.rate < self.burst
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"buckets": len(self._buckets), "rate_per_minute": self.rate * 60.0, "burst": self.burst}
+
+
+class Ticket:
+    """An admitted request's slots; release() (or leaving the `with` block) gives them back, once."""
+
+    def __init__(self, controller: "AdmissionController", scope: str):
+        self._controller = controller
+        self._scope = scope
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self._scope)
+
+    def __del__(self):
+        # A streaming response dropped before its body was ever iterated never runs hold_while()'s finally
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def hold_while(self, stream: AsyncIterator) -> AsyncIterator:
+        """Yields from `stream` and releases when it ends, for responses that outlive the handler."""
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            self.release()
+
+
+class AdmissionController:
+    """
+    Admission control in front of the inference-heavy endpoints (/ai/chat/ and its streams, /ai/embed/).
+
+    admit() runs three checks, cheapest first, and fails fast instead of queueing: the user's token
+    bucket for the endpoint's rate scope (429), then the global in-flight cap and the per-model_choice
+    concurrency cap (503). Both carry Retry-After, like the 503 of a saturated executor.
+    """
+
+    def __init__(self, rate_limits: Dict[str, Optional[TokenBuckets]] = None,
+                 concurrency_limits: Dict[str, int] = None, max_in_flight: int = MAX_INFLIGHT_REQUESTS,
+                 retry_after: int = ADMISSION_RETRY_AFTER_SECONDS):
+        if rate_limits is None:
+            rate_limits = {
+                "chat": TokenBuckets(RATE_LIMIT_CHAT_PER_MINUTE, RATE_LIMIT_CHAT_BURST) if RATE_LIMIT_CHAT_PER_MINUTE > 0 else None,
+                "embed": TokenBuckets(RATE_LIMIT_EMBED_PER_MINUTE, RATE_LIMIT_EMBED_BURST) if RATE_LIMIT_EMBED_PER_MINUTE > 0 else None,
+            }
+        self.rate_limits = rate_limits
+        self.concurrency_limits = concurrency_limits if concurrency_limits is not None else {
+            "openai": MAX_CONCURRENT_OPENAI,
+            "flan-t5": MAX_CONCURRENT_FLAN_T5,
+            "embedding": MAX_CONCURRENT_EMBEDDING,
+            "embed": MAX_CONCURRENT_EMBED,
+        }
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self._in_flight_by_scope: Dict[str, int] = {scope: 0 for scope in self.concurrency_limits}
+        # Metrics
+        self.admitted = 0
+        self._rejected: Dict[str, int] = {}
+
+    def _reject(self, reason: str, scope: str, detail: str, status_code: int, retry_after: float):
+        with self._lock:
+            self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        ADMISSION_REJECTIONS.inc(scope=scope, reason=reason)
+        raise AdmissionRejected(detail, status_code, max(1, math.ceil(retry_after)))
+
+    def admit(self, user_id: Hashable, rate_scope: str, scope: str) -> Ticket:
+        """
+        Admits one request of `user_id`, or raises AdmissionRejected.
+        :param rate_scope: Token bucket family to charge ("chat" or "embed").
+        :param scope: Concurrency scope: the model_choice, or "embed".
+        """
+        buckets = self.rate_limits.get(rate_scope)
+        if buckets is not None:
+            wait = buckets.take(user_id)
+            if wait > 0:
+                self._reject("rate_limit", scope, "Too many requests. Please slow down.", 429, wait)
+        limit = self.concurrency_limits.get(scope, 0)
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                reason = "global"
+            elif limit and self._in_flight_by_scope.get(scope, 0) >= limit:
+                reason = "concurrency"
+            else:
+                reason = None
+                self.in_flight += 1
+                self._in_flight_by_scope[scope] = self._in_flight_by_scope.get(scope, 0) + 1
+                self.admitted += 1
+        if reason is not None:
+            self._reject(reason, scope, "The server is busy. Please retry shortly.", 503, self.retry_after)
+        return Ticket(self, scope)
+
+    def _release(self, scope: str):
+        with self._lock:
+            self.in_flight -= 1
+            self._in_flight_by_scope[scope] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "admitted": self.admitted,
+                **{f"rejected_{reason}": count for reason, count in self._rejected.items()},
+            }
+            # Nested per scope: exported with a name="<scope>" label
+            for scope, limit in self.concurrency_limits.items():
+                stats[scope] = {"scope_in_flight": self._in_flight_by_scope.get(scope, 0), "scope_limit": limit}
+        for rate_scope, buckets in self.rate_limits.items():
+            if buckets is not None:
+                stats[f"rate_{rate_scope}"] = buckets.stats()
+        return stats
+
+
+# Shared per-process controller
+admission = AdmissionController()
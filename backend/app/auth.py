@@ -1,15 +1,22 @@
 import os
+import threading
+import time
+from contextvars import ContextVar
 from datetime import datetime, timedelta, timezone
-from typing import Annotated, Optional
+from typing import Annotated, Any, Dict, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 
 from .database import get_db
 from . import models, schemas
+from .executors import db_executor, hashing_executor
+from .metrics import stage_timer
+from .response_cache import TTLCache
 
 # --- Password Hashing Setup ---
 # This configures passlib to use the bcrypt algorithm
@@ -29,6 +36,15 @@ if not SECRET_KEY:
 # It expects the token in the 'Authorization: Bearer <TOKEN>' header.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token") # "token" is the endpoint for getting a token
 
+# How long get_current_user took for the current request (read by handlers for stage metrics)
+last_auth_seconds: ContextVar[float] = ContextVar("last_auth_seconds", default=0.0)
+
+# --- Authentication Caches (from Environment Variables) ---
+# Resolved principals and verified tokens are reused for a short while instead of
+# re-checking the signature and querying `users` on every authenticated request.
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 4096))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", 30))
+
 # --- Password Utilities (moved from main.py for better organization, but still using pwd_context from main) ---
 # Note: In a larger app, you might move pwd_context definition here or into a config file.
 # For now, we're importing it from main.py as it's already there.
@@ -41,6 +57,20 @@ def get_password_hash(password: str) -> str:
     """Hashes a plain password."""
     return pwd_context.hash(password)
 
+# bcrypt costs 100-300 ms of CPU per call; async handlers must use these instead of the sync versions
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password() on the hashing executor."""
+    return await hashing_executor.run(_timed, "password_verify", verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash() on the hashing executor."""
+    return await hashing_executor.run(_timed, "password_hash", get_password_hash, password)
+
+def _timed(stage: str, fn, *args):
+    with stage_timer(stage, model_choice="auth"):
+        return fn(*args)
+
 # --- JWT Token Functions ---
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -63,34 +93,151 @@ def authenticate_user(db: Session, username: str, password: str):
     Authenticates a user against the database.
     :returns: User object if authenticated, else None.
     """
+    user = _find_login_user(db, username)
+    if not user:
+        return None
+    if not verify_password(password, user.hashed_password):
+        return None
+    return user
+
+def _find_login_user(db: Session, username: str):
     # Assuming 'username' can be either the actual username or email for login
-    user = db.query(models.User).filter(
+    return db.query(models.User).filter(
         (models.User.username == username) | (models.User.email == username)
     ).first()
+
+async def authenticate_user_async(db: Session, username: str, password: str):
+    """
+    authenticate_user() for async handlers: the lookup runs on the DB executor and the
+    bcrypt check on the hashing executor, so neither blocks the event loop.
+    :returns: User object if authenticated, else None.
+    """
+    user = await db_executor.run(_find_login_user, db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
+        return None
+    return user
+
+# --- Authentication Caches ---
+
+class _SavedTime:
+    """Running cost of the uncached path, used to estimate the time a cache hit saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def miss(self, seconds: float):
+        with self._lock:
+            self.lookups += 1
+            self.lookup_seconds += seconds
+
+    def hit(self):
+        with self._lock:
+            if self.lookups:
+                self.saved_seconds += self.lookup_seconds / self.lookups
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "avg_uncached_ms": 1000.0 * self.lookup_seconds / self.lookups if self.lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
+
+
+# token -> username, kept no longer than the token's own expiry
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+# username -> column values of the users row
+principal_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+_token_savings = _SavedTime()
+_principal_savings = _SavedTime()
+
+_USER_COLUMNS = tuple(c.key for c in models.User.__table__.columns)
+
+
+def invalidate_user(username: str):
+    """Drops the cached principal of `username`; its next request re-reads the users row."""
+    principal_cache.delete(username)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    # Covers every ORM write to a user (profile edits, deactivation, deletion). Writes that
+    # bypass the ORM must call invalidate_user() themselves.
+    invalidate_user(target.username)
+    # A renamed user must also lose the entry cached under the old name
+    for old_username in inspect(target).attrs.username.history.deleted or ():
+        invalidate_user(old_username)
+
+
+def auth_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        "token": {**token_cache.stats(), **_token_savings.stats()},
+        "principal": {**principal_cache.stats(), **_principal_savings.stats()},
+    }
+
+
+def _verify_token(token: str) -> Optional[str]:
+    """:returns: The token's subject if its signature and expiry check out, else None."""
+    username = token_cache.get(token)
+    if username is not None:
+        _token_savings.hit()
+        return username
+
+    started = time.perf_counter()
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    _token_savings.miss(time.perf_counter() - started)
+    if username is None:
         return None
+    expires_in = payload.get("exp", time.time()) - time.time()
+    token_cache.set(token, username, ttl_seconds=expires_in)
+    return username
+
+
+def _find_principal(db: Session, username: str) -> Optional[models.User]:
+    started = time.perf_counter()
+    user = db.query(models.User).filter(models.User.username == username).first()
+    _principal_savings.miss(time.perf_counter() - started)
     return user
 
+
+async def _load_principal(db: Session, username: str) -> Optional[models.User]:
+    fields = principal_cache.get(username)
+    if fields is not None:
+        _principal_savings.hit()
+        # A fresh, session-less instance per request so handlers never share ORM state
+        return models.User(**fields)
+
+    # Cache miss: the users query runs on the DB executor, off the event loop
+    user = await db_executor.run(_find_principal, db, username)
+    if user is not None:
+        principal_cache.set(username, {key: getattr(user, key) for key in _USER_COLUMNS})
+    return user
+
+
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
+    started = time.perf_counter()
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-
-    except JWTError:
+    username = _verify_token(token)
+    if username is None:
         raise credentials_exception
+    token_data = schemas.TokenData(username=username)
 
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
+    user = await _load_principal(db, token_data.username)
     if user is None:
         raise credentials_exception
+    last_auth_seconds.set(time.perf_counter() - started)
     return user
\ No newline at end of file
@@ -1,8 +1,11 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://root:root@db:5432/healthmate_ai_db") 
 
 engine = create_engine(DATABASE_URL, pool_pre_ping=True)
@@ -25,7 +28,9 @@ def create_db_tables():
 
     try:
         Base.metadata.create_all(bind=engine)
+        # create_all() skips indexes on tables that already exist, so add any new ones explicitly
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
     except Exception as e:
-        # For production, you might want a more sophisticated logging system
-        # For now, we'll keep a basic print for errors, but expect success.
-        print(f"ERROR: Failed to create database tables during startup: {e}")
\ No newline at end of file
+        logger.error("Failed to create database tables during startup: %s", e)
\ No newline at end of file
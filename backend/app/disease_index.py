@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from sqlalchemy import delete, select, text
+
+from . import models
+from .database import engine
+from .snapshot import RefreshingSnapshot
+from .routers.llm_models import embedder_model_id, get_embedder
+
+logger = logging.getLogger(__name__)
+
+# --- Persisted Vectors (from Environment Variables) ---
+# Store vectors computed while building the index, so the next process loads them instead of encoding
+DISEASE_EMBEDDINGS_WRITE_BACK = os.getenv("DISEASE_EMBEDDINGS_WRITE_BACK", "true").lower() in ("1", "true", "yes")
+# Texts per encode() call when (re-)embedding diseases
+DISEASE_EMBED_BATCH_SIZE = int(os.getenv("DISEASE_EMBED_BATCH_SIZE", 64))
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Returns a C-contiguous float32 copy of `vectors` with every row scaled to unit L2 norm."""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+
+class DiseaseEmbeddingIndex:
+    """
+    Immutable, pre-normalized disease vector index.
+
+    - vectors: (n_diseases, dim) float32 matrix, each row L2-normalized
+    - disease_ids: row -> disease id
+    - rows: row -> (id, name, description), in the same shape the SQL queries return
+    - version: content hash of the diseases table the index was built from
+    """
+
+    __slots__ = ("vectors", "disease_ids", "rows", "version")
+
+    def __init__(self, vectors, rows, version):
+        self.vectors = normalize_rows(vectors) if len(rows) else np.zeros((0, 0), dtype=np.float32)
+        self.rows = tuple(rows)
+        self.disease_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.version = version
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def disease_text(name: str, description: str) -> str:
+    """The text each disease is embedded as."""
+    return f"{name}: {description}"
+
+
+def text_hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _load_disease_rows(db):
+    return db.execute(text("SELECT id, name, description FROM diseases ORDER BY id")).fetchall()
+
+
+def load_stored_vectors(conn, model_id: str) -> Dict[int, tuple]:
+    """:returns: disease_id -> (text_hash, vector) of every stored vector of `model_id`."""
+    table = models.DiseaseEmbedding.__table__
+    result = conn.execute(
+        select(table.c.disease_id, table.c.text_hash, table.c.dim, table.c.vector).where(table.c.model == model_id)
+    )
+    return {
+        disease_id: (hash_, np.frombuffer(vector, dtype="<f4", count=dim))
+        for disease_id, hash_, dim, vector in result
+    }
+
+
+def store_vectors(conn, model_id: str, disease_ids: Sequence[int], hashes: Sequence[str], vectors: np.ndarray):
+    """Replaces the stored vectors of `disease_ids` for `model_id` (delete + multi-row insert)."""
+    table = models.DiseaseEmbedding.__table__
+    vectors = normalize_rows(vectors).astype("<f4", copy=False)
+    conn.execute(delete(table).where(table.c.model == model_id, table.c.disease_id.in_(list(disease_ids))))
+    conn.execute(table.insert(), [
+        {"disease_id": int(did), "model": model_id, "text_hash": hash_, "dim": vectors.shape[1],
+         "vector": vectors[i].tobytes()}
+        for i, (did, hash_) in enumerate(zip(disease_ids, hashes))
+    ])
+
+
+def _encode_texts(texts: List[str], batch_size: int = DISEASE_EMBED_BATCH_SIZE) -> np.ndarray:
+    embedder = get_embedder()
+    return np.vstack([
+        normalize_rows(embedder.encode(texts[i:i + batch_size])) for i in range(0, len(texts), batch_size)
+    ])
+
+
+def resolve_vectors(conn, rows, model_id: str) -> Dict[str, Any]:
+    """
+    Vectors for `rows` (id, name, description): the stored ones whose text hash still matches,
+    and freshly encoded ones for new or changed diseases.
+    :returns: {"vectors": (n, dim) matrix aligned with rows, "reused": n loaded,
+        "changed": (disease_ids, text_hashes, vectors) of the diseases that were encoded}
+    """
+    hashes = [text_hash(disease_text(r[1], r[2])) for r in rows]
+    stored = load_stored_vectors(conn, model_id)
+    stale = [i for i, (row, hash_) in enumerate(zip(rows, hashes)) if stored.get(row[0], (None,))[0] != hash_]
+
+    encoded = _encode_texts([disease_text(rows[i][1], rows[i][2]) for i in stale]) if stale else None
+    fresh = dict(zip(stale, encoded)) if stale else {}
+    vectors = np.vstack([fresh[i] if i in fresh else stored[row[0]][1] for i, row in enumerate(rows)])
+    changed = ([rows[i][0] for i in stale], [hashes[i] for i in stale], encoded)
+    return {"vectors": vectors, "reused": len(rows) - len(stale), "changed": changed}
+
+
+def sync_disease_embeddings(model_id: str = None) -> Dict[str, Any]:
+    """
+    Brings the stored vectors of `model_id` (default: the configured embedder) up to date with the
+    diseases table: re-embeds only new or changed diseases and drops vectors of deleted ones.
+    Vectors come from get_embedder(), so `model_id` must be that embedder's id.
+    """
+    configured = embedder_model_id()
+    if model_id and model_id != configured:
+        raise ValueError(
+            f"Cannot sync {model_id!r}: the configured embedder is {configured!r} (set EMBEDDER_BACKEND to switch)"
+        )
+    model_id = configured
+    table = models.DiseaseEmbedding.__table__
+    started = time.perf_counter()
+    encoded = reused = 0
+    with engine.begin() as conn:
+        rows = [tuple(r) for r in _load_disease_rows(conn)]
+        if rows:
+            resolved = resolve_vectors(conn, rows, model_id)
+            changed_ids = resolved["changed"][0]
+            if changed_ids:
+                store_vectors(conn, model_id, *resolved["changed"])
+            encoded, reused = len(changed_ids), resolved["reused"]
+        deleted = conn.execute(
+            delete(table).where(table.c.model == model_id, table.c.disease_id.not_in([r[0] for r in rows]))
+        ).rowcount
+    return {
+        "model": model_id,
+        "diseases": len(rows),
+        "encoded": encoded,
+        "reused": reused,
+        "deleted": deleted,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _build_disease_index(rows, version):
+    if not rows:
+        return DiseaseEmbeddingIndex(np.zeros((0, 0), dtype=np.float32), rows, version)
+    model_id = embedder_model_id()
+    try:
+        with engine.connect() as conn:
+            resolved = resolve_vectors(conn, rows, model_id)
+    except Exception:
+        # Stored vectors are an optimization: without them, encode everything as before
+        logger.exception("Could not read stored disease embeddings; encoding all %d diseases", len(rows))
+        return DiseaseEmbeddingIndex(_encode_texts([disease_text(r[1], r[2]) for r in rows]), rows, version)
+
+    changed_ids = resolved["changed"][0]
+    logger.info("Disease vectors for %s: %d loaded, %d encoded", model_id, resolved["reused"], len(changed_ids))
+    if changed_ids and DISEASE_EMBEDDINGS_WRITE_BACK:
+        try:
+            with engine.begin() as conn:
+                store_vectors(conn, model_id, *resolved["changed"])
+        except Exception:
+            # e.g. another process stored the same rows first; the vectors in hand are still good
+            logger.warning("Could not store %d disease embeddings", len(changed_ids), exc_info=True)
+    return DiseaseEmbeddingIndex(resolved["vectors"], rows, version)
+
+
+# Shared per-process index. Built on first use, then kept fresh by a background poller.
+disease_index = RefreshingSnapshot("disease embedding index", _load_disease_rows, _build_disease_index)
@@ -0,0 +1,162 @@
+import os
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .disease_index import disease_index, normalize_rows
+from .disease_scoring import symptom_disease_matrix
+from .knowledge_base import knowledge_base
+from .metrics import stage_timer
+from .symptom_matcher import SymptomMatch, symptom_matcher
+
+# --- Ranking Weights (from Environment Variables) ---
+# fused score = keyword weight * (keyword votes / best keyword votes) + embedding weight * cosine similarity
+RANK_KEYWORD_WEIGHT = float(os.getenv("RANK_KEYWORD_WEIGHT", 0.5))
+RANK_EMBEDDING_WEIGHT = float(os.getenv("RANK_EMBEDDING_WEIGHT", 0.5))
+# Candidates kept per message (and stored in ChatMessage.recommendations)
+RANK_TOP_K = int(os.getenv("RANK_TOP_K", 3))
+
+
+class RankedDisease(NamedTuple):
+    disease: Tuple[int, str, str]  # (id, name, description)
+    score: float
+    keyword_score: float
+    similarity: float
+
+
+class RankResult(NamedTuple):
+    candidates: List[RankedDisease]  # best first
+    symptom_matches: Dict[int, List[SymptomMatch]]
+    symptom_names: Dict[int, str]
+    keyword_weight: float
+    embedding_weight: float
+
+    @property
+    def best(self) -> Optional[RankedDisease]:
+        return self.candidates[0] if self.candidates else None
+
+    def extracted_symptoms(self) -> Dict[str, Any]:
+        """Payload of ChatMessage.extracted_symptoms: the symptoms matched in the message."""
+        return {"symptoms": [
+            {
+                "id": symptom_id,
+                "name": self.symptom_names.get(symptom_id),
+                "keywords": sorted({m.keyword for m in matches}),
+            }
+            for symptom_id, matches in sorted(self.symptom_matches.items())
+        ]}
+
+    def recommendations(self, suggestions: List[str] = ()) -> Dict[str, Any]:
+        """Payload of ChatMessage.recommendations: the scored candidates and the suggestions shown."""
+        return {
+            "candidates": [
+                {
+                    "disease_id": c.disease[0],
+                    "name": c.disease[1],
+                    "score": round(c.score, 4),
+                    "keyword_score": round(c.keyword_score, 4),
+                    "similarity": round(c.similarity, 4),
+                }
+                for c in self.candidates
+            ],
+            "weights": {"keyword": self.keyword_weight, "embedding": self.embedding_weight},
+            "suggestions": list(suggestions),
+        }
+
+    def as_payload(self) -> Dict[str, Any]:
+        """JSON-safe form for sending a ranking between processes; see from_payload()."""
+        return {
+            "candidates": [[c.disease[0], c.score, c.keyword_score, c.similarity] for c in self.candidates],
+            "symptom_matches": [list(m) for matches in self.symptom_matches.values() for m in matches],
+            "keyword_weight": self.keyword_weight,
+            "embedding_weight": self.embedding_weight,
+        }
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "RankResult":
+        """Rebuilds a ranking from as_payload(), resolving diseases against this process's knowledge base."""
+        kb = knowledge_base.get()
+        symptom_matches: Dict[int, List[SymptomMatch]] = {}
+        for match in payload["symptom_matches"]:
+            symptom_matches.setdefault(match[0], []).append(SymptomMatch(*match))
+        candidates = [
+            RankedDisease(kb.disease(disease_id), score, keyword_score, similarity)
+            for disease_id, score, keyword_score, similarity in payload["candidates"]
+            # Skips diseases this process has not loaded yet (its snapshot may lag for a moment)
+            if kb.disease(disease_id) is not None
+        ]
+        return cls(candidates, symptom_matches, symptom_matcher.get().symptom_names,
+                   payload["keyword_weight"], payload["embedding_weight"])
+
+
+def _scatter(target_ids: np.ndarray, source_ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Re-orders `values` (aligned with source_ids) onto target_ids; ids missing from the source get 0."""
+    out = np.zeros(len(target_ids), dtype=np.float64)
+    if not len(source_ids) or not len(target_ids):
+        return out
+    positions = np.searchsorted(target_ids, source_ids)
+    positions = np.minimum(positions, len(target_ids) - 1)
+    known = target_ids[positions] == source_ids
+    out[positions[known]] = values[known]
+    return out
+
+
+class DiseaseRanker:
+    """
+    Scores every disease for a message in one vectorized pass.
+
+    Keyword votes (matched symptoms x link weights) and, when a query embedding is given,
+    cosine similarities to the precomputed disease vectors are laid out as arrays over all
+    diseases, fused with the configured weights, and cut to the top k with argpartition.
+    Without an embedding only diseases with keyword votes are candidates.
+    """
+
+    def __init__(self, keyword_weight: float = RANK_KEYWORD_WEIGHT, embedding_weight: float = RANK_EMBEDDING_WEIGHT,
+                 top_k: int = RANK_TOP_K):
+        self.keyword_weight = keyword_weight
+        self.embedding_weight = embedding_weight
+        self.top_k = max(1, top_k)
+
+    def rank(self, question: str, query_vector=None, k: int = None) -> RankResult:
+        k = self.top_k if k is None else max(1, k)
+        kb = knowledge_base.get()
+        matcher = symptom_matcher.get()
+        disease_ids = kb.disease_ids
+
+        with stage_timer("symptom_match"):
+            symptom_matches = matcher.match(question)
+        keyword = np.zeros(len(disease_ids), dtype=np.float64)
+        if symptom_matches:
+            matrix = symptom_disease_matrix.get()
+            keyword = _scatter(disease_ids, matrix.disease_ids, matrix.scores(symptom_matches))
+
+        similarity = np.zeros(len(disease_ids), dtype=np.float64)
+        embedding_weight = 0.0
+        if query_vector is not None:
+            index = disease_index.get()
+            if len(index):
+                sims = index.vectors @ normalize_rows(query_vector)[0]
+                similarity = _scatter(disease_ids, index.disease_ids, sims.astype(np.float64))
+                embedding_weight = self.embedding_weight
+
+        best_votes = keyword.max() if len(keyword) else 0.0
+        keyword_norm = keyword / best_votes if best_votes > 0 else keyword
+        # Weights only apply when there is something to fuse; keyword-only ranking uses the votes as is
+        keyword_weight = self.keyword_weight if embedding_weight else 1.0
+        fused = keyword_weight * keyword_norm + embedding_weight * similarity
+
+        eligible = np.arange(len(disease_ids)) if embedding_weight else np.flatnonzero(keyword > 0)
+        if k < len(eligible):
+            eligible = eligible[np.argpartition(-fused[eligible], k - 1)[:k]]
+        # Best first; ties go to the lower disease id
+        order = eligible[np.lexsort((disease_ids[eligible], -fused[eligible]))]
+
+        candidates = [
+            RankedDisease(kb.diseases[int(disease_ids[i])], float(fused[i]), float(keyword[i]), float(similarity[i]))
+            for i in order
+        ]
+        return RankResult(candidates, symptom_matches, matcher.symptom_names, keyword_weight, embedding_weight)
+
+
+# Shared ranker using the configured weights
+disease_ranker = DiseaseRanker()
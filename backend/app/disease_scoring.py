@@ -0,0 +1,58 @@
+from typing import Iterable
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import text
+
+from .snapshot import RefreshingSnapshot
+
+
+class SymptomDiseaseMatrix:
+    """
+    The disease_symptoms table held as a CSR matrix of shape (n_symptoms, n_diseases).
+
+    Scoring a message is one sparse row-vector x matrix product: the indicator vector of
+    matched symptoms times the weight matrix gives the summed weight per disease, the
+    same votes the old per-symptom queries added up in a dict.
+    """
+
+    def __init__(self, rows, version=None):
+        """
+        :param rows: Iterable of (disease_id, symptom_id, weight) rows.
+        """
+        self.version = version
+        rows = list(rows)
+        self.disease_ids = np.array(sorted({r[0] for r in rows}), dtype=np.int64)
+        symptom_ids = sorted({r[1] for r in rows})
+        self._symptom_pos = {sid: i for i, sid in enumerate(symptom_ids)}
+        disease_pos = {did: i for i, did in enumerate(self.disease_ids.tolist())}
+
+        data = np.array([float(r[2]) for r in rows], dtype=np.float64)
+        row_idx = np.array([self._symptom_pos[r[1]] for r in rows], dtype=np.int32)
+        col_idx = np.array([disease_pos[r[0]] for r in rows], dtype=np.int32)
+        self.weights = sparse.csr_matrix(
+            (data, (row_idx, col_idx)), shape=(len(symptom_ids), len(self.disease_ids))
+        )
+
+    def scores(self, symptom_ids: Iterable[int]) -> np.ndarray:
+        """Dense vector of summed weights, aligned with self.disease_ids."""
+        positions = sorted({self._symptom_pos[sid] for sid in symptom_ids if sid in self._symptom_pos})
+        if not positions:
+            return np.zeros(len(self.disease_ids), dtype=np.float64)
+        query = sparse.csr_matrix(
+            (np.ones(len(positions), dtype=np.float64), (np.zeros(len(positions), dtype=np.int32), positions)),
+            shape=(1, self.weights.shape[0]),
+        )
+        return (query @ self.weights).toarray().ravel()
+
+
+def _load_disease_symptom_rows(db):
+    return db.execute(text(
+        "SELECT disease_id, symptom_id, weight FROM disease_symptoms ORDER BY disease_id, symptom_id"
+    )).fetchall()
+
+
+# Shared per-process weight matrix, rebuilt in the background when disease_symptoms changes
+symptom_disease_matrix = RefreshingSnapshot(
+    "symptom-disease matrix", _load_disease_symptom_rows, SymptomDiseaseMatrix
+)
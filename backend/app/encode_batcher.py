@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Dict, Any
+
+import numpy as np
+
+from .executors import ExecutorSaturated, inference_executor
+from .routers.llm_models import get_embedder
+
+logger = logging.getLogger(__name__)
+
+# Largest batch handed to a single encode() call
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", 32))
+# How long the worker waits for more texts after the first one arrives
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 5))
+# Texts allowed to wait for a batch before new requests are rejected with a 503
+EMBED_BATCH_MAX_QUEUE = int(os.getenv("EMBED_BATCH_MAX_QUEUE", 256))
+
+
+class EncodeBatcher:
+    """
+    Collects concurrent single-text encode requests into batched encode() calls.
+
+    Coroutines await encode(text) (sync code can use submit(text).result()); a dedicated
+    collector thread takes the first queued text, keeps collecting for up to max_wait_ms
+    or max_batch_size texts, and hands the batch to the inference executor, which runs
+    one batched encode and resolves each caller's future with its own row.
+    """
+
+    def __init__(self, get_model: Callable = get_embedder,
+                 max_batch_size: int = EMBED_BATCH_MAX_SIZE, max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS,
+                 max_queue: int = EMBED_BATCH_MAX_QUEUE):
+        self._get_model = get_model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        self.max_batch_seen = 0
+        self.total_wait_seconds = 0.0
+        self.total_encode_seconds = 0.0
+        self.errors = 0
+        self.rejected = 0
+
+    def submit(self, text: str) -> Future:
+        """Queues a single text for the next batch. Raises ExecutorSaturated if the queue is full."""
+        future: Future = Future()
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((text, future, time.perf_counter()))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise ExecutorSaturated("embedding")
+        return future
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Returns the embedding of a single text, computed as part of a batch."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                # Blocks while the inference pool is full, which backs up into the bounded queue
+                inference_executor.submit(self._encode_batch, batch, block=True)
+            except Exception as e:
+                # Fail this batch's callers, but keep the collector alive for the next one
+                logger.exception("Could not schedule an encode batch of %d texts", len(batch))
+                with self._stats_lock:
+                    self.errors += 1
+                for item in batch:
+                    _resolve(item[1], None, e)
+
+    def _encode_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            vectors = self._get_model().encode([item[0] for item in batch])
+            results = [(item[1], vectors[i], None) for i, item in enumerate(batch)]
+        except Exception as e:
+            results = [(item[1], None, e) for item in batch]
+            with self._stats_lock:
+                self.errors += 1
+        finished = time.perf_counter()
+
+        with self._stats_lock:
+            self.batches += 1
+            self.texts += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.total_wait_seconds += sum(started - item[2] for item in batch)
+            self.total_encode_seconds += finished - started
+
+        for future, vector, error in results:
+            _resolve(future, vector, error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "texts": self.texts,
+                "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "max_batch_size_seen": self.max_batch_seen,
+                "queue_depth": self._queue.qsize(),
+                "avg_wait_ms": 1000.0 * self.total_wait_seconds / self.texts if self.texts else 0.0,
+                "avg_encode_ms": 1000.0 * self.total_encode_seconds / self.batches if self.batches else 0.0,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+
+def _resolve(future: Future, vector, error):
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(vector)
+    except InvalidStateError:
+        # The awaiting request was cancelled while its text was in the batch
+        pass
+
+
+# Shared per-process batcher for the MiniLM embedder
+encode_batcher = EncodeBatcher()
@@ -0,0 +1,101 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict
+
+# --- Executor Sizing (from Environment Variables) ---
+# Each pool gets `workers` threads plus room for `queue` waiting jobs; anything beyond that is rejected.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", 8))
+DB_EXECUTOR_QUEUE = int(os.getenv("DB_EXECUTOR_QUEUE", 64))
+INFERENCE_EXECUTOR_WORKERS = int(os.getenv("INFERENCE_EXECUTOR_WORKERS", 2))
+INFERENCE_EXECUTOR_QUEUE = int(os.getenv("INFERENCE_EXECUTOR_QUEUE", 16))
+# bcrypt releases the GIL while hashing, so threads scale with cores; default to one per core
+HASHING_EXECUTOR_WORKERS = int(os.getenv("HASHING_EXECUTOR_WORKERS", os.cpu_count() or 2))
+HASHING_EXECUTOR_QUEUE = int(os.getenv("HASHING_EXECUTOR_QUEUE", 64))
+# Seconds suggested to clients in the Retry-After header of a 503
+EXECUTOR_RETRY_AFTER_SECONDS = int(os.getenv("EXECUTOR_RETRY_AFTER_SECONDS", 1))
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a bounded executor has no free worker and its queue is full."""
+
+    def __init__(self, name: str, retry_after: int = EXECUTOR_RETRY_AFTER_SECONDS):
+        super().__init__(f"The {name} executor is saturated. Please retry shortly.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a hard cap on accepted-but-unfinished jobs.
+
+    Async handlers `await executor.run(fn, ...)` to move blocking work off the event loop.
+    When workers + queue slots are all taken the call fails fast with ExecutorSaturated
+    (turned into a 503 + Retry-After by the app) instead of queueing without bound.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, block: bool = False, **kwargs) -> Future:
+        """
+        Schedules fn(*args, **kwargs) on the pool.
+        :param block: Wait for a free slot instead of raising ExecutorSaturated (for internal pipelines).
+        """
+        if not self._slots.acquire(blocking=block):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorSaturated(self.name)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            # Carry context variables (e.g. the metrics model_choice label) onto the worker thread
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release(completed=True))
+        return future
+
+    async def run(self, fn, *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) on the pool and awaits its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _release(self, completed: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if completed:
+                self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.max_workers),
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+# Shared per-process executors, sized separately so one slow stage can't starve the others
+db_executor = BoundedExecutor("db", DB_EXECUTOR_WORKERS, DB_EXECUTOR_QUEUE)
+inference_executor = BoundedExecutor("inference", INFERENCE_EXECUTOR_WORKERS, INFERENCE_EXECUTOR_QUEUE)
+# Password hashing/verification, kept apart so a login burst can't delay DB work or inference
+hashing_executor = BoundedExecutor("hashing", HASHING_EXECUTOR_WORKERS, HASHING_EXECUTOR_QUEUE)
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {ex.name: ex.stats() for ex in (db_executor, inference_executor, hashing_executor)}
@@ -0,0 +1,413 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from .executors import ExecutorSaturated
+from .routers.llm_models import get_flan_t5
+
+logger = logging.getLogger(__name__)
+
+# --- FLAN-T5 Generation Service (from Environment Variables) ---
+# Rephrase the retrieved disease and suggestions with FLAN-T5 (false: keyword-lookup text only)
+FLAN_REPHRASE = os.getenv("FLAN_REPHRASE", "true").lower() in ("1", "true", "yes")
+# Largest number of prompts generated together in one padded generate() call
+FLAN_BATCH_MAX_SIZE = int(os.getenv("FLAN_BATCH_MAX_SIZE", 8))
+# How long the collector waits for more prompts after the first one arrives
+FLAN_BATCH_MAX_WAIT_MS = float(os.getenv("FLAN_BATCH_MAX_WAIT_MS", 20))
+# Prompts allowed to wait for a batch before new requests are rejected
+FLAN_MAX_QUEUE = int(os.getenv("FLAN_MAX_QUEUE", 64))
+# New tokens per reply by default, and the cap no caller can exceed
+FLAN_MAX_NEW_TOKENS = int(os.getenv("FLAN_MAX_NEW_TOKENS", 96))
+FLAN_MAX_NEW_TOKENS_LIMIT = int(os.getenv("FLAN_MAX_NEW_TOKENS_LIMIT", 150))
+# Time budget of one request, queueing included; a row still generating at its deadline is cut off
+FLAN_DEADLINE_SECONDS = float(os.getenv("FLAN_DEADLINE_SECONDS", 8))
+# Tokenized prompt bodies kept in memory (bodies repeat per disease)
+FLAN_PROMPT_CACHE_SIZE = int(os.getenv("FLAN_PROMPT_CACHE_SIZE", 1024))
+
+# Shared instruction in front of every rephrase prompt; tokenized once
+REPHRASE_INSTRUCTION = (
+    "You are a friendly health assistant. Rewrite the following information as a short, caring reply "
+    "to a patient. Name the likely condition, explain it in one sentence and pass on the advice. "
+    "Do not make a definitive diagnosis.\n\n"
+)
+
+
+def rephrase_prompt(disease_name: str, disease_desc: str, suggestions: Sequence[str]) -> str:
+    """The per-reply part of a rephrase prompt; REPHRASE_INSTRUCTION is prepended by the generator."""
+    advice = "\n".join(f"- {s}" for s in suggestions)
+    return f"Condition: {disease_name}\nAbout: {disease_desc}\nAdvice:\n{advice}\n\nReply:"
+
+
+class GenerationDeadlineExceeded(Exception):
+    """The request's deadline passed before generation finished. `partial` holds the text produced so far."""
+
+    def __init__(self, partial: str = ""):
+        super().__init__("FLAN-T5 generation exceeded its deadline")
+        self.partial = partial
+
+
+class _GenerationRequest:
+    def __init__(self, prefix: str, body: str, max_new_tokens: int, deadline_seconds: float,
+                 loop: asyncio.AbstractEventLoop):
+        self.prefix = prefix
+        self.body = body
+        self.max_new_tokens = max_new_tokens
+        self.enqueued_at = time.perf_counter()
+        self.deadline = self.enqueued_at + deadline_seconds
+        self.loop = loop
+        # ("text", chunk), ("end", finish_reason) or ("error", exception), posted from the generator thread
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.token_ids: List[int] = []
+        self.text = ""
+        self.sent = 0  # characters of self.text already posted
+        self.finish_reason: Optional[str] = None
+        self.cancelled = False
+
+    def post(self, kind: str, value):
+        try:
+            self.loop.call_soon_threadsafe(self.events.put_nowait, (kind, value))
+        except RuntimeError:
+            # The caller's event loop is gone
+            self.cancelled = True
+
+
+class _BatchStreamer:
+    """
+    transformers streamer for a whole batch: generate() hands it the next token of every row,
+    and each row's newly completed words are posted to its request right away.
+    """
+
+    def __init__(self, service: "FlanGenerator", requests: List[_GenerationRequest], tokenizer):
+        self.service = service
+        self.requests = requests
+        self.tokenizer = tokenizer
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            # The first call carries the decoder start tokens
+            self._prompt_seen = True
+            return
+        tokens = value.reshape(-1).tolist()
+        now = time.perf_counter()
+        for request, token in zip(self.requests, tokens):
+            if request.finish_reason is not None:
+                continue
+            if token == self.tokenizer.eos_token_id:
+                self.service._finish(request, "eos", self.tokenizer)
+                continue
+            if not request.token_ids:
+                self.service._observe_first_token(now - request.enqueued_at)
+            request.token_ids.append(token)
+            request.text = self.tokenizer.decode(request.token_ids, skip_special_tokens=True)
+            # Only whole words: the last piece may still change as tokens are added
+            cut = request.text.rfind(" ") + 1
+            if cut > request.sent:
+                request.post("text", request.text[request.sent:cut])
+                request.sent = cut
+
+    def end(self):
+        pass
+
+
+class _StopRows:
+    """Per-row stopping criterion: a row stops at its own token limit, deadline or cancellation."""
+
+    def __init__(self, service: "FlanGenerator", requests: List[_GenerationRequest], tokenizer):
+        self.service = service
+        self.requests = requests
+        self.tokenizer = tokenizer
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        now = time.perf_counter()
+        done = []
+        for request in self.requests:
+            if request.finish_reason is None:
+                if request.cancelled:
+                    self.service._finish(request, "cancelled", self.tokenizer)
+                elif now >= request.deadline:
+                    self.service._finish(request, "deadline", self.tokenizer)
+                elif len(request.token_ids) >= request.max_new_tokens:
+                    self.service._finish(request, "length", self.tokenizer)
+            done.append(request.finish_reason is not None)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class FlanGenerator:
+    """
+    Batched FLAN-T5 generation with incremental output.
+
+    Coroutines iterate stream(body) (or await generate(body)); a dedicated thread collects
+    queued prompts for up to max_wait_ms or max_batch_size prompts and runs them as one padded
+    generate() call. Each row stops on its own at EOS, its max_new_tokens, its deadline or when
+    its caller goes away, and finished words are posted to the caller while the batch is still
+    running. Only one batch runs at a time: a single generate() already keeps every core busy.
+
+    The shared instruction prefix is tokenized once and prompt bodies are kept in an LRU, so a
+    request costs no tokenization when its disease was seen before. (T5's encoder is
+    bidirectional, so encoder states of the prefix cannot be reused across different bodies.)
+    """
+
+    def __init__(self, get_model=get_flan_t5, max_batch_size: int = FLAN_BATCH_MAX_SIZE,
+                 max_wait_ms: float = FLAN_BATCH_MAX_WAIT_MS, max_queue: int = FLAN_MAX_QUEUE,
+                 max_new_tokens: int = FLAN_MAX_NEW_TOKENS, deadline_seconds: float = FLAN_DEADLINE_SECONDS,
+                 prompt_cache_size: int = FLAN_PROMPT_CACHE_SIZE):
+        self._get_model = get_model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_new_tokens = max(1, min(max_new_tokens, FLAN_MAX_NEW_TOKENS_LIMIT))
+        self.deadline_seconds = deadline_seconds
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._prefix_ids: Dict[str, List[int]] = {}
+        self._body_ids: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._prompt_cache_size = max(0, prompt_cache_size)
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_seen = 0
+        self.tokens = 0
+        self.total_wait_seconds = 0.0
+        self.total_first_token_seconds = 0.0
+        self.first_tokens = 0
+        self.total_generate_seconds = 0.0
+        self.prompt_cache_hits = 0
+        self.finish_reasons: Dict[str, int] = {}
+        self.errors = 0
+        self.rejected = 0
+
+    # --- Caller side ---
+
+    async def stream(self, body: str, prefix: str = REPHRASE_INSTRUCTION, max_new_tokens: int = None,
+                     deadline_seconds: float = None) -> AsyncIterator[str]:
+        """
+        Yields the reply to prefix + body in chunks of whole words as they are generated.
+        Raises GenerationDeadlineExceeded (after the chunks produced in time) when the deadline
+        passes, and ExecutorSaturated if the queue is full.
+        """
+        request = self._submit(body, prefix, max_new_tokens, deadline_seconds)
+        try:
+            while True:
+                remaining = request.deadline - time.perf_counter()
+                try:
+                    # A little grace: normally the generator thread enforces the deadline itself
+                    kind, value = await asyncio.wait_for(request.events.get(), timeout=max(remaining, 0) + 0.5)
+                except asyncio.TimeoutError:
+                    raise GenerationDeadlineExceeded(request.text[:request.sent])
+                if kind == "text":
+                    yield value
+                elif kind == "error":
+                    raise value
+                elif value == "deadline":
+                    raise GenerationDeadlineExceeded(request.text)
+                else:
+                    return
+        finally:
+            if request.finish_reason is None:
+                request.cancelled = True
+
+    async def generate(self, body: str, prefix: str = REPHRASE_INSTRUCTION, max_new_tokens: int = None,
+                       deadline_seconds: float = None) -> str:
+        """The complete reply to prefix + body (see stream())."""
+        return "".join([chunk async for chunk in self.stream(body, prefix, max_new_tokens, deadline_seconds)])
+
+    def _submit(self, body, prefix, max_new_tokens, deadline_seconds) -> _GenerationRequest:
+        max_new_tokens = self.max_new_tokens if max_new_tokens is None else max_new_tokens
+        request = _GenerationRequest(
+            prefix, body,
+            max(1, min(max_new_tokens, FLAN_MAX_NEW_TOKENS_LIMIT)),
+            self.deadline_seconds if deadline_seconds is None else deadline_seconds,
+            asyncio.get_running_loop(),
+        )
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise ExecutorSaturated("generation")
+        with self._stats_lock:
+            self.requests += 1
+        return request
+
+    # --- Generator thread ---
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="flan-generator", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._generate_batch(batch)
+            except Exception:
+                logger.exception("FLAN-T5 batch failed")
+
+    def _prompt_ids(self, tokenizer, request: _GenerationRequest) -> List[int]:
+        prefix_ids = self._prefix_ids.get(request.prefix)
+        if prefix_ids is None:
+            prefix_ids = self._prefix_ids[request.prefix] = tokenizer(request.prefix, add_special_tokens=False).input_ids
+        body_ids = self._body_ids.get(request.body)
+        if body_ids is None:
+            body_ids = tokenizer(request.body).input_ids  # ends with </s>
+            if self._prompt_cache_size:
+                self._body_ids[request.body] = body_ids
+                if len(self._body_ids) > self._prompt_cache_size:
+                    self._body_ids.popitem(last=False)
+        else:
+            self._body_ids.move_to_end(request.body)
+            with self._stats_lock:
+                self.prompt_cache_hits += 1
+        ids = prefix_ids + body_ids
+        limit = tokenizer.model_max_length
+        return ids if len(ids) <= limit else ids[:limit - 1] + [tokenizer.eos_token_id]
+
+    def _generate_batch(self, batch: List[_GenerationRequest]):
+        try:
+            import torch
+            from transformers import StoppingCriteriaList
+
+            flan = self._get_model()
+        except Exception as e:
+            logger.exception("FLAN-T5 could not be loaded")
+            with self._stats_lock:
+                self.errors += 1
+            for request in batch:
+                self._fail(request, e)
+            return
+        tokenizer = flan.tokenizer
+
+        # Requests whose caller left or whose time ran out while queued are not generated
+        started = time.perf_counter()
+        live = []
+        for request in batch:
+            if request.cancelled:
+                self._finish(request, "cancelled", tokenizer)
+            elif started >= request.deadline:
+                self._finish(request, "deadline", tokenizer)
+            else:
+                live.append(request)
+        if not live:
+            return
+
+        prompts = [self._prompt_ids(tokenizer, request) for request in live]
+        width = max(len(ids) for ids in prompts)
+        input_ids = torch.full((len(live), width), tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(live), width), dtype=torch.long)
+        for row, ids in enumerate(prompts):
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, :len(ids)] = 1
+
+        try:
+            with torch.inference_mode():
+                flan.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    max_new_tokens=max(request.max_new_tokens for request in live),
+                    streamer=_BatchStreamer(self, live, tokenizer),
+                    stopping_criteria=StoppingCriteriaList([_StopRows(self, live, tokenizer)]),
+                    **flan.generation_kwargs,
+                )
+        except Exception as e:
+            logger.exception("FLAN-T5 generate() failed")
+            with self._stats_lock:
+                self.errors += 1
+            for request in live:
+                self._fail(request, e)
+        else:
+            # Rows still open ran into the batch-wide token limit
+            for request in live:
+                self._finish(request, "length", tokenizer)
+        finished = time.perf_counter()
+
+        with self._stats_lock:
+            self.batches += 1
+            self.rows += len(live)
+            self.max_batch_seen = max(self.max_batch_seen, len(live))
+            self.tokens += sum(len(request.token_ids) for request in live)
+            self.total_wait_seconds += sum(started - request.enqueued_at for request in live)
+            self.total_generate_seconds += finished - started
+
+    def _finish(self, request: _GenerationRequest, reason: str, tokenizer):
+        if request.finish_reason is not None:
+            return
+        request.finish_reason = reason
+        if reason != "cancelled":
+            if request.token_ids:
+                request.text = tokenizer.decode(request.token_ids, skip_special_tokens=True)
+            if len(request.text) > request.sent:
+                request.post("text", request.text[request.sent:])
+                request.sent = len(request.text)
+            request.post("end", reason)
+        with self._stats_lock:
+            self.finish_reasons[reason] = self.finish_reasons.get(reason, 0) + 1
+
+    def _fail(self, request: _GenerationRequest, error: Exception):
+        if request.finish_reason is not None:
+            return
+        request.finish_reason = "error"
+        request.post("error", error)
+        with self._stats_lock:
+            self.finish_reasons["error"] = self.finish_reasons.get("error", 0) + 1
+
+    def _observe_first_token(self, seconds: float):
+        with self._stats_lock:
+            self.first_tokens += 1
+            self.total_first_token_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = {
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": self.rows / self.batches if self.batches else 0.0,
+                "max_batch_size_seen": self.max_batch_seen,
+                "queue_depth": self._queue.qsize(),
+                "tokens": self.tokens,
+                "tokens_per_second": self.tokens / self.total_generate_seconds if self.total_generate_seconds else 0.0,
+                "avg_wait_ms": 1000.0 * self.total_wait_seconds / self.rows if self.rows else 0.0,
+                "avg_first_token_ms": (
+                    1000.0 * self.total_first_token_seconds / self.first_tokens if self.first_tokens else 0.0
+                ),
+                "avg_batch_ms": 1000.0 * self.total_generate_seconds / self.batches if self.batches else 0.0,
+                "prompt_cache_hits": self.prompt_cache_hits,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "max_new_tokens": self.max_new_tokens,
+                "deadline_seconds": self.deadline_seconds,
+            }
+            # finished_eos, finished_length, finished_deadline, finished_cancelled, finished_error
+            stats.update({f"finished_{reason}": count for reason, count in self.finish_reasons.items()})
+            return stats
+
+
+# Shared per-process FLAN-T5 generation service
+flan_generator = FlanGenerator()
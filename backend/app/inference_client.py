@@ -0,0 +1,293 @@
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import numpy as np
+
+from .executors import ExecutorSaturated
+from .flan_generator import REPHRASE_INSTRUCTION, GenerationDeadlineExceeded, flan_generator
+from .routers.llm_models import model_registry
+
+logger = logging.getLogger(__name__)
+
+# --- Inference Server (from Environment Variables) ---
+# Unix socket of the inference server (app/inference_server.py). When set, web workers load no
+# models: embed, generate and rank calls go to the server, which batches them across workers.
+INFERENCE_SERVER_SOCKET = os.getenv("INFERENCE_SERVER_SOCKET", "")
+# Seconds to wait for a non-streaming reply from the server
+INFERENCE_CLIENT_TIMEOUT = float(os.getenv("INFERENCE_CLIENT_TIMEOUT", 30))
+
+# Frames are a 4-byte big-endian length followed by that many bytes of UTF-8 JSON
+_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+class InferenceServerUnavailable(Exception):
+    """The inference server could not be reached or dropped the connection (answered with a 503)."""
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {length} bytes exceeds the limit")
+    return json.loads(await reader.readexactly(length))
+
+
+def pack_vectors(vectors: np.ndarray) -> Dict[str, Any]:
+    """float32 matrix -> JSON-safe dict (base64 of the raw little-endian bytes, exact and compact)."""
+    matrix = np.ascontiguousarray(vectors, dtype="<f4")
+    return {"shape": list(matrix.shape), "data": base64.b64encode(matrix.tobytes()).decode("ascii")}
+
+
+def unpack_vectors(packed: Dict[str, Any]) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(packed["data"]), dtype="<f4").reshape(packed["shape"]).astype(np.float32)
+
+
+def _raise_for_error(error: Dict[str, Any], partial: str = ""):
+    kind = error.get("type")
+    if kind == "deadline":
+        raise GenerationDeadlineExceeded(partial)
+    if kind == "saturated":
+        raise ExecutorSaturated(error.get("name", "inference server"))
+    raise RuntimeError(f"Inference server error: {error.get('message', kind)}")
+
+
+class InferenceClient:
+    """
+    Connection of one web worker to the inference server.
+
+    Async callers share a single multiplexed connection per event loop: requests carry an id,
+    and a reader task routes each response frame (or stream of frames) to its caller. Code on
+    worker threads uses request_blocking(), which opens a short-lived connection per call.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = INFERENCE_CLIENT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._loop = None
+        self._pending: Dict[int, asyncio.Queue] = {}
+        self._connect_lock: Optional[asyncio.Lock] = None
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.connects = 0
+        self.errors = 0
+
+    # --- Async, multiplexed ---
+
+    async def _connection(self) -> asyncio.StreamWriter:
+        loop = asyncio.get_running_loop()
+        if self._writer is not None and self._loop is loop and not self._writer.is_closing():
+            return self._writer
+        if self._connect_lock is None or self._loop is not loop:
+            self._connect_lock, self._loop, self._writer = asyncio.Lock(), loop, None
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                try:
+                    reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+                except OSError as e:
+                    with self._stats_lock:
+                        self.errors += 1
+                    raise InferenceServerUnavailable(f"Inference server unavailable: {e}") from e
+                with self._stats_lock:
+                    self.connects += 1
+                loop.create_task(self._read_loop(reader))
+        return self._writer
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                message = await read_frame(reader)
+                queue = self._pending.get(message.get("id"))
+                if queue is not None:
+                    queue.put_nowait(message)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            logger.warning("Inference server connection lost: %s", e)
+        finally:
+            self._writer = None
+            for queue in self._pending.values():
+                queue.put_nowait({"error": {"type": "unavailable"}})
+
+    async def _send(self, message: Dict[str, Any]):
+        writer = await self._connection()
+        request_id = next(self._ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[request_id] = queue
+        try:
+            writer.write(encode_frame({"id": request_id, **message}))
+            await writer.drain()
+        except ConnectionError as e:
+            self._pending.pop(request_id, None)
+            raise InferenceServerUnavailable(f"Inference server connection lost: {e}") from e
+        with self._stats_lock:
+            self.requests += 1
+        return request_id, queue
+
+    async def _next(self, queue: asyncio.Queue, timeout: float) -> Dict[str, Any]:
+        try:
+            message = await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise InferenceServerUnavailable("Inference server did not answer in time")
+        error = message.get("error")
+        if error is not None and error.get("type") == "unavailable":
+            with self._stats_lock:
+                self.errors += 1
+            raise InferenceServerUnavailable("Inference server connection lost")
+        return message
+
+    async def request(self, op: str, **payload) -> Any:
+        """Sends one request and returns its result."""
+        request_id, queue = await self._send({"op": op, **payload})
+        try:
+            message = await self._next(queue, self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+        if "error" in message:
+            _raise_for_error(message["error"])
+        return message.get("result")
+
+    async def stream(self, op: str, timeout: float, **payload) -> AsyncIterator[str]:
+        """Sends one request and yields the chunks it streams back; `timeout` bounds the whole stream."""
+        request_id, queue = await self._send({"op": op, **payload})
+        parts: List[str] = []
+        deadline = time.monotonic() + timeout
+        finished = False
+        try:
+            while True:
+                message = await self._next(queue, max(0.0, deadline - time.monotonic()))
+                if "chunk" in message:
+                    parts.append(message["chunk"])
+                    yield message["chunk"]
+                    continue
+                finished = True
+                if "error" in message:
+                    _raise_for_error(message["error"], "".join(parts))
+                return
+        except InferenceServerUnavailable:
+            if parts:
+                # Part of the reply was already produced: report it like any other cut-off
+                raise GenerationDeadlineExceeded("".join(parts))
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+            if not finished and self._writer is not None and not self._writer.is_closing():
+                # Caller went away (or timed out): let the server stop generating
+                self._writer.write(encode_frame({"id": request_id, "op": "cancel"}))
+
+    # --- Blocking, one connection per call ---
+
+    def request_blocking(self, op: str, **payload) -> Any:
+        """request() for code running on worker threads."""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(encode_frame({"id": 0, "op": op, **payload}))
+                (length,) = _HEADER.unpack(self._recv_exactly(sock, _HEADER.size))
+                message = json.loads(self._recv_exactly(sock, length))
+        except OSError as e:
+            with self._stats_lock:
+                self.errors += 1
+            raise InferenceServerUnavailable(f"Inference server unavailable: {e}") from e
+        with self._stats_lock:
+            self.requests += 1
+        if "error" in message:
+            _raise_for_error(message["error"])
+        return message.get("result")
+
+    @staticmethod
+    def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+        chunks, remaining = [], n
+        while remaining:
+            chunk = sock.recv(remaining)
+            if not chunk:
+                raise ConnectionError("Inference server closed the connection")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "connects": self.connects,
+                "errors": self.errors,
+                "in_flight": len(self._pending),
+            }
+
+
+class RemoteEmbedder:
+    """Stands in for the embedder in a web worker: encode() is computed by the inference server."""
+
+    # Registry footprint: there are no weights in this process
+    nbytes = 0
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **_) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = unpack_vectors(self.client.request_blocking("embed", texts=texts))
+        return vectors[0] if single else vectors
+
+
+class RemoteGenerator:
+    """The FlanGenerator interface (stream / generate / stats) served by the inference server."""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+
+    async def stream(self, body: str, prefix: str = REPHRASE_INSTRUCTION, max_new_tokens: int = None,
+                     deadline_seconds: float = None) -> AsyncIterator[str]:
+        deadline = flan_generator.deadline_seconds if deadline_seconds is None else deadline_seconds
+        # The server enforces the deadline; the extra second only covers the trip back
+        async for chunk in self.client.stream("generate", deadline + 1.0, body=body, prefix=prefix,
+                                              max_new_tokens=max_new_tokens, deadline_seconds=deadline):
+            yield chunk
+
+    async def generate(self, body: str, prefix: str = REPHRASE_INSTRUCTION, max_new_tokens: int = None,
+                       deadline_seconds: float = None) -> str:
+        return "".join([chunk async for chunk in self.stream(body, prefix, max_new_tokens, deadline_seconds)])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"remote": True, **self.client.stats()}
+
+
+# Set by use_inference_server(); None means this process runs its own models
+inference_client: Optional[InferenceClient] = None
+_remote_generator: Optional[RemoteGenerator] = None
+
+
+def use_inference_server(socket_path: str = INFERENCE_SERVER_SOCKET):
+    """
+    Routes this process's model calls to the inference server at `socket_path` (called by the web app
+    at import when INFERENCE_SERVER_SOCKET is set). The embedder keeps its model id, so both sides must
+    share the EMBEDDER_* settings for stored disease vectors to match.
+    """
+    global inference_client, _remote_generator
+    inference_client = InferenceClient(socket_path)
+    _remote_generator = RemoteGenerator(inference_client)
+    model_registry.register(
+        "embedder", lambda: RemoteEmbedder(inference_client), model_id=model_registry.model_id("embedder")
+    )
+
+
+def generation_service():
+    """The generator chat handlers should use: the inference server's, or this process's flan_generator."""
+    return _remote_generator or flan_generator
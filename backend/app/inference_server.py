@@ -0,0 +1,171 @@
+"""
+Inference server: one process that owns the models and serves every web worker.
+
+    python -m app.inference_server --socket /tmp/healthmate-inference.sock
+    INFERENCE_SERVER_SOCKET=/tmp/healthmate-inference.sock uvicorn app.main:app --workers 4
+
+Web workers started with INFERENCE_SERVER_SOCKET load no models; they send embed, generate and
+rank requests over the Unix socket (see app/inference_client.py). Here those requests go through
+the same encode batcher and FLAN-T5 generation service a standalone process uses, so concurrent
+requests from all workers are batched together.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from typing import Any, Dict
+
+from .disease_ranker import disease_ranker
+from .encode_batcher import encode_batcher
+from .executors import ExecutorSaturated, executor_stats, inference_executor
+from .flan_generator import REPHRASE_INSTRUCTION, GenerationDeadlineExceeded, flan_generator
+from .inference_client import INFERENCE_SERVER_SOCKET, encode_frame, pack_vectors, read_frame
+from .knowledge_base import start_change_listener, warm_disease_index, warm_knowledge_base
+from .logging_config import configure_logging
+from .routers.llm_models import get_embedder, model_registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/healthmate-inference.sock"
+
+
+def _error(kind: str, exc: Exception = None, **extra) -> Dict[str, Any]:
+    return {"type": kind, "message": str(exc) if exc else kind, **extra}
+
+
+class _Connection:
+    """One web worker's connection: requests are handled concurrently and answered by id."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.tasks: Dict[Any, asyncio.Task] = {}
+        self._write_lock = asyncio.Lock()
+
+    async def send(self, message: Dict[str, Any]):
+        async with self._write_lock:
+            self.writer.write(encode_frame(message))
+            await self.writer.drain()
+
+    async def serve(self):
+        try:
+            while True:
+                message = await read_frame(self.reader)
+                request_id = message.get("id")
+                if message.get("op") == "cancel":
+                    task = self.tasks.pop(request_id, None)
+                    if task is not None:
+                        task.cancel()
+                    continue
+                task = asyncio.create_task(self._handle(request_id, message))
+                self.tasks[request_id] = task
+                task.add_done_callback(lambda _, rid=request_id: self.tasks.pop(rid, None))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in list(self.tasks.values()):
+                task.cancel()
+            self.writer.close()
+
+    async def _handle(self, request_id, message: Dict[str, Any]):
+        op = message.get("op")
+        try:
+            if op == "generate":
+                await self._generate(request_id, message)
+                return
+            handler = _HANDLERS.get(op)
+            if handler is None:
+                raise ValueError(f"Unknown op {op!r}")
+            await self.send({"id": request_id, "result": await handler(message)})
+        except asyncio.CancelledError:
+            raise
+        except ExecutorSaturated as e:
+            await self.send({"id": request_id, "error": _error("saturated", e, name=e.name)})
+        except Exception as e:
+            logger.exception("Inference request %r failed", op)
+            await self.send({"id": request_id, "error": _error("internal", e)})
+
+    async def _generate(self, request_id, message: Dict[str, Any]):
+        try:
+            async for chunk in flan_generator.stream(
+                message["body"],
+                prefix=message.get("prefix") or REPHRASE_INSTRUCTION,
+                max_new_tokens=message.get("max_new_tokens"),
+                deadline_seconds=message.get("deadline_seconds"),
+            ):
+                await self.send({"id": request_id, "chunk": chunk})
+        except GenerationDeadlineExceeded as e:
+            await self.send({"id": request_id, "error": _error("deadline", e)})
+            return
+        await self.send({"id": request_id, "done": True})
+
+
+# --- Operations ---
+
+async def _embed(message):
+    """{"texts": [...]} -> packed (n, dim) float32 matrix. Short lists join the shared encode batches."""
+    texts = message["texts"]
+    if len(texts) > encode_batcher.max_batch_size:
+        # Already a batch (e.g. re-embedding the catalogue): encode it as is
+        return pack_vectors(await inference_executor.run(get_embedder().encode, texts))
+    vectors = await asyncio.gather(*(encode_batcher.encode(text) for text in texts))
+    return pack_vectors(vectors)
+
+
+async def _rank(message):
+    """{"question", "k"?} -> RankResult.as_payload(): the question is encoded and fused with keyword votes here."""
+    question = message["question"]
+    vector = await encode_batcher.encode(question)
+    ranking = await inference_executor.run(disease_ranker.rank, question, vector, message.get("k"))
+    return ranking.as_payload()
+
+
+async def _stats(message):
+    return {
+        "encode": encode_batcher.stats(),
+        "generation": flan_generator.stats(),
+        "models": model_registry.status(),
+        "executors": executor_stats(),
+    }
+
+
+async def _ping(message):
+    return {"pid": os.getpid()}
+
+
+_HANDLERS = {"embed": _embed, "rank": _rank, "stats": _stats, "ping": _ping}
+
+
+async def serve(socket_path: str):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # left over from a previous run
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: _Connection(reader, writer).serve(), path=socket_path
+    )
+    os.chmod(socket_path, 0o660)
+    logger.info("Inference server listening on %s (pid %d)", socket_path, os.getpid())
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=INFERENCE_SERVER_SOCKET or DEFAULT_SOCKET, help="Unix socket to listen on")
+    parser.add_argument("--preload", default="embedder", help="Comma-separated models to load before serving")
+    args = parser.parse_args()
+
+    configure_logging()
+    # Ranking needs the knowledge base; keep it current like the web app does
+    warm_knowledge_base()
+    start_change_listener()
+    preload = [m.strip() for m in args.preload.split(",") if m.strip()]
+    for name in preload:
+        model_registry.get(name)
+    if "embedder" in preload:
+        warm_disease_index()
+    asyncio.run(serve(args.socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from .encode_batcher import encode_batcher
+from .executors import inference_executor
+from .knowledge_base import knowledge_base
+from .response_cache import TTLCache, normalize_message
+from .routers.llm_models import get_embedder
+from .symptom_matcher import symptom_matcher
+
+logger = logging.getLogger(__name__)
+
+# --- Intent Routing (from Environment Variables) ---
+# Classify messages the rules leave undecided with an embedding nearest-centroid classifier
+# (costs one encode per new message); when off, they count as off-topic
+INTENT_CLASSIFIER = os.getenv("INTENT_CLASSIFIER", "false").lower() in ("1", "true", "yes")
+# Minimum cosine similarity to the nearest intent centroid; below it the message counts as off-topic
+INTENT_MIN_SIMILARITY = float(os.getenv("INTENT_MIN_SIMILARITY", 0.45))
+# Routed intents cached per normalized message
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", 4096))
+INTENT_CACHE_TTL_SECONDS = float(os.getenv("INTENT_CACHE_TTL_SECONDS", 3600))
+
+GREETING = "greeting"
+THANKS = "thanks"
+AFFIRMATION = "affirmation"
+OFF_TOPIC = "off_topic"
+# Everything else: a health question for disease retrieval
+SYMPTOMS = "symptoms"
+
+# Whole-message rules, tried against the normalized text (lowercase, trimmed punctuation)
+_RULES = (
+    (GREETING, re.compile(r"^(?:hi|hello|hey|hiya|good (?:morning|afternoon|evening))(?: there)?$")),
+    (THANKS, re.compile(r"^(?:thanks|thank you|thx|ty|cheers)(?: (?:so much|a lot|very much))?$")),
+    (AFFIRMATION, re.compile(r"^(?:yes|sure|okay|ok|please|go ahead|yep|yeah)$")),
+)
+# Health vocabulary beyond the symptom keywords of the knowledge base; stems match word prefixes.
+# Vague ways of feeling unwell count too: their reply is the knowledge base's general advice.
+_HEALTH_WORDS = re.compile(
+    r"\b(?:ill|sick|flu|cold|sore|runny|rash|itchy|unwell|head(?:ache|aches)?|"
+    r"(?:pain|ache|hurt|fever|throat|symptom|cough|temperature|nause|stomach|vomit|tired|fatigue|diarrh"
+    r"|infect|dizz|migraine|breath|chest|allerg|sneez|congest|cramp|swell|swollen|bleed)\w*)\b"
+    r"|(?:\bnot|n'?t) feel(?:ing)? (?:well|good|great|right|myself)\b"
+    r"|\bfeel(?:s|ing)? (?:bad|awful|terrible|rough|poorly|off|weak|faint|under the weather)\b"
+)
+
+# Example messages per intent; their normalized mean embeddings are the classifier's centroids
+INTENT_EXEMPLARS = {
+    GREETING: ["hi there, how are you", "hello assistant", "hey, good to see you", "good evening doc"],
+    THANKS: ["thanks for your help", "thank you, that was useful", "great, appreciate it", "that helped, thanks"],
+    SYMPTOMS: [
+        "I feel dizzy when I stand up", "my back is killing me", "I can't stop coughing at night",
+        "my child has a high temperature", "I have been throwing up since yesterday", "my joints hurt",
+        "I feel weak and short of breath", "there is a red rash on my arm",
+    ],
+    OFF_TOPIC: [
+        "what is the weather like today", "tell me a joke", "who won the game last night",
+        "write me a poem", "what is the capital of france", "how do I cook pasta",
+    ],
+}
+
+
+class IntentRouter:
+    """
+    Decides what a chat message is before any retrieval or generation runs.
+
+    Precompiled whole-message rules catch greetings, thanks and affirmations; a symptom keyword
+    (the knowledge base's symptom matcher) or a health word makes it a symptom report. Messages
+    neither tier decides go to the optional embedding nearest-centroid classifier, else count as
+    off-topic. Results are cached by normalized text.
+    """
+
+    def __init__(self, use_classifier: bool = INTENT_CLASSIFIER, min_similarity: float = INTENT_MIN_SIMILARITY,
+                 exemplars: Dict[str, list] = None, cache: TTLCache = None):
+        self.use_classifier = use_classifier
+        self.min_similarity = min_similarity
+        self.exemplars = exemplars or INTENT_EXEMPLARS
+        self.cache = cache or TTLCache(INTENT_CACHE_SIZE, INTENT_CACHE_TTL_SECONDS)
+        self._centroids = None
+        self._centroid_lock = threading.Lock()
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def match_rules(self, message: str) -> Optional[str]:
+        """The intent the rules assign to `message` (normalized), or None if they cannot tell."""
+        for intent, pattern in _RULES:
+            if pattern.match(message):
+                return intent
+        if symptom_matcher.get().find_all(message) or _HEALTH_WORDS.search(message):
+            return SYMPTOMS
+        return None
+
+    def _build_centroids(self):
+        with self._centroid_lock:
+            if self._centroids is None:
+                intents = list(self.exemplars)
+                embedder = get_embedder()
+                centroids = np.stack([embedder.encode(self.exemplars[i]).mean(axis=0) for i in intents])
+                centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+                self._centroids = (intents, centroids.astype(np.float32))
+        return self._centroids
+
+    async def classify(self, message: str) -> str:
+        """Nearest intent centroid of `message` (normalized), or OFF_TOPIC below min_similarity."""
+        intents, centroids = self._centroids or await inference_executor.run(self._build_centroids)
+        vector = await encode_batcher.encode(message)
+        similarities = centroids @ (vector / (np.linalg.norm(vector) or 1.0))
+        best = int(np.argmax(similarities))
+        return intents[best] if similarities[best] >= self.min_similarity else OFF_TOPIC
+
+    async def route(self, message: str) -> str:
+        text = normalize_message(message)
+        key = (symptom_matcher.version, text)
+        intent = self.cache.get(key)
+        if intent is not None:
+            self._count("cache_hits")
+        else:
+            intent = self.match_rules(text)
+            if intent is not None:
+                self._count("rules")
+            elif self.use_classifier:
+                try:
+                    intent = await self.classify(text)
+                    self._count("classifier")
+                except Exception:
+                    # Never let the classifier cost a reply: route as the rules alone would
+                    logger.exception("Intent classifier failed")
+                    self._count("classifier_errors")
+                    return OFF_TOPIC
+            else:
+                intent = OFF_TOPIC
+                self._count("rules")
+            self.cache.set(key, intent)
+        self._count(f"routed_{intent}")
+        return intent
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            counts = dict(self.counts)
+        return {"classifier": self.use_classifier, **counts, "cache_size": self.cache.stats()["size"]}
+
+
+# --- Handlers: intents answered without retrieval or generation ---
+
+def _greeting_reply() -> str:
+    greeting_tmpl = knowledge_base.get().first_template("greeting")
+    return greeting_tmpl.render() if greeting_tmpl else "Hello! I'm your health assistant. How can I help you today?"
+
+
+def _thanks_reply() -> str:
+    return "You're welcome! Let me know if there's anything else about your health I can help with."
+
+
+def _off_topic_reply() -> str:
+    return "I'm here to help only with your health or wellness questions. Please describe your symptoms."
+
+
+INTENT_HANDLERS: Dict[str, Callable[[], str]] = {
+    GREETING: _greeting_reply,
+    THANKS: _thanks_reply,
+    OFF_TOPIC: _off_topic_reply,
+}
+
+
+# Shared per-process router
+intent_router = IntentRouter()
@@ -0,0 +1,353 @@
+import logging
+import os
+import random
+import re
+import select
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from .database import DATABASE_URL, engine
+from .disease_index import disease_index
+from .disease_scoring import symptom_disease_matrix
+from .snapshot import RefreshingSnapshot
+from .symptom_matcher import symptom_matcher
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel the knowledge-base tables notify on when they change (the one database/triggers.sql uses)
+KB_NOTIFY_CHANNEL = os.getenv("KB_NOTIFY_CHANNEL", "kb_changed")
+# Listen for change notifications (Postgres only); polling still runs as a safety net
+KB_LISTEN = os.getenv("KB_LISTEN", "true").lower() in ("1", "true", "yes")
+# A reseed fires one notification per statement; wait this long for the burst to end before refreshing
+KB_NOTIFY_DEBOUNCE_SECONDS = float(os.getenv("KB_NOTIFY_DEBOUNCE_SECONDS", 0.5))
+# Seed of the RNG that picks templates and advice; set it to make replies reproducible (e.g. in tests)
+KB_RANDOM_SEED = os.getenv("KB_RANDOM_SEED")
+
+GENERAL_UNWELL_DISEASE = "General Unwell Feeling"
+
+
+# Shared RNG for every random template/advice pick
+rng = random.Random(int(KB_RANDOM_SEED) if KB_RANDOM_SEED is not None else None)
+
+
+def seed_random(seed):
+    """Reseeds the template/advice RNG so the following picks are reproducible."""
+    rng.seed(seed)
+
+
+_PLACEHOLDER = re.compile(r"\{(disease_name|disease_desc|advice)\}")
+
+
+class CompiledTemplate:
+    """
+    A template text split once into literal parts and placeholders
+    ({disease_name}, {disease_desc}, {advice}), so rendering is a single join.
+    Other braces are kept verbatim, as the str.replace() chain this replaces did.
+    """
+
+    __slots__ = ("text", "disease_id", "_parts")
+
+    def __init__(self, text: str, disease_id: Optional[int] = None):
+        self.text = text
+        self.disease_id = disease_id
+        parts = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(text):
+            parts.append((False, text[position:match.start()]))
+            parts.append((True, match.group(1)))
+            position = match.end()
+        parts.append((False, text[position:]))
+        self._parts = tuple(p for p in parts if p[0] or p[1])
+
+    def has_placeholder(self, name: str) -> bool:
+        return any(is_placeholder and part == name for is_placeholder, part in self._parts)
+
+    def render(self, **values) -> str:
+        """Fills the placeholders; any not given in `values` are left as written."""
+        return "".join(
+            str(values.get(part, "{%s}" % part)) if is_placeholder else part
+            for is_placeholder, part in self._parts
+        )
+
+    def __repr__(self):
+        return f"CompiledTemplate({self.text!r})"
+
+
+def _is_generic_advice(advice: str) -> bool:
+    # Same filter as the SQL `text NOT LIKE '%consult%' AND text NOT LIKE '%doctor%'` it replaces
+    return "consult" in advice or "doctor" in advice
+
+
+class KnowledgeBase:
+    """
+    Immutable in-memory copy of the medical reference tables (diseases, suggestions, templates).
+
+    Chat turns read diseases, suggestions and templates from here instead of issuing queries.
+    Rows keep the shapes the SQL queries returned, e.g. diseases are (id, name, description).
+    Templates are compiled and grouped into per-type and per-disease pools up front, so a
+    random pick is one rng.choice() over a ready tuple.
+    """
+
+    __slots__ = (
+        "version", "diseases", "disease_ids", "_diseases_by_name", "_suggestions", "_suggestions_by_id",
+        "_suggestion_ids",
+        "general_advice", "_specific_general_advice", "_templates_by_type", "_disease_template_pools",
+    )
+
+    def __init__(self, rows, version):
+        self.version = version
+        diseases: Dict[int, Tuple[int, str, str]] = {}
+        suggestions: List[Tuple[int, str, Optional[int], bool]] = []
+        templates: Dict[str, List[CompiledTemplate]] = {}
+        for row in rows:
+            kind = row[0]
+            if kind == "disease":
+                diseases[row[1]] = (row[1], row[2], row[3])
+            elif kind == "suggestion":
+                suggestions.append((row[1], row[2], row[3], bool(row[4])))
+            elif kind == "template" and row[5]:
+                templates.setdefault(row[2], []).append(CompiledTemplate(row[3], row[4]))
+
+        self.diseases = diseases
+        # Sorted ids; the row order of per-disease score arrays (see disease_ranker)
+        self.disease_ids = np.array(sorted(diseases), dtype=np.int64)
+        self._diseases_by_name = {d[1].lower(): d for d in diseases.values()}
+        # Ordered by id, like the heap order the unsorted queries used to return
+        self._suggestions = tuple(suggestions)
+        self._suggestions_by_id = {s[0]: s[1] for s in suggestions}
+        self._suggestion_ids: Dict[str, int] = {}
+        for suggestion_id, advice, _, _ in suggestions:
+            self._suggestion_ids.setdefault(advice, suggestion_id)
+        self.general_advice = tuple(s[1] for s in suggestions if s[3])
+        self._specific_general_advice = tuple(s for s in self.general_advice if not _is_generic_advice(s))
+        self._templates_by_type = {k: tuple(v) for k, v in templates.items()}
+        # (template_type, disease_id) -> templates for that disease or for any disease (disease_id NULL);
+        # (template_type, None) holds the any-disease ones alone
+        pools: Dict[Tuple[str, Optional[int]], Tuple[CompiledTemplate, ...]] = {}
+        for template_type, pool in self._templates_by_type.items():
+            pools[(template_type, None)] = tuple(t for t in pool if t.disease_id is None)
+            for disease_id in diseases:
+                pools[(template_type, disease_id)] = tuple(t for t in pool if t.disease_id in (None, disease_id))
+        self._disease_template_pools = pools
+
+    # --- Diseases ---
+
+    def disease(self, disease_id: int) -> Optional[Tuple[int, str, str]]:
+        return self.diseases.get(disease_id)
+
+    def disease_named(self, name: str) -> Optional[Tuple[int, str, str]]:
+        """Exact, case-insensitive name lookup."""
+        return self._diseases_by_name.get(name.lower())
+
+    def general_unwell(self) -> Optional[Tuple[int, str, str]]:
+        return self.disease_named(GENERAL_UNWELL_DISEASE)
+
+    # --- Suggestions ---
+
+    def suggestions_for(self, disease_id: int, limit: int = 5) -> List[str]:
+        """Suggestions of `disease_id` plus general advice, in id order (was `... OR is_general_advice LIMIT 5`)."""
+        matches = [s[1] for s in self._suggestions if s[2] == disease_id or s[3]]
+        return matches[:limit]
+
+    def suggestion(self, suggestion_id: int) -> Optional[str]:
+        return self._suggestions_by_id.get(suggestion_id)
+
+    def suggestion_id(self, advice: str) -> Optional[int]:
+        """Id of the (first) suggestion with this exact text."""
+        return self._suggestion_ids.get(advice)
+
+    def sample_general_advice(self, k: int, specific_only: bool = True) -> List[str]:
+        """
+        Up to `k` random general-advice suggestions.
+        :param specific_only: Skip "consult a doctor" style advice.
+        """
+        pool = self._specific_general_advice if specific_only else self.general_advice
+        return rng.sample(pool, min(k, len(pool)))
+
+    # --- Templates ---
+
+    def templates(self, template_type: str, disease_id: Optional[int] = None) -> Tuple[CompiledTemplate, ...]:
+        """
+        Active templates of a type, in id order.
+        :param disease_id: If given, only templates for this disease or for any disease (disease_id NULL).
+        """
+        if disease_id is None:
+            return self._templates_by_type.get(template_type, ())
+        pool = self._disease_template_pools.get((template_type, disease_id))
+        if pool is None:
+            # Unknown disease: only the templates written for any disease apply
+            pool = self._disease_template_pools.get((template_type, None), ())
+        return pool
+
+    def first_template(self, template_type: str) -> Optional[CompiledTemplate]:
+        templates = self.templates(template_type)
+        return templates[0] if templates else None
+
+    def random_template(self, template_type: str, disease_id: Optional[int] = None) -> Optional[CompiledTemplate]:
+        templates = self.templates(template_type, disease_id)
+        return rng.choice(templates) if templates else None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "diseases": len(self.diseases),
+            "suggestions": len(self._suggestions),
+            "general_advice": len(self.general_advice),
+            "templates": sum(len(t) for t in self._templates_by_type.values()),
+        }
+
+
+def _load_knowledge_base_rows(db):
+    # One tagged row list, so a single content hash covers all tables
+    rows = []
+    rows += [("disease",) + tuple(r) for r in db.execute(text(
+        "SELECT id, name, description FROM diseases ORDER BY id"
+    ))]
+    rows += [("suggestion",) + tuple(r) for r in db.execute(text(
+        "SELECT id, text, disease_id, is_general_advice FROM suggestions ORDER BY id"
+    ))]
+    rows += [("template",) + tuple(r) for r in db.execute(text(
+        "SELECT id, template_type, text, disease_id, is_active FROM templates ORDER BY id"
+    ))]
+    return rows
+
+
+# Shared per-process knowledge base. Built on first use, then refreshed on change notifications,
+# by the background poller, or through the admin refresh endpoint.
+knowledge_base = RefreshingSnapshot("knowledge base", _load_knowledge_base_rows, KnowledgeBase)
+
+# Every snapshot derived from the medical tables; refreshed together
+KB_SNAPSHOTS = (knowledge_base, symptom_matcher, symptom_disease_matrix, disease_index)
+
+
+def refresh_knowledge_base(force: bool = False) -> Dict[str, bool]:
+    """
+    Re-checks the knowledge-base snapshots built so far and rebuilds the ones whose tables changed.
+    Unbuilt ones are left to their first get(): a change must not load the embedder for the disease index.
+    :returns: {snapshot name: rebuilt}
+    """
+    return {snapshot.name: snapshot.refresh(force=force) for snapshot in KB_SNAPSHOTS if snapshot.built}
+
+
+def warm_knowledge_base():
+    """
+    Builds the DB-only snapshots at startup so the first chat turn doesn't pay for it.
+    The disease index also needs the embedder; see warm_disease_index.
+    """
+    for snapshot in (knowledge_base, symptom_matcher, symptom_disease_matrix):
+        _warm(snapshot)
+
+
+def warm_disease_index():
+    """
+    Builds the disease index at startup. Only worth it where the embedder is preloaded anyway;
+    otherwise the index is built (and the model loaded) by the first chat turn that ranks.
+    """
+    _warm(disease_index)
+
+
+def _warm(snapshot: RefreshingSnapshot):
+    try:
+        snapshot.get()
+    except Exception:
+        logger.exception("Could not load %s at startup; it will be built on first use", snapshot.name)
+
+
+def knowledge_base_status() -> Dict[str, Dict]:
+    status = {snapshot.name: {"version": snapshot.version} for snapshot in KB_SNAPSHOTS}
+    if knowledge_base.version is not None:
+        status[knowledge_base.name].update(knowledge_base.get().stats())
+    return status
+
+
+# --- Postgres change notifications ---
+
+# NOTIFY triggers on the knowledge-base tables (installed by initdb or scripts/install_kb_triggers.py)
+KB_TRIGGERS_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "triggers.sql")
+
+
+def install_change_triggers():
+    """
+    Runs database/triggers.sql (Postgres only, idempotent). A one-off admin step, never run by the
+    web workers: it needs to own the tables and takes exclusive locks on them.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    with open(KB_TRIGGERS_SQL) as f:
+        sql = f.read()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(sql)
+
+
+class ChangeListener:
+    """Background thread that LISTENs on KB_NOTIFY_CHANNEL and refreshes the snapshots on each burst."""
+
+    def __init__(self, channel: str = KB_NOTIFY_CHANNEL, debounce_seconds: float = KB_NOTIFY_DEBOUNCE_SECONDS):
+        self.channel = channel
+        self.debounce_seconds = debounce_seconds
+        self._thread = None
+        self.notifications = 0
+        self.refreshes = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="kb-listener", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # A dedicated connection outside the pool: LISTEN holds it for the life of the process
+        listen_engine = create_engine(DATABASE_URL, poolclass=NullPool)
+        while True:
+            try:
+                self._listen(listen_engine)
+            except Exception:
+                logger.exception("Knowledge-base change listener failed; reconnecting")
+                time.sleep(5)
+
+    def _listen(self, listen_engine):
+        raw = listen_engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+            logger.info("Listening for knowledge-base changes on channel %s", self.channel)
+            while True:
+                if not self._wait(conn, timeout=60):
+                    continue
+                # Drain the rest of the burst, then refresh once
+                while self._wait(conn, timeout=self.debounce_seconds):
+                    pass
+                tables = {n.payload for n in conn.notifies}
+                self.notifications += len(conn.notifies)
+                conn.notifies.clear()
+                logger.info("Knowledge-base tables changed: %s", ", ".join(sorted(tables)))
+                refresh_knowledge_base()
+                self.refreshes += 1
+        finally:
+            raw.close()
+
+    @staticmethod
+    def _wait(conn, timeout: float) -> bool:
+        """:returns: True if new notifications arrived within `timeout` seconds."""
+        if select.select([conn], [], [], timeout) == ([], [], []):
+            return False
+        conn.poll()
+        return bool(conn.notifies)
+
+
+change_listener = ChangeListener()
+
+
+def start_change_listener():
+    """
+    Starts listening for knowledge-base changes, when running on Postgres. The triggers that send
+    them come from database/triggers.sql; without them only the poller picks up changes.
+    """
+    if not KB_LISTEN or engine.dialect.name != "postgresql":
+        return
+    change_listener.start()
@@ -1,17 +1,35 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 import os
+import time
 
 from .database import create_db_tables, SessionLocal, engine
 from . import models 
 from . import auth
+from .admission import AdmissionRejected, admission
+from .encode_batcher import encode_batcher
+from .executors import ExecutorSaturated, executor_stats
+from .inference_client import INFERENCE_SERVER_SOCKET, InferenceServerUnavailable, generation_service, use_inference_server
+from .intent_router import intent_router
+from .knowledge_base import start_change_listener, warm_disease_index, warm_knowledge_base
+from .logging_config import configure_logging
+from .message_writer import message_writer
+from .metrics import REQUEST_SECONDS, registry
+from .response_cache import retrieval_cache
 
 from .routers import auth_router 
 from .routers import llm_router  
+from .routers.llm_models import PRELOAD_MODELS, model_registry, preload_models
+
+# Models live in a separate inference server process shared by all web workers (app/inference_server.py)
+if INFERENCE_SERVER_SOCKET:
+    use_inference_server(INFERENCE_SERVER_SOCKET)
 
 # Load environment variables
 load_dotenv()
+configure_logging()
 
 # Ensure database tables are created on startup (remains)
 # This uses models.Base.metadata.create_all(bind=engine)
@@ -34,10 +52,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency histogram, labeled by route template (not raw path) to keep cardinality bounded
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status_code,
+        )
+
+# Existing component stats, exported as gauges on /metrics
+registry.register_stats("healthmate_executor", "Bounded executor state.", executor_stats)
+registry.register_stats("healthmate_admission", "Admission control state of the inference endpoints.", admission.stats)
+registry.register_stats("healthmate_embed_batch", "Encode micro-batching state.", encode_batcher.stats)
+registry.register_stats("healthmate_retrieval_cache", "Disease retrieval cache state.", retrieval_cache.stats)
+registry.register_stats("healthmate_generation", "FLAN-T5 generation batching state.", lambda: generation_service().stats())
+registry.register_stats("healthmate_intent", "Intent routing counts by tier and intent.", intent_router.stats)
+registry.register_stats("healthmate_model", "Local model registry state.", model_registry.status)
+registry.register_stats("healthmate_chat_writer", "Chat message persistence state.", message_writer.stats)
+registry.register_stats("healthmate_auth_cache", "Token and principal cache state of get_current_user.", auth.auth_cache_stats)
+
+# A saturated executor means "busy, come back shortly" rather than a server error
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# Rate limited (429) or over a concurrency cap (503), rejected before any work was done
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# Same for a missing inference server: it is usually restarting
+@app.exception_handler(InferenceServerUnavailable)
+async def inference_server_unavailable_handler(request: Request, exc: InferenceServerUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
 # Startup event for database table creation (remains)
 @app.on_event("startup")
 def on_startup():
     create_db_tables()
+    # Chat turns read the medical tables from memory; load them now and follow changes via NOTIFY
+    warm_knowledge_base()
+    start_change_listener()
+    # Models are otherwise loaded lazily by the first request that needs them (by the inference server, if used)
+    if not INFERENCE_SERVER_SOCKET:
+        preload_models()
+        # With the embedder already loaded, embedding the disease catalogue is cheap to do now
+        if "embedder" in PRELOAD_MODELS:
+            warm_disease_index()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Write-behind mode: commit whatever is still queued before the process exits
+    message_writer.close()
 
 # Root and health check endpoints (good to keep in main.py for core app status)
 @app.get("/")
@@ -48,6 +132,11 @@ async def read_root():
 async def health_check():
     return {"status": "ok", "message": "Backend is healthy and running."}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of latency histograms, counters and component gauges."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # --- Include Routers ---
 # All endpoints defined in auth_router.py will be available under /auth/
 app.include_router(auth_router.router)
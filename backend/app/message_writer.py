@@ -0,0 +1,299 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select, text
+
+from . import models
+from .database import engine
+from .executors import db_executor
+from .metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# --- Chat Persistence (from Environment Variables) ---
+# "sync": both messages of a turn are inserted in one transaction before the reply is returned.
+# "write_behind": they are queued and a background thread inserts them in multi-row batches;
+#   queued messages are lost if the process dies before a flush (a clean shutdown drains the queue).
+CHAT_PERSISTENCE_MODE = os.getenv("CHAT_PERSISTENCE_MODE", "sync").lower()
+# A write-behind flush happens once this many messages are queued...
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", 100))
+# ...or this long after the oldest queued message arrived
+CHAT_WRITE_FLUSH_MS = float(os.getenv("CHAT_WRITE_FLUSH_MS", 50))
+# When this many messages are queued, new ones are written synchronously instead (backpressure, never dropped)
+CHAT_WRITE_MAX_QUEUE = int(os.getenv("CHAT_WRITE_MAX_QUEUE", 10000))
+# Message ids reserved from the sequence per round trip
+CHAT_ID_BLOCK_SIZE = int(os.getenv("CHAT_ID_BLOCK_SIZE", 100))
+# Attempts of a failed background flush before its batch is logged and dropped
+CHAT_WRITE_MAX_ATTEMPTS = int(os.getenv("CHAT_WRITE_MAX_ATTEMPTS", 3))
+
+_MESSAGE_COLUMNS = ("id", "user_id", "role", "content", "extracted_symptoms", "recommendations", "timestamp")
+
+
+class MessageIdAllocator:
+    """
+    Hands out chat_messages ids before the rows are inserted, reserving them in blocks.
+
+    On Postgres ids come from the table's own sequence (nextval), so they never collide with
+    rows inserted elsewhere. Other databases (the SQLite dev setup) continue from MAX(id) and a
+    counter shared by every allocator of the process, which is only safe with a single writer process.
+    """
+
+    # Next id for databases without a sequence, shared so that two allocators never reserve the same block
+    _next_local_id: Optional[int] = None
+    _local_lock = threading.Lock()
+
+    def __init__(self, block_size: int = CHAT_ID_BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        self._ids: deque = deque()
+        self._lock = threading.Lock()
+        self.reservations = 0
+
+    def take(self, n: int) -> Optional[List[int]]:
+        """:returns: n already-reserved ids, or None if the block must be refilled first (see allocate())."""
+        with self._lock:
+            if len(self._ids) < n:
+                return None
+            return [self._ids.popleft() for _ in range(n)]
+
+    def allocate(self, n: int) -> List[int]:
+        """n ids, reserving a new block from the database if needed. Blocking."""
+        with self._lock:
+            while len(self._ids) < n:
+                self._ids.extend(self._reserve(max(self.block_size, n - len(self._ids))))
+            return [self._ids.popleft() for _ in range(n)]
+
+    def _reserve(self, n: int) -> List[int]:
+        self.reservations += 1
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                return list(conn.execute(
+                    text("SELECT nextval(pg_get_serial_sequence('chat_messages', 'id')) FROM generate_series(1, :n)"),
+                    {"n": n},
+                ).scalars())
+            with MessageIdAllocator._local_lock:
+                highest = conn.execute(select(func.max(models.ChatMessage.id))).scalar() or 0
+                start = max(highest + 1, MessageIdAllocator._next_local_id or 0)
+                MessageIdAllocator._next_local_id = start + n
+        return list(range(start, start + n))
+
+
+class ChatMessageWriter:
+    """
+    Persistence stage for chat messages.
+
+    Handlers build() messages as soon as their content is known (timestamp set then), and
+    persist() each turn's messages together at the end: ids are assigned up front, so there is
+    no refresh SELECT after the insert. Messages that are queued but not yet committed are
+    visible through pending(), which history reads merge in so users always see their own writes.
+    """
+
+    def __init__(self, mode: str = CHAT_PERSISTENCE_MODE, batch_size: int = CHAT_WRITE_BATCH_SIZE,
+                 flush_ms: float = CHAT_WRITE_FLUSH_MS, max_queue: int = CHAT_WRITE_MAX_QUEUE,
+                 allocator: MessageIdAllocator = None):
+        if mode not in ("sync", "write_behind"):
+            raise ValueError(f"CHAT_PERSISTENCE_MODE must be 'sync' or 'write_behind', not {mode!r}")
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_ms) / 1000.0
+        self.allocator = allocator or MessageIdAllocator()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_queue))
+        self._pending: Dict[int, Dict[int, models.ChatMessage]] = {}
+        self._pending_lock = threading.Lock()
+        self._idle = threading.Condition(self._pending_lock)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._enqueue_lock = threading.Lock()
+        self._closed = False
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.messages_written = 0
+        self.transactions = 0
+        self.sync_overflows = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+    def build(self, user_id: int, role: str, content: str,
+              extracted_symptoms: Dict[str, Any] = None, recommendations: Dict[str, Any] = None) -> models.ChatMessage:
+        """A new, unsaved message stamped with the current time. Its id is assigned by persist()."""
+        return models.ChatMessage(
+            user_id=user_id,
+            role=role,
+            content=content,
+            extracted_symptoms=extracted_symptoms or {},
+            recommendations=recommendations or {},
+            timestamp=datetime.now(timezone.utc),
+        )
+
+    async def persist(self, *messages: models.ChatMessage):
+        """Assigns ids and stores the messages in one transaction (sync) or queues them (write_behind)."""
+        if self.mode == "write_behind" and not self._closed:
+            ids = self.allocator.take(len(messages))
+            if ids is not None:
+                self._assign(messages, ids)
+                if not self._enqueue(messages):
+                    # Queue full: fall back to a synchronous write off the event loop
+                    await db_executor.run(self._insert, list(messages))
+                return
+        await db_executor.run(self.persist_blocking, messages)
+
+    def persist_blocking(self, messages: Iterable[models.ChatMessage]):
+        """persist() for code already running on a worker thread."""
+        messages = list(messages)
+        missing = [m for m in messages if m.id is None]
+        if missing:
+            self._assign(missing, self.allocator.allocate(len(missing)))
+        if self.mode == "write_behind" and not self._closed and self._enqueue(messages):
+            return
+        self._insert(messages)
+
+    def pending(self, user_id: int) -> List[models.ChatMessage]:
+        """Messages of `user_id` accepted by persist() but not committed yet."""
+        with self._pending_lock:
+            return list(self._pending.get(user_id, {}).values())
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every queued message is committed. :returns: False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 30.0):
+        """Stops accepting queued writes and drains the queue (called on shutdown)."""
+        self._closed = True
+        if self._worker is not None and not self.flush(timeout):
+            with self._pending_lock:
+                left = sum(len(v) for v in self._pending.values())
+            logger.error("Shutdown with %d chat messages still unwritten", left)
+
+    @staticmethod
+    def _assign(messages, ids):
+        for message, message_id in zip(messages, ids):
+            message.id = message_id
+
+    def _enqueue(self, messages) -> bool:
+        """:returns: False if the queue has no room for all of `messages` (the caller then writes them itself)."""
+        self._ensure_worker()
+        with self._enqueue_lock:
+            if self._queue.qsize() + len(messages) > self._queue.maxsize:
+                with self._stats_lock:
+                    self.sync_overflows += 1
+                return False
+            with self._pending_lock:
+                for message in messages:
+                    self._pending.setdefault(message.user_id, {})[message.id] = message
+            # Only the writer thread takes from the queue, so the room checked above is still there
+            for message in messages:
+                self._queue.put_nowait(message)
+        return True
+
+    def _forget(self, message):
+        with self._pending_lock:
+            messages = self._pending.get(message.user_id)
+            if messages is not None:
+                messages.pop(message.id, None)
+                if not messages:
+                    del self._pending[message.user_id]
+            if not self._pending:
+                self._idle.notify_all()
+
+    def _insert(self, messages: List[models.ChatMessage]):
+        rows = [{column: getattr(m, column) for column in _MESSAGE_COLUMNS} for m in messages]
+        with stage_timer("persistence"):
+            with engine.begin() as conn:
+                # One multi-row INSERT; ids and timestamps are already set, so nothing is read back
+                conn.execute(models.ChatMessage.__table__.insert(), rows)
+        with self._stats_lock:
+            self.messages_written += len(rows)
+            self.transactions += 1
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            for attempt in range(1, CHAT_WRITE_MAX_ATTEMPTS + 1):
+                try:
+                    with stage_timer("persistence_flush", model_choice="background"):
+                        self._insert(batch)
+                    break
+                except Exception:
+                    with self._stats_lock:
+                        self.failed_flushes += 1
+                    if attempt == CHAT_WRITE_MAX_ATTEMPTS:
+                        logger.exception("Dropping %d chat messages after %d failed flushes", len(batch), attempt)
+                        with self._stats_lock:
+                            self.dropped += len(batch)
+                    else:
+                        logger.warning("Chat message flush failed (attempt %d), retrying", attempt, exc_info=True)
+                        time.sleep(0.1 * 2 ** attempt)
+            for message in batch:
+                self._forget(message)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            pending = sum(len(v) for v in self._pending.values())
+        with self._stats_lock:
+            return {
+                "mode": self.mode,
+                "pending": pending,
+                "queue_depth": self._queue.qsize(),
+                "messages_written": self.messages_written,
+                "transactions": self.transactions,
+                "avg_messages_per_transaction": self.messages_written / self.transactions if self.transactions else 0.0,
+                "sync_overflows": self.sync_overflows,
+                "failed_flushes": self.failed_flushes,
+                "dropped": self.dropped,
+                "id_reservations": self.allocator.reservations,
+            }
+
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite returns naive datetimes; compare everything as UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def history_key(message: models.ChatMessage):
+    """The (timestamp, id) order chat history is read and paginated in."""
+    return as_utc(message.timestamp), message.id
+
+
+def merge_pending(rows: Iterable[models.ChatMessage], pending: Iterable[models.ChatMessage]) -> List[models.ChatMessage]:
+    """Committed rows plus not-yet-committed ones, without duplicates, ordered by (timestamp, id)."""
+    merged = {m.id: m for m in rows}
+    for message in pending:
+        merged.setdefault(message.id, message)
+    return sorted(merged.values(), key=history_key)
+
+
+# Shared per-process writer
+message_writer = ChatMessageWriter()
+atexit.register(message_writer.close)
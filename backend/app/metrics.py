@@ -0,0 +1,176 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# model_choice of the chat turn being handled; copied onto executor threads with the context
+current_model_choice: ContextVar[str] = ContextVar("current_model_choice", default="none")
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = _format_labels(self.labelnames, key)
+                for bound, count in zip(self.buckets, series):
+                    bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Minimal Prometheus registry: owned counters/histograms plus collector callbacks that
+    turn existing stats() dicts (executors, caches, batchers) into gauges at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Tuple[str, str, Callable[[], Dict]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, documentation: str, stats: Callable[[], Dict]):
+        """
+        Exposes every numeric value of stats() as a gauge named <prefix>_<key>.
+        Nested dicts ({label: {key: value}}) become a `name` label.
+        """
+        self._collectors.append((prefix, documentation, stats))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, documentation, stats in self._collectors:
+            try:
+                values = stats()
+            except Exception:
+                continue
+            gauges: Dict[str, List[str]] = {}
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    for sub_key, sub_value in value.items():
+                        if isinstance(sub_value, (int, float)) and not isinstance(sub_value, bool):
+                            gauges.setdefault(f"{prefix}_{sub_key}", []).append(
+                                f'{prefix}_{sub_key}{{name="{_escape(key)}"}} {float(sub_value)}'
+                            )
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges.setdefault(f"{prefix}_{key}", []).append(f"{prefix}_{key} {float(value)}")
+            for name, samples in gauges.items():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "healthmate_stage_seconds",
+    "Time spent in each chat pipeline stage.",
+    ("stage", "model_choice"),
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "healthmate_http_request_seconds",
+    "End-to-end HTTP request latency.",
+    ("method", "route", "status"),
+))
+FALLBACKS = registry.register(Counter(
+    "healthmate_fallbacks_total",
+    "Chat replies produced by a fallback path instead of a matched disease or model answer.",
+    ("model_choice", "reason"),
+))
+ADMISSION_REJECTIONS = registry.register(Counter(
+    "healthmate_admission_rejections_total",
+    "Requests turned away by admission control, by concurrency scope and reason.",
+    ("scope", "reason"),
+))
+ERRORS = registry.register(Counter(
+    "healthmate_errors_total",
+    "Errors caught while handling a chat turn.",
+    ("model_choice", "stage"),
+))
+
+
+def observe_stage(stage: str, seconds: float, model_choice: str = None):
+    STAGE_SECONDS.observe(seconds, stage=stage, model_choice=model_choice or current_model_choice.get())
+
+
+@contextmanager
+def stage_timer(stage: str, model_choice: str = None):
+    """Times the enclosed block into healthmate_stage_seconds{stage, model_choice}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started, model_choice)
+
+
+def record_fallback(reason: str):
+    FALLBACKS.inc(model_choice=current_model_choice.get(), reason=reason)
+
+
+def record_error(stage: str):
+    ERRORS.inc(model_choice=current_model_choice.get(), stage=stage)
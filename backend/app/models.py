@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, JSON, Boolean # ADDED Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, JSON, Boolean, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func 
 from .database import Base # Correctly import Base from database.py
@@ -45,4 +45,28 @@ class ChatMessage(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationship to the User model
-    user = relationship("User", back_populates="chat_messages")
\ No newline at end of file
+    user = relationship("User", back_populates="chat_messages")
+
+    # Supports per-user history reads ordered by (timestamp, id): keyset pages and "last N" context loads
+    __table_args__ = (
+        Index("ix_chat_messages_user_timestamp_id", "user_id", "timestamp", "id"),
+    )
+
+
+class DiseaseEmbedding(Base):
+    """
+    A disease's precomputed embedding for one embedding model, so processes load vectors instead of
+    re-encoding the catalogue. Kept in sync by app.disease_index (only changed rows are re-embedded).
+    """
+    __tablename__ = "disease_embeddings"
+
+    # References diseases.id (ON DELETE CASCADE in schema.sql); diseases has no ORM model here
+    disease_id = Column(Integer, primary_key=True)
+    # Embedder the vector came from, e.g. 'all-MiniLM-L6-v2' (see embedder_model_id())
+    model = Column(String(128), primary_key=True)
+    # sha256 of the embedded text; a mismatch means the disease changed and needs re-embedding
+    text_hash = Column(String(64), nullable=False)
+    dim = Column(Integer, nullable=False)
+    # L2-normalized little-endian float32
+    vector = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,61 @@
+import os
+from typing import List, Union
+
+import numpy as np
+
+# Mirrors the all-MiniLM-L6-v2 SentenceTransformer pipeline: transformer -> mean pooling -> L2 normalize
+DEFAULT_MAX_LENGTH = 256
+
+
+class OnnxEmbedder:
+    """
+    MiniLM sentence embedder running an exported (optionally int8-quantized) ONNX model on ONNX Runtime.
+
+    Drop-in for the SentenceTransformer calls the app makes: encode(str) returns one vector,
+    encode(list) a (n, dim) float32 matrix. Produce the model directory with
+    scripts/export_onnx_embedder.py.
+
+    :param model_dir: Directory holding the .onnx file and the saved tokenizer.
+    :param model_file: ONNX file inside model_dir, e.g. "model-int8.onnx".
+    :param threads: ONNX Runtime intra-op threads (0 lets the runtime decide).
+    """
+
+    def __init__(self, model_dir: str, model_file: str = "model-int8.onnx", threads: int = 0,
+                 max_length: int = DEFAULT_MAX_LENGTH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = os.path.join(model_dir, model_file)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"ONNX embedder not found at {path}; run scripts/export_onnx_embedder.py first"
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        # Reported by the model registry as this model's footprint
+        self.nbytes = os.path.getsize(path)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **_) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        chunks = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        vectors = np.concatenate(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in encoded if name in self._input_names}
+        token_embeddings = self.session.run(None, feeds)[0]  # (batch, tokens, dim)
+
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.maximum(norms, 1e-12)).astype(np.float32)
@@ -6,6 +6,7 @@ from typing import List
 
 from .. import schemas, models, auth # Relative imports to access modules in parent directory
 from ..database import get_db
+from ..executors import db_executor
 
 # Initialize APIRouter
 router = APIRouter(
@@ -14,15 +15,7 @@ router = APIRouter(
 )
 
 # --- User Registration Endpoint ---
-@router.post("/register/", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    """
-    Register a new user.
-
-    - **username**: Unique username for the user.
-    - **email**: Unique email address for the user.
-    - **password**: The user's chosen password (will be hashed).
-    """
+def _check_user_available(db: Session, user: schemas.UserCreate):
     db_user_by_email = db.query(models.User).filter(models.User.email == user.email).first()
     if db_user_by_email:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
@@ -31,9 +24,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     if db_user_by_username: # Corrected variable name from db_user_by_code
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken")
 
-    # Use get_password_hash from auth.py
-    hashed_password = auth.get_password_hash(user.password)
-
+def _insert_user(db: Session, user: schemas.UserCreate, hashed_password: str):
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -46,6 +37,22 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
     return db_user
 
+@router.post("/register/", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    """
+    Register a new user.
+
+    - **username**: Unique username for the user.
+    - **email**: Unique email address for the user.
+    - **password**: The user's chosen password (will be hashed).
+    """
+    await db_executor.run(_check_user_available, db, user)
+
+    # Hashed on the hashing pool so registrations don't stall the event loop
+    hashed_password = await auth.get_password_hash_async(user.password)
+
+    return await db_executor.run(_insert_user, db, user, hashed_password)
+
 # --- User Login Endpoint ---
 @router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
@@ -57,7 +64,7 @@ async def login_for_access_token(
     - **username**: The user's username (or email, if your authenticate_user supports it).
     - **password**: The user's password.
     """
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    user = await auth.authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -92,6 +99,13 @@ def read_all_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db
     users = db.query(models.User).offset(skip).limit(limit).all()
     return users
 
+@router.get("/cache/")
+async def auth_cache_status(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Hit ratio and estimated time saved by the token and principal caches of get_current_user.
+    """
+    return auth.auth_cache_stats()
+
 @router.get("/test-auth/", tags=["Testing"])
 async def test_authentication(current_user: models.User = Depends(auth.get_current_user)):
     """
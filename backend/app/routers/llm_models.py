@@ -1,64 +1,326 @@
+import asyncio
+import gc
+import logging
 import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
 import httpx
-from openai import OpenAI
-from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
-from sentence_transformers import SentenceTransformer
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
+
+logger = logging.getLogger(__name__)
 
-# OpenAI Setup
+# --- OpenAI Setup ---
+# One pooled async client per process: explicit timeouts and connection limits, and our
+# own retry loop (exponential backoff with full jitter) around opening the stream.
 openai_api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # e.g. a local stub server for testing
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", 30))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+OPENAI_RETRY_BASE_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", 0.5))
+OPENAI_RETRY_MAX_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", 8))
+
+# Errors worth retrying: network problems/timeouts, rate limiting and 5xx responses
+RETRYABLE_OPENAI_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
 if openai_api_key:
-    custom_http_client = httpx.Client(proxies={})
-    openai_client = OpenAI(api_key=openai_api_key, http_client=custom_http_client)
+    openai_http_client = httpx.AsyncClient(
+        proxies={},
+        timeout=httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+    )
+    openai_client = AsyncOpenAI(
+        api_key=openai_api_key,
+        base_url=OPENAI_BASE_URL,
+        http_client=openai_http_client,
+        max_retries=0,  # retried below, with jitter, only before the first token
+    )
 else:
     openai_client = None
 
-# Function to get expert doctor response
-def get_doctor_response(user_input, chat_history=[]):
-    if not openai_client:
-        return "OpenAI API key not set."
+DOCTOR_SYSTEM_PROMPT = (
+    "You are HealthMate AI, a highly experienced medical doctor. "
+    "Your job is to conduct a medical consultation. Start by asking the patient what brings them in. "
+    "If the user mentions symptoms (e.g., pain, cough, nausea), ask relevant follow-up questions: "
+    "location, severity (1-10), when it started, any triggers, and other symptoms. "
+    "Then suggest a likely condition and classify it into one of three categories:\n"
+    "1. Critical: Advise to consult a doctor or go to ER immediately.\n"
+    "2. Moderate: Explain home treatment (rest, hydration, pain relievers) and when to seek help.\n"
+    "3. Mild: Suggest simple remedies or over-the-counter meds.\n"
+    "Be professional, friendly, and never make a definitive diagnosis."
+)
 
-    system_prompt = (
-        "You are HealthMate AI, a highly experienced medical doctor. "
-        "Your job is to conduct a medical consultation. Start by asking the patient what brings them in. "
-        "If the user mentions symptoms (e.g., pain, cough, nausea), ask relevant follow-up questions: "
-        "location, severity (1-10), when it started, any triggers, and other symptoms. "
-        "Then suggest a likely condition and classify it into one of three categories:\n"
-        "1. Critical: Advise to consult a doctor or go to ER immediately.\n"
-        "2. Moderate: Explain home treatment (rest, hydration, pain relievers) and when to seek help.\n"
-        "3. Mild: Suggest simple remedies or over-the-counter meds.\n"
-        "Be professional, friendly, and never make a definitive diagnosis."
-    )
 
-    messages = [{"role": "system", "content": system_prompt}]
-    for message in chat_history:
+def build_doctor_messages(user_input, chat_history=None):
+    messages = [{"role": "system", "content": DOCTOR_SYSTEM_PROMPT}]
+    for message in chat_history or []:
         messages.append({"role": message['role'], "content": message['content']})
     messages.append({"role": "user", "content": user_input})
+    return messages
+
+
+def retry_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(max, base * 2^attempt)]."""
+    return random.uniform(0, min(OPENAI_RETRY_MAX_SECONDS, OPENAI_RETRY_BASE_SECONDS * (2 ** attempt)))
+
+
+async def _open_completion_stream(messages):
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            return await openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=600,
+                stream=True,
+            )
+        except RETRYABLE_OPENAI_ERRORS as e:
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+            delay = retry_delay(attempt)
+            logger.warning("OpenAI request failed (%s), retrying in %.2fs", e.__class__.__name__, delay)
+            await asyncio.sleep(delay)
+
 
+async def stream_doctor_response(user_input, chat_history=None) -> AsyncIterator[str]:
+    """
+    Yields the doctor's reply token by token as the API streams it.
+    Raises on API errors (the caller decides how to surface them).
+    """
+    if not openai_client:
+        raise RuntimeError("OpenAI API key not set.")
+    stream = await _open_completion_stream(build_doctor_messages(user_input, chat_history))
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+# Function to get expert doctor response
+async def get_doctor_response(user_input, chat_history=None):
+    if not openai_client:
+        return "OpenAI API key not set."
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=600
-        )
-        reply = response.choices[0].message.content.strip()
-        return reply
+        parts = [token async for token in stream_doctor_response(user_input, chat_history)]
+        return "".join(parts).strip()
     except Exception as e:
         return f"OpenAI API error: {str(e)}"
 
-# FLAN-T5 Setup
-flan_tokenizer = AutoTokenizer.from_pretrained("google/flan-t5-base")
-flan_model = AutoModelForSeq2SeqLM.from_pretrained("google/flan-t5-base")
-flan_pipeline = pipeline(
-    "text2text-generation", 
-    model=flan_model, 
-    tokenizer=flan_tokenizer, 
-    max_new_tokens=150,
-    do_sample=True,
-    temperature=0.7,
-    top_p=0.9,
-    repetition_penalty=1.2
+# --- Lazy Model Registry ---
+# Models are loaded the first time a request needs them (not at import), and can be
+# unloaded again after sitting idle for MODEL_IDLE_TTL_SECONDS (0 keeps them forever).
+MODEL_IDLE_TTL_SECONDS = float(os.getenv("MODEL_IDLE_TTL_SECONDS", 0))
+# Comma-separated model names to load at startup, e.g. "embedder" or "embedder,flan-t5"
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "").split(",") if m.strip()]
+
+# --- Embedder Backend (from Environment Variables) ---
+# "torch": SentenceTransformer('all-MiniLM-L6-v2') in fp32 PyTorch.
+# "onnx": the same model exported to ONNX (int8 dynamically quantized by default) on ONNX Runtime;
+#   create it with scripts/export_onnx_embedder.py and check it with scripts/embedder_parity.py.
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "torch").lower()
+EMBEDDER_ONNX_DIR = os.getenv("EMBEDDER_ONNX_DIR", "models/minilm-onnx")
+EMBEDDER_ONNX_FILE = os.getenv("EMBEDDER_ONNX_FILE", "model-int8.onnx")
+# ONNX Runtime intra-op threads per encode (0 lets the runtime use every core)
+EMBEDDER_ONNX_THREADS = int(os.getenv("EMBEDDER_ONNX_THREADS", 0))
+# Vectors of the ONNX export differ slightly from torch's, so persisted vectors are keyed per backend
+EMBEDDER_MODEL_ID = (
+    "all-MiniLM-L6-v2" if EMBEDDER_BACKEND == "torch" else f"all-MiniLM-L6-v2+{EMBEDDER_BACKEND}:{EMBEDDER_ONNX_FILE}"
 )
 
-# Embedding Model
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
\ No newline at end of file
+
+def _model_nbytes(obj) -> Optional[int]:
+    """Best-effort size of a model's weights in bytes (None if it isn't a torch module or doesn't report one)."""
+    if isinstance(getattr(obj, "nbytes", None), int):
+        return obj.nbytes
+    module = getattr(obj, "model", obj)  # pipelines and FlanT5 wrap the module in .model
+    if not hasattr(module, "parameters"):
+        return None
+    try:
+        return sum(p.numel() * p.element_size() for p in module.parameters())
+    except Exception:
+        return None
+
+
+class _ModelEntry:
+    def __init__(self, name: str, loader: Callable[[], Any], model_id: str):
+        self.name = name
+        self.loader = loader
+        self.model_id = model_id
+        self.lock = threading.Lock()
+        self.instance = None
+        self.load_seconds: Optional[float] = None
+        self.nbytes: Optional[int] = None
+        self.last_used: Optional[float] = None
+        self.load_count = 0
+
+
+class ModelRegistry:
+    """Loads registered models on demand and evicts the ones that have gone idle."""
+
+    def __init__(self, idle_ttl_seconds: float = 0):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._reaper = None
+
+    def register(self, name: str, loader: Callable[[], Any], model_id: str = None):
+        """
+        :param model_id: Identifies what the loaded model produces (e.g. which weights/backend), so
+            stored outputs can be matched to it without loading the model. Defaults to `name`.
+        """
+        self._entries[name] = _ModelEntry(name, loader, model_id or name)
+
+    def model_id(self, name: str) -> str:
+        return self._entries[name].model_id
+
+    def get(self, name: str):
+        """Returns the loaded model, loading it first if needed."""
+        entry = self._entries[name]
+        instance = entry.instance
+        if instance is None:
+            with entry.lock:
+                if entry.instance is None:
+                    started = time.perf_counter()
+                    entry.instance = entry.loader()
+                    entry.load_seconds = time.perf_counter() - started
+                    entry.nbytes = _model_nbytes(entry.instance)
+                    entry.load_count += 1
+                    logger.info("Loaded model %r in %.2fs", name, entry.load_seconds)
+                instance = entry.instance
+            self._ensure_reaper()
+        entry.last_used = time.monotonic()
+        return instance
+
+    def is_loaded(self, name: str) -> bool:
+        return self._entries[name].instance is not None
+
+    def unload(self, name: str) -> bool:
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.instance is None:
+                return False
+            entry.instance = None
+        gc.collect()
+        logger.info("Unloaded model %r", name)
+        return True
+
+    def unload_idle(self) -> List[str]:
+        """Unloads every model unused for longer than the idle TTL."""
+        if self.idle_ttl_seconds <= 0:
+            return []
+        now = time.monotonic()
+        return [
+            name for name, entry in self._entries.items()
+            if entry.instance is not None and entry.last_used is not None
+            and now - entry.last_used > self.idle_ttl_seconds
+            and self.unload(name)
+        ]
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            name: {
+                "model_id": entry.model_id,
+                "loaded": entry.instance is not None,
+                "load_seconds": entry.load_seconds,
+                "memory_bytes": entry.nbytes if entry.instance is not None else None,
+                "idle_seconds": (now - entry.last_used) if entry.last_used is not None else None,
+                "load_count": entry.load_count,
+            }
+            for name, entry in self._entries.items()
+        }
+
+    def _ensure_reaper(self):
+        if self._reaper is not None or self.idle_ttl_seconds <= 0:
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(1.0, min(self.idle_ttl_seconds / 2, 60.0)))
+            try:
+                self.unload_idle()
+            except Exception:
+                logger.exception("Idle model eviction failed")
+
+
+# --- FLAN-T5 (from Environment Variables) ---
+# Dynamically quantize the Linear layers to int8 on load (smaller and faster on CPU, slightly different output)
+FLAN_QUANTIZE = os.getenv("FLAN_QUANTIZE", "false").lower() in ("1", "true", "yes")
+# torch intra-op threads used by generation (0 keeps torch's default of one per core)
+FLAN_TORCH_THREADS = int(os.getenv("FLAN_TORCH_THREADS", 0))
+# Sampling settings of every FLAN-T5 generate() call
+FLAN_GENERATION_KWARGS = {
+    "do_sample": True,
+    "temperature": float(os.getenv("FLAN_TEMPERATURE", 0.7)),
+    "top_p": float(os.getenv("FLAN_TOP_P", 0.9)),
+    "repetition_penalty": float(os.getenv("FLAN_REPETITION_PENALTY", 1.2)),
+}
+
+
+class FlanT5:
+    """The FLAN-T5 tokenizer and model in eval mode; generation itself is driven by app.flan_generator."""
+
+    def __init__(self, tokenizer, model, generation_kwargs: Dict[str, Any]):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.generation_kwargs = generation_kwargs
+
+
+def _load_flan_t5():
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+    if FLAN_TORCH_THREADS:
+        torch.set_num_threads(FLAN_TORCH_THREADS)
+    flan_tokenizer = AutoTokenizer.from_pretrained("google/flan-t5-base")
+    flan_model = AutoModelForSeq2SeqLM.from_pretrained("google/flan-t5-base").eval()
+    if FLAN_QUANTIZE:
+        flan_model = torch.quantization.quantize_dynamic(flan_model, {torch.nn.Linear}, dtype=torch.qint8)
+    return FlanT5(flan_tokenizer, flan_model, dict(FLAN_GENERATION_KWARGS))
+
+
+def load_embedder(backend: str = None):
+    """The MiniLM embedder on the given backend ("torch" or "onnx"; default EMBEDDER_BACKEND)."""
+    backend = (backend or EMBEDDER_BACKEND).lower()
+    if backend == "onnx":
+        from ..onnx_embedder import OnnxEmbedder
+
+        return OnnxEmbedder(EMBEDDER_ONNX_DIR, EMBEDDER_ONNX_FILE, threads=EMBEDDER_ONNX_THREADS)
+    if backend != "torch":
+        raise ValueError(f"EMBEDDER_BACKEND must be 'torch' or 'onnx', not {backend!r}")
+
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+
+def _load_embedder():
+    return load_embedder()
+
+
+model_registry = ModelRegistry(idle_ttl_seconds=MODEL_IDLE_TTL_SECONDS)
+model_registry.register("flan-t5", _load_flan_t5)
+model_registry.register("embedder", _load_embedder, model_id=EMBEDDER_MODEL_ID)
+
+def get_flan_t5() -> FlanT5:
+    return model_registry.get("flan-t5")
+
+
+def get_embedder():
+    return model_registry.get("embedder")
+
+
+def embedder_model_id() -> str:
+    """Id of the vectors get_embedder() produces; known without loading the model."""
+    return model_registry.model_id("embedder")
+
+
+def preload_models():
+    """Loads the models listed in PRELOAD_MODELS (called from the app startup hook)."""
+    for name in PRELOAD_MODELS:
+        model_registry.get(name)
@@ -1,154 +1,406 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List, Dict, Any
-from sqlalchemy import text 
-import re
-from .llm_models import openai_client, flan_pipeline, embedder
+from sqlalchemy import tuple_
+from datetime import datetime
+from typing import AsyncIterator, List, Dict, Any, Optional
+import asyncio
+import base64
+import json
+import logging
+import os
+from .llm_models import openai_client, get_embedder, model_registry
 from .. import schemas, models, auth
 from ..database import get_db
-from .llm_models import get_doctor_response
-import numpy as np
+from ..admission import admission
+from ..disease_index import disease_index
+from ..disease_scoring import symptom_disease_matrix
+from ..disease_ranker import RankResult, disease_ranker
+from ..encode_batcher import encode_batcher
+from ..message_writer import as_utc, history_key, merge_pending, message_writer
+from ..knowledge_base import CompiledTemplate, knowledge_base, knowledge_base_status, refresh_knowledge_base
+from ..executors import ExecutorSaturated, db_executor, executor_stats, inference_executor
+from ..flan_generator import FLAN_REPHRASE, GenerationDeadlineExceeded, rephrase_prompt
+from .. import inference_client
+from ..inference_client import generation_service
+from .. import intent_router as intents
+from ..intent_router import intent_router
+from ..metrics import current_model_choice, observe_stage, record_error, record_fallback, stage_timer
+from ..response_cache import normalize_message, retrieval_cache
+from ..symptom_matcher import symptom_matcher
+from .llm_models import get_doctor_response, stream_doctor_response
+
+logger = logging.getLogger(__name__)
+
+# Messages of prior conversation sent to OpenAI as context
+LLM_CONTEXT_MESSAGES = int(os.getenv("LLM_CONTEXT_MESSAGES", 5))
+# Default and maximum page sizes of /ai/chat/history/
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 50))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", 200))
+
+# Used when no active disease template applies
+DEFAULT_DISEASE_TEMPLATE = CompiledTemplate(
+    "Based on your symptoms, the likely cause is {disease_name}: {disease_desc}.\nHere’s what you can try:\n{advice}"
+)
 
 router = APIRouter(
     prefix="/ai",
     tags=["AI Models"],
 )
 
-def retrieve_disease_info(question: str, db: Session):
-    # Debug
-    print("DEBUG: Looking up disease info for question:", question)
-
-    # Fetch all symptoms and their keywords from DB
-    symptoms = db.execute(text("SELECT id, name, keywords FROM symptoms")).fetchall()
-    print("DEBUG: Retrieved symptoms from DB:", symptoms)
-
-    # Prepare a dict: {symptom_id: [keyword1, keyword2, ...]}
-    symptom_kw_map = {}
-    for row in symptoms:
-        symptom_id, name, keywords = row
-        keyword_list = [kw.strip().lower() for kw in keywords.split(',') if kw.strip()]
-        # Also add the symptom name itself as a keyword
-        keyword_list.append(name.lower())
-        symptom_kw_map[symptom_id] = keyword_list
-
-    # Find matching symptoms in question
-    question_lower = question.lower()
-    matching_symptom_ids = set()
-    
-    print("DEBUG: Question in lowercase:", question_lower)
-    
-    for symptom_id, kw_list in symptom_kw_map.items():
-        for kw in kw_list:
-            # Use word boundary matching to avoid partial matches
-            if re.search(r'\b' + re.escape(kw) + r'\b', question_lower):
-                matching_symptom_ids.add(symptom_id)
-                print(f"DEBUG: Matched keyword '{kw}' for symptom_id {symptom_id}")
-                break
-
-    print("DEBUG: Matching symptom IDs:", matching_symptom_ids)
-
-    if not matching_symptom_ids:
-        print("DEBUG: No symptoms matched, using fallback")
-        # Fallback: just return "General Unwell Feeling" if no matches
-        disease_row = db.execute(text(
-            "SELECT id, name, description FROM diseases WHERE name = 'General Unwell Feeling'"
-        )).fetchone()
-        suggestions = db.execute(text(
-            "SELECT text FROM suggestions WHERE is_general_advice = TRUE"
-        )).fetchall()
-        return disease_row, [s[0] for s in suggestions]
-
-    # For each matched symptom, vote for linked diseases (sum weights)
-    disease_scores = {}
-    for symptom_id in matching_symptom_ids:
-        stmt = text("SELECT disease_id, weight FROM disease_symptoms WHERE symptom_id = :sid")
-        links = db.execute(stmt, {"sid": symptom_id}).fetchall()
-        print(f"DEBUG: Disease links for symptom {symptom_id}:", links)
-        for disease_id, weight in links:
-            disease_scores[disease_id] = disease_scores.get(disease_id, 0) + float(weight)
-
-    print("DEBUG: Disease scores:", disease_scores)
-
-    if not disease_scores:
-        print("DEBUG: No linked diseases found, using fallback")
+def _general_unwell_fallback(kb):
+    # Fallback: just return "General Unwell Feeling" if no matches
+    with stage_timer("template_fetch"):
+        return kb.general_unwell(), list(kb.general_advice)
+
+
+def retrieve_disease_info(question: str):
+    """
+    Keyword-only ranking for model_choice 'flan-t5'.
+    :returns: (disease_row, suggestions, RankResult)
+    """
+    logger.debug("Looking up disease info for question: %s", question)
+    kb = knowledge_base.get()
+
+    # Symptom keywords are matched in one automaton pass and voted in one sparse product
+    with stage_timer("scoring"):
+        ranking = disease_ranker.rank(question)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for symptom_id, matches in ranking.symptom_matches.items():
+            logger.debug("Matched keyword %r for symptom_id %s", matches[0].keyword, symptom_id)
+
+    if not ranking.symptom_matches:
+        logger.debug("No symptoms matched, using fallback")
+        record_fallback("no_symptom_match")
+        return _general_unwell_fallback(kb) + (ranking,)
+
+    if ranking.best is None:
+        logger.debug("No linked diseases found for symptoms %s, using fallback", set(ranking.symptom_matches))
+        record_fallback("no_linked_disease")
         # No linked diseases found
-        disease_row = db.execute(text(
-            "SELECT id, name, description FROM diseases WHERE name = 'General Unwell Feeling'"
-        )).fetchone()
-        suggestions = db.execute(text(
-            "SELECT text FROM suggestions WHERE is_general_advice = TRUE"
-        )).fetchall()
-        return disease_row, [s[0] for s in suggestions]
+        return _general_unwell_fallback(kb) + (ranking,)
 
     # Pick the highest scoring disease
-    top_disease_id = max(disease_scores, key=lambda k: disease_scores[k])
-    print(f"DEBUG: Top disease ID: {top_disease_id} with score: {disease_scores[top_disease_id]}")
-    
-    disease_row = db.execute(
-        text("SELECT id, name, description FROM diseases WHERE id = :did"),
-        {"did": top_disease_id}
-    ).fetchone()
-    
-    # Fetch specific suggestions for this disease + some general advice
-    suggestions = db.execute(
-        text("SELECT text FROM suggestions WHERE disease_id = :did OR is_general_advice = TRUE LIMIT 5"),
-        {"did": top_disease_id}
-    ).fetchall()
-    
-    print(f"DEBUG: Selected disease: {disease_row}")
-    print(f"DEBUG: Found suggestions: {[s[0] for s in suggestions]}")
-    
-    return disease_row, [s[0] for s in suggestions]
+    disease_row = ranking.best.disease
+    logger.debug("Top disease: %s with score: %s", disease_row[1], ranking.best.keyword_score)
+
+    with stage_timer("template_fetch"):
+        # Specific suggestions for this disease + some general advice
+        suggestions = kb.suggestions_for(disease_row[0])
 
+    logger.debug("Selected disease %s with %d suggestions", disease_row[1], len(suggestions))
 
-def find_best_disease_by_embedding(question: str, db: Session, embedder):
+    return disease_row, suggestions, ranking
+
+
+def find_best_disease_by_embedding(question: str, user_vec):
     """
-    Given a user's question, use embeddings to find the most relevant disease and suggestions.
+    Given a user's question and its embedding, find the most relevant disease and suggestions
+    by fusing keyword votes with embedding similarity over all diseases.
+    :returns: (disease_row, suggestions, RankResult), or (None, [], None) if nothing could be ranked
     """
     try:
-        print(f"DEBUG: Embedding search for question: {question}")
+        logger.debug("Hybrid search for question: %s", question)
+
+        # Disease vectors are precomputed and normalized; only the question is encoded (by the caller)
+        with stage_timer("scoring"):
+            ranking = disease_ranker.rank(question, user_vec)
+        return _best_disease(ranking)
+
+    except Exception:
+        logger.exception("Error in find_best_disease_by_embedding")
+        record_error("scoring")
+        return None, [], None
+
+
+def _best_disease(ranking: RankResult):
+    """
+    The top-ranked disease of `ranking` and its suggestions.
+    :returns: (disease_row, suggestions, RankResult), or (None, [], None) if nothing was ranked
+    """
+    if ranking.best is None:
+        logger.warning("No diseases found in database")
+        return None, [], None
+
+    best = ranking.best
+    logger.debug("Best disease match: %s with score %.3f (similarity %.3f)", best.disease[1], best.score, best.similarity)
+
+    with stage_timer("template_fetch"):
+        suggestions = knowledge_base.get().suggestions_for(best.disease[0])
+
+    return best.disease, suggestions, ranking
+
+
+async def _rank_remotely(question: str):
+    """find_best_disease_by_embedding() done by the inference server: it encodes and ranks in one round trip."""
+    with stage_timer("scoring"):
+        payload = await inference_client.inference_client.request("rank", question=question)
+    return _best_disease(RankResult.from_payload(payload))
+
+
+def _recent_history(db: Session, user_id: int, limit: int = LLM_CONTEXT_MESSAGES, current: models.ChatMessage = None):
+    """
+    The user's last `limit` messages, oldest first, read newest-first with a LIMIT.
+    Includes messages still queued for writing and `current`, the turn's not yet persisted message.
+    """
+    with stage_timer("history_load"):
+        chat_history = db.query(models.ChatMessage)\
+            .filter_by(user_id=user_id)\
+            .order_by(models.ChatMessage.timestamp.desc(), models.ChatMessage.id.desc())\
+            .limit(limit).all()
+    unsaved = message_writer.pending(user_id) + ([current] if current is not None else [])
+    # Unsaved messages have no id yet; order them after everything committed
+    merged = merge_pending(chat_history, [m for m in unsaved if m.id is not None])
+    merged += [m for m in unsaved if m.id is None]
+    return [{"role": m.role, "content": m.content} for m in merged[-limit:]]
+
+
+def _last_bot_message(db: Session, user_id: int) -> Optional[models.ChatMessage]:
+    with stage_timer("history_load"):
+        last_saved = db.query(models.ChatMessage).filter_by(
+            user_id=user_id, role="assistant"
+        ).order_by(models.ChatMessage.timestamp.desc(), models.ChatMessage.id.desc()).first()
+    candidates = [m for m in message_writer.pending(user_id) if m.role == "assistant"]
+    merged = merge_pending([last_saved] if last_saved else [], candidates)
+    return merged[-1] if merged else None
+
+
+def _cached_retrieve_disease_info(message: str):
+    """retrieve_disease_info() behind the retrieval cache, keyed on the normalized message."""
+    question = normalize_message(message)
+    knowledge_base.get(), symptom_matcher.get(), symptom_disease_matrix.get()  # make sure all versions are set
+    cache_key = ("flan-t5", knowledge_base.version, symptom_matcher.version, symptom_disease_matrix.version, question)
+    retrieved = retrieval_cache.get(cache_key)
+    if retrieved is None:
+        retrieved = retrieve_disease_info(question)
+        retrieval_cache.set(cache_key, retrieved)
+    return retrieved
+
+
+def _embedding_cache_key(question: str):
+    # Hybrid ranking depends on every knowledge-base snapshot
+    return ("embedding", knowledge_base.version, symptom_matcher.version, symptom_disease_matrix.version,
+            disease_index.version, question)
+
+
+def _specific_suggestions(suggestions: List[str]) -> List[str]:
+    """`suggestions` without generic "consult a doctor" style advice and very short responses."""
+    return [
+        s for s in suggestions
+        if not s.lower().startswith("please consult")
+        and not s.lower().startswith("it's always best")
+        and not s.lower().startswith("stay hydrated")
+        and len(s) > 20
+    ]
+
+
+def follow_up_state(disease_id: int, suggestions: List[str], pending_offer: bool) -> Dict[str, Any]:
+    """
+    recommendations["follow_up"] of an assistant turn: the disease it was about, the suggestions it
+    showed or offered (by id) and whether it ended with an offer a "yes" accepts.
+    """
+    kb = knowledge_base.get()
+    suggestion_ids = [kb.suggestion_id(s) for s in suggestions]
+    return {
+        "disease_id": disease_id,
+        "suggestion_ids": [i for i in suggestion_ids if i is not None],
+        "pending_offer": pending_offer,
+    }
+
+
+def _follow_up_reply(db: Session, user_id: int):
+    """
+    Answers a "yes" to the advice the user's previous turn offered, from that turn's follow-up state.
+    Runs on the DB executor.
+    :returns: (reply text, extracted_symptoms, recommendations), or None if nothing was offered
+    """
+    last_bot_message = _last_bot_message(db, user_id)
+    state = (last_bot_message.recommendations or {}).get("follow_up") if last_bot_message else None
+    if not state or not state.get("pending_offer"):
+        return None
+
+    kb = knowledge_base.get()
+    disease_row = kb.disease(state["disease_id"])
+    if disease_row is None:
+        # Removed from the knowledge base since the offer was made
+        record_fallback("follow_up_not_found")
+        return "Sorry, I couldn't find more details. Could you please rephrase your symptoms?", {}, {}
+
+    advice = [a for a in map(kb.suggestion, state.get("suggestion_ids", ())) if a]
+    if not advice:
+        suggestions = kb.suggestions_for(disease_row[0])
+        advice = (_specific_suggestions(suggestions) or suggestions)[:3]
+    recommendations = {"suggestions": advice, "follow_up": follow_up_state(disease_row[0], advice, pending_offer=False)}
+    return "Here are a few things you can try:\n" + "\n".join(f"- {s}" for s in advice), {}, recommendations
+
+
+def _flan_t5_reply(request: schemas.ChatRequest, current_user: models.User, db: Session):
+    """
+    Keyword-lookup reply for model_choice 'flan-t5', for messages routed as symptoms. Runs on the DB executor.
+    :returns: (reply text, extracted_symptoms, recommendations, rephrase prompt or None). With a
+        prompt, the reply text is the fallback for when FLAN-T5 cannot rephrase in time.
+    """
+    prompt = None
+
+    # Get disease and suggestions from database
+    disease_row, suggestions, ranking = _cached_retrieve_disease_info(request.message)
+    extracted_symptoms = ranking.extracted_symptoms()
+    recommendations = ranking.recommendations(suggestions)
+    
+    if disease_row and suggestions:
+        disease_name = disease_row[1]
+        disease_desc = disease_row[2]
+        
+        # Filter out generic "consult doctor" suggestions
+        specific_suggestions = _specific_suggestions(suggestions)
         
-        # Fetch all diseases from DB
-        diseases = db.execute(text("SELECT id, name, description FROM diseases")).fetchall()
-        if not diseases:
-            print("DEBUG: No diseases found in database")
-            return None, []
-
-        print(f"DEBUG: Found {len(diseases)} diseases in database")
-
-        # Build disease texts for embedding
-        disease_texts = [f"{d[1]}: {d[2]}" for d in diseases]
-        disease_ids = [d[0] for d in diseases]
-
-        # Compute embeddings
-        print("DEBUG: Computing embeddings...")
-        disease_vectors = embedder.encode(disease_texts)
-        user_vec = embedder.encode([question])[0]
-        print(f"DEBUG: Embeddings computed. Disease vectors shape: {disease_vectors.shape}, User vector shape: {user_vec.shape}")
-
-        # Compute cosine similarity
-        sims = np.dot(disease_vectors, user_vec) / (np.linalg.norm(disease_vectors, axis=1) * np.linalg.norm(user_vec) + 1e-9)
-        best_idx = int(np.argmax(sims))
-        best_disease = diseases[best_idx]
+        if FLAN_REPHRASE:
+            prompt = rephrase_prompt(disease_name, disease_desc, (specific_suggestions or suggestions)[:3])
+        # The reply already contains its advice: nothing is left to offer
+        recommendations["follow_up"] = follow_up_state(disease_row[0], specific_suggestions[:2], pending_offer=False)
+
+        # If we have specific suggestions, use them
+        if specific_suggestions:
+            # Take up to 2 specific suggestions
+            selected_suggestions = specific_suggestions[:2]
+            
+            # Create a natural response
+            if len(selected_suggestions) == 1:
+                bot_response_content = f"Based on your symptoms, you might be experiencing {disease_name.lower()}. {selected_suggestions[0]}"
+            else:
+                suggestions_text = f"{selected_suggestions[0]} Additionally, {selected_suggestions[1].lower()}"
+                bot_response_content = f"Based on your symptoms, you might be experiencing {disease_name.lower()}. {suggestions_text}"
         
-        print(f"DEBUG: Best disease match: {best_disease[1]} with similarity: {sims[best_idx]:.3f}")
+        # If no specific suggestions, create a helpful response
+        else:
+            # Get some general advice that's not too generic
+            with stage_timer("template_fetch"):
+                general_advice = knowledge_base.get().sample_general_advice(1)
+            
+            if general_advice:
+                bot_response_content = f"Based on your symptoms, you might be experiencing {disease_name.lower()}. {disease_desc} {general_advice[0]}"
+            else:
+                bot_response_content = f"Based on your symptoms, you might be experiencing {disease_name.lower()}. {disease_desc} Remember to get plenty of rest and stay hydrated."
+    
+    # If no disease matched, provide helpful general advice
+    else:
+        # Get specific general advice
+        record_fallback("no_disease")
+        with stage_timer("template_fetch"):
+            general_advice = knowledge_base.get().sample_general_advice(2)
+        
+        if general_advice:
+            if len(general_advice) == 1:
+                bot_response_content = f"I understand you're not feeling well. {general_advice[0]}"
+            else:
+                bot_response_content = f"I understand you're not feeling well. {general_advice[0]} Also, {general_advice[1].lower()}"
+        else:
+            bot_response_content = "I understand you're not feeling well. Make sure to get plenty of rest, stay hydrated, and consider consulting a healthcare provider if your symptoms persist or worsen."
 
-        # Fetch suggestions for the best disease
-        suggestions = db.execute(
-            text("SELECT text FROM suggestions WHERE disease_id = :did OR is_general_advice = TRUE LIMIT 5"),
-            {"did": best_disease[0]}
-        ).fetchall()
+    return bot_response_content, extracted_symptoms, recommendations, prompt
 
-        print(f"DEBUG: Found {len(suggestions)} suggestions for disease {best_disease[1]}")
 
-        return best_disease, [s[0] for s in suggestions]
-        
-    except Exception as e:
-        print(f"DEBUG: Error in find_best_disease_by_embedding: {e}")
-        import traceback
-        traceback.print_exc()
-        return None, []
+async def _flan_rephrase(prompt: str, fallback: str) -> str:
+    """FLAN-T5's rephrasing of the retrieved disease, or `fallback` if it fails, is late or is empty."""
+    try:
+        with stage_timer("generation"):
+            reply = (await generation_service().generate(prompt)).strip()
+        if reply:
+            return reply
+        record_fallback("generation_empty")
+    except GenerationDeadlineExceeded:
+        record_fallback("generation_deadline")
+    except ExecutorSaturated:
+        record_fallback("generation_saturated")
+    except inference_client.InferenceServerUnavailable:
+        record_fallback("generation_unavailable")
+    except Exception:
+        logger.exception("FLAN-T5 generation failed")
+        record_error("generation")
+    return fallback
+
+
+async def _intent_reply(request: schemas.ChatRequest, user_id: int, db: Session):
+    """
+    Routes the message of a local-model turn (flan-t5, embedding) by intent. Greetings, thanks and
+    off-topic messages are answered here without retrieval or generation; a "yes" takes up the
+    advice offered by the previous turn.
+    :returns: (reply text, extracted_symptoms, recommendations), or None for a symptom report
+    """
+    with stage_timer("intent"):
+        intent = await intent_router.route(request.message)
+    if intent == intents.SYMPTOMS:
+        return None
+    if intent == intents.AFFIRMATION:
+        follow_up = await db_executor.run(_follow_up_reply, db, user_id)
+        if follow_up is not None:
+            return follow_up
+        # Nothing was offered: a bare "yes" says nothing about symptoms
+        intent = intents.OFF_TOPIC
+    if intent == intents.OFF_TOPIC:
+        record_fallback("off_topic")
+    return intents.INTENT_HANDLERS[intent](), {}, {}
+
+
+def _embedding_reply(disease_row, suggestions):
+    """
+    Templated answer for the disease matched in model_choice 'embedding'. Reads only the in-memory knowledge base.
+    :returns: (reply text, follow-up state or None); see follow_up_state()
+    """
+    kb = knowledge_base.get()
+    try:
+        if disease_row is None:
+            # Fallback response without templates
+            record_fallback("no_disease")
+            try:
+                with stage_timer("template_fetch"):
+                    advice_rows = kb.sample_general_advice(3, specific_only=False)
+                advice = "\n".join(f"- {s}" for s in advice_rows)
+                return f"I understand you're not feeling well. Here are some general recommendations:\n{advice}", None
+            except Exception:
+                logger.exception("Error with fallback suggestions")
+                record_error("template_fetch")
+                return "I understand you're not feeling well. Please consult a healthcare provider if your symptoms persist or worsen.", None
+
+        # Try to use templates, fallback to simple response if templates fail
+        try:
+            # Try to pick a random, human-like template (disease-specific or general)
+            with stage_timer("template_fetch"):
+                tmpl = kb.random_template("disease", disease_row[0]) or DEFAULT_DISEASE_TEMPLATE
+
+            # Filter out generic suggestions and use specific ones
+            specific_suggestions = _specific_suggestions(suggestions)
+
+            # Use specific suggestions if available, otherwise use all suggestions
+            final_suggestions = specific_suggestions[:3] if specific_suggestions else suggestions[:3]
+
+            # If still empty, add some general advice (guaranteed to never be blank)
+            if not final_suggestions:
+                with stage_timer("template_fetch"):
+                    advice_rows = kb.sample_general_advice(2)
+                final_suggestions = advice_rows if advice_rows else ["Try to get plenty of rest and stay hydrated."]
+
+            advice = "\n".join(f"- {s}" for s in final_suggestions)
+            # Templates without {advice} only offer it ("Want to hear what you can do next?"); a "yes" shows it
+            state = follow_up_state(disease_row[0], final_suggestions, pending_offer=not tmpl.has_placeholder("advice"))
+            return tmpl.render(disease_name=disease_row[1], disease_desc=disease_row[2], advice=advice), state
+            
+        except Exception:
+            logger.exception("Error with disease templates")
+            record_error("template_fetch")
+            # Simple fallback response with better suggestions
+            specific_suggestions = _specific_suggestions(suggestions)
+            final_suggestions = specific_suggestions[:2] if specific_suggestions else suggestions[:2]
+            advice = "\n".join(f"- {s}" for s in final_suggestions)
+            state = follow_up_state(disease_row[0], final_suggestions, pending_offer=False)
+            return f"Based on your symptoms, you might be experiencing {disease_row[1].lower()}. {disease_row[2]} Here are some recommendations:\n{advice}", state
+            
+    except Exception:
+        logger.exception("Error in disease matching")
+        record_error("scoring")
+        return "I understand you're not feeling well. Please consult a healthcare provider if your symptoms persist or worsen.", None
 
 
 @router.post("/chat/", response_model=schemas.ChatMessageResponse)
@@ -157,17 +409,34 @@ async def chat_with_llm(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    db_user_message = models.ChatMessage(
-        user_id=current_user.id,
-        role="user",
-        content=request.message,
-        extracted_symptoms={},
-        recommendations={}
-    )
-    db.add(db_user_message)
-    db.commit()
-    db.refresh(db_user_message)
+    # Stage timings and counters below are labeled with this turn's model_choice
+    current_model_choice.set(request.model_choice)
+    observe_stage("auth", auth.last_auth_seconds.get())
+
+    # Rate limits and concurrency caps come first: a rejected turn does no work and saves nothing
+    with admission.admit(current_user.id, "chat", request.model_choice):
+        # Both messages of the turn are persisted together once the reply exists (one transaction
+        # or the write-behind queue); ids and timestamps are assigned without a read-back
+        user_message = message_writer.build(current_user.id, "user", request.message)
+        try:
+            bot_response_content, extracted_symptoms, recommendations = await _chat_reply(request, current_user, db, user_message)
+        except HTTPException:
+            await message_writer.persist(user_message)
+            raise
+
+        bot_message = message_writer.build(
+            current_user.id, "assistant", bot_response_content, extracted_symptoms, recommendations
+        )
+        await message_writer.persist(user_message, bot_message)
+        return bot_message
 
+
+async def _chat_reply(request: schemas.ChatRequest, current_user: models.User, db: Session,
+                      user_message: models.ChatMessage):
+    """
+    Produces the reply of one chat turn; blocking work (SQL, encode) runs on bounded executors.
+    :returns: (reply text, extracted_symptoms, recommendations)
+    """
     bot_response_content = ""
     extracted_symptoms: Dict[str, Any] = {}
     recommendations: Dict[str, Any] = {}
@@ -175,294 +444,254 @@ async def chat_with_llm(
     if request.model_choice == "openai":
         if not openai_client:
             raise HTTPException(status_code=503, detail="OpenAI API not configured (OPENAI_API_KEY missing).")
+        history_as_list = await db_executor.run(_recent_history, db, current_user.id, LLM_CONTEXT_MESSAGES, user_message)
         try:
-            chat_history = db.query(models.ChatMessage)\
-                .filter_by(user_id=current_user.id)\
-                .order_by(models.ChatMessage.timestamp).all()
-            history_as_list = [{"role": m.role, "content": m.content} for m in chat_history[-5:]]  # last 5 messages
-
-            bot_response_content = get_doctor_response(request.message, chat_history=history_as_list)
+            with stage_timer("generation"):
+                bot_response_content = await get_doctor_response(request.message, chat_history=history_as_list)
         except Exception as e:
+            record_error("generation")
             raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
     elif request.model_choice == "flan-t5":
-        user_text = request.message.lower().strip()
-
-        # -- FOLLOW-UP HANDLER: If user says "yes" after being offered advice, show tips for last disease --
-        last_bot_message = db.query(models.ChatMessage).filter_by(
-            user_id=current_user.id, role="assistant"
-        ).order_by(models.ChatMessage.timestamp.desc()).first()
-
-        yes_triggers = ["yes", "sure", "okay", "please", "go ahead", "yep", "yeah"]
-        if user_text.strip().lower() in yes_triggers and last_bot_message and (
-            "want to hear what you can do next" in last_bot_message.content.lower() or
-            "would you like some advice" in last_bot_message.content.lower()
-        ):
-            # Try to extract the disease name from last_bot_message
-            import re
-            disease_match = re.search(r"(?:like|have|is|consider\.|sometimes mean)\s+([A-Za-z\s\(\)\'\-]+)\.", last_bot_message.content)
-            if disease_match:
-                disease_name = disease_match.group(1).strip()
-                # Fetch disease info
-                disease_row = db.execute(
-                    text("SELECT id, name, description FROM diseases WHERE LOWER(name) LIKE :dname"),
-                    {"dname": f"%{disease_name.lower()}%"}
-                ).fetchone()
-                if disease_row:
-                    # Fetch suggestions for the disease
-                    suggestions = db.execute(
-                        text("SELECT text FROM suggestions WHERE disease_id = :did OR is_general_advice = TRUE LIMIT 5"),
-                        {"did": disease_row[0]}
-                    ).fetchall()
-                    # Filter suggestions
-                    specific_suggestions = [
-                        s[0] for s in suggestions
-                        if not s[0].lower().startswith("please consult")
-                        and not s[0].lower().startswith("it's always best")
-                        and not s[0].lower().startswith("stay hydrated")
-                        and len(s[0]) > 20
-                    ]
-                    advice = "\n".join(f"- {s}" for s in (specific_suggestions[:3] if specific_suggestions else [s[0] for s in suggestions[:3]]))
-                    bot_response_content = f"Here are a few things you can try:\n{advice}"
-                    db_bot_message = models.ChatMessage(
-                        role="assistant",
-                        content=bot_response_content,
-                        user_id=current_user.id,
-                    )
-                    db.add(db_bot_message)
-                    db.commit()
-                    db.refresh(db_bot_message)
-                    return db_bot_message
-            # If disease not found, fallback
-            bot_response_content = "Sorry, I couldn't find more details. Could you please rephrase your symptoms?"
-            db_bot_message = models.ChatMessage(
-                role="assistant",
-                content=bot_response_content,
-                user_id=current_user.id,
-            )
-            db.add(db_bot_message)
-            db.commit()
-            db.refresh(db_bot_message)
-            return db_bot_message
-        
-        # Handle greetings
-        if any(greet in user_text for greet in ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]):
-            bot_response_content = "Hello! I'm your health assistant. How can I help you today?"
-        else:
-            # Get disease and suggestions from database
-            disease_row, suggestions = retrieve_disease_info(request.message, db)
-            
-            print("DEBUG: disease_row =", disease_row)
-            print("DEBUG: suggestions =", suggestions)
-            
-            if disease_row and suggestions:
-                disease_name = disease_row[1]
-                disease_desc = disease_row[2]
-                
-                # Filter out generic "consult doctor" suggestions
-                specific_suggestions = [
-                    s for s in suggestions 
-                    if not s.lower().startswith("please consult") and 
-                       not s.lower().startswith("it's always best") and
-                       not s.lower().startswith("stay hydrated") and
-                       len(s) > 20  # Avoid very short generic responses
-                ]
-                
-                # If we have specific suggestions, use them
-                if specific_suggestions:
-                    # Take up to 2 specific suggestions
-                    selected_suggestions = specific_suggestions[:2]
-                    
-                    # Create a natural response
-                    if len(selected_suggestions) == 1:
-                        bot_response_content = f"Based on your symptoms, you might be experiencing {disease_name.lower()}. {selected_suggestions[0]}"
-                    else:
-                        suggestions_text = f"{selected_suggestions[0]} Additionally, {selected_suggestions[1].lower()}"
-                        bot_response_content = f"Based on your symptoms, you might be experiencing {disease_name.lower()}. {suggestions_text}"
-                
-                # If no specific suggestions, create a helpful response
-                else:
-                    # Get some general advice that's not too generic
-                    general_advice = db.execute(text(
-                        "SELECT text FROM suggestions WHERE is_general_advice=TRUE AND text NOT LIKE '%consult%' AND text NOT LIKE '%doctor%' ORDER BY random() LIMIT 1"
-                    )).fetchone()
-                    
-                    if general_advice:
-                        bot_response_content = f"Based on your symptoms, you might be experiencing {disease_name.lower()}. {disease_desc} {general_advice[0]}"
-                    else:
-                        bot_response_content = f"Based on your symptoms, you might be experiencing {disease_name.lower()}. {disease_desc} Remember to get plenty of rest and stay hydrated."
-            
-            # If no disease matched, provide helpful general advice
-            else:
-                # Get specific general advice
-                general_advice = db.execute(text(
-                    "SELECT text FROM suggestions WHERE is_general_advice=TRUE AND text NOT LIKE '%consult%' AND text NOT LIKE '%doctor%' ORDER BY random() LIMIT 2"
-                )).fetchall()
-                
-                if general_advice:
-                    if len(general_advice) == 1:
-                        bot_response_content = f"I understand you're not feeling well. {general_advice[0][0]}"
-                    else:
-                        bot_response_content = f"I understand you're not feeling well. {general_advice[0][0]} Also, {general_advice[1][0].lower()}"
-                else:
-                    bot_response_content = "I understand you're not feeling well. Make sure to get plenty of rest, stay hydrated, and consider consulting a healthcare provider if your symptoms persist or worsen."
+        bot_response_content, extracted_symptoms, recommendations, prompt = await _flan_t5_turn(request, current_user, db)
+        if prompt is not None:
+            bot_response_content = await _flan_rephrase(prompt, bot_response_content)
     elif request.model_choice == "embedding":
-        import traceback
+        bot_response_content, extracted_symptoms, recommendations = await _embedding_turn(request, current_user.id, db)
+    else:
+        raise HTTPException(status_code=400, detail="Invalid model_choice. Must be 'openai', 'flan-t5', or 'embedding'.")
+
+    return bot_response_content, extracted_symptoms, recommendations
+
+async def _flan_t5_turn(request: schemas.ChatRequest, current_user: models.User, db: Session):
+    """
+    Routes a flan-t5 message by intent and, for symptom reports, retrieves the keyword-lookup reply.
+    :returns: (reply text, extracted_symptoms, recommendations, rephrase prompt or None); see _flan_t5_reply()
+    """
+    routed = await _intent_reply(request, current_user.id, db)
+    if routed is not None:
+        return (*routed, None)
+    return await db_executor.run(_flan_t5_reply, request, current_user, db)
+
+
+async def _flan_tokens(prompt: Optional[str], fallback: str) -> AsyncIterator[str]:
+    """
+    FLAN-T5's rephrasing of `prompt` as it is generated, or `fallback` in one piece if there is no
+    prompt or generation fails before the first word.
+    """
+    generated = False
+    if prompt is not None:
         try:
-            user_text = request.message.lower().strip()
-            import re
+            with stage_timer("generation"):
+                async for chunk in generation_service().stream(prompt):
+                    generated = generated or bool(chunk.strip())
+                    yield chunk
+        except GenerationDeadlineExceeded:
+            record_fallback("generation_deadline")
+        except ExecutorSaturated:
+            record_fallback("generation_saturated")
+        except inference_client.InferenceServerUnavailable:
+            record_fallback("generation_unavailable")
+        except Exception:
+            logger.exception("FLAN-T5 generation failed")
+            record_error("generation")
+    if not generated:
+        yield fallback
+
+
+async def _openai_tokens(message: str, chat_history: List[Dict[str, str]]) -> AsyncIterator[str]:
+    """The OpenAI doctor reply as it streams in; an API error ends it with the error message."""
+    try:
+        async for token in stream_doctor_response(message, chat_history=chat_history):
+            yield token
+    except Exception as e:
+        record_error("generation")
+        yield f"OpenAI API error: {str(e)}"
 
-            # 1. Greeting
-            try:
-                greeting_tmpl = db.execute(text("SELECT text FROM templates WHERE template_type='greeting' AND is_active=TRUE LIMIT 1")).fetchone()
-                if re.match(r"^(hi|hello|hey|good morning|good afternoon|good evening)[\s\!\.\?\,]*$", user_text):
-                    bot_response_content = greeting_tmpl[0] if greeting_tmpl else "Hello! I'm your health assistant. How can I help you today?"
-                    # Early return for greetings
-                    db_bot_message = models.ChatMessage(
-                        role="assistant",
-                        content=bot_response_content,
-                        user_id=current_user.id,
-                    )
-                    db.add(db_bot_message)
-                    db.commit()
-                    db.refresh(db_bot_message)
-                    return db_bot_message
-            except Exception as e:
-                print(f"DEBUG: Error with greeting template: {e}")
-                if re.match(r"^(hi|hello|hey|good morning|good afternoon|good evening)[\s\!\.\?\,]*$", user_text):
-                    bot_response_content = "Hello! I'm your health assistant. How can I help you today?"
-                    # Early return for greetings
-                    db_bot_message = models.ChatMessage(
-                        role="assistant",
-                        content=bot_response_content,
-                        user_id=current_user.id,
-                    )
-                    db.add(db_bot_message)
-                    db.commit()
-                    db.refresh(db_bot_message)
-                    return db_bot_message
-
-            # 2. No health keywords
-            if not any(kw in user_text for kw in [
-                "pain", "headache", "fever", "throat", "sick", "symptom", "cold", "cough", "runny", "temperature",
-                "nausea", "stomach", "vomit", "ill", "tired", "fatigue", "diarrhea", "rash", "sore", "infection"
-            ]):
-                bot_response_content = "I'm here to help only with your health or wellness questions. Please describe your symptoms."
-                # Early return for non-health messages
-                db_bot_message = models.ChatMessage(
-                    role="assistant",
-                    content=bot_response_content,
-                    user_id=current_user.id,
-                )
-                db.add(db_bot_message)
-                db.commit()
-                db.refresh(db_bot_message)
-                return db_bot_message
-
-            # 3. Try to match a disease
+
+async def _embedding_turn(request: schemas.ChatRequest, user_id: int, db: Session):
+    """
+    Routes an embedding message by intent and, for symptom reports, answers with the templated reply
+    for the best hybrid-ranked disease.
+    :returns: (reply text, extracted_symptoms, recommendations)
+    """
+    extracted_symptoms: Dict[str, Any] = {}
+    recommendations: Dict[str, Any] = {}
+    try:
+        routed = await _intent_reply(request, user_id, db)
+        if routed is not None:
+            return routed
+
+        # Try to match a disease (cached per normalized message and knowledge-base version)
+        question = normalize_message(request.message)
+        cache_key = _embedding_cache_key(question)
+        retrieved = retrieval_cache.get(cache_key)
+        if retrieved is None:
             try:
-                disease_row, suggestions = find_best_disease_by_embedding(request.message, db, embedder)
-                
-                if disease_row is None:
-                    # Fallback response without templates
-                    try:
-                        advice = "\n".join(f"- {s[0]}" for s in db.execute(text("SELECT text FROM suggestions WHERE is_general_advice=TRUE ORDER BY random() LIMIT 3")).fetchall())
-                        bot_response_content = f"I understand you're not feeling well. Here are some general recommendations:\n{advice}"
-                    except Exception as e:
-                        print(f"DEBUG: Error with fallback suggestions: {e}")
-                        bot_response_content = "I understand you're not feeling well. Please consult a healthcare provider if your symptoms persist or worsen."
+                if inference_client.inference_client is not None:
+                    retrieved = await _rank_remotely(question)
                 else:
-                    # Try to use templates, fallback to simple response if templates fail
-                    try:
-                        tmpl = db.execute(
-                            text("""
-                                SELECT text FROM templates 
-                                WHERE template_type='disease' 
-                                AND is_active=TRUE 
-                                AND (disease_id=:did OR disease_id IS NULL)
-                                ORDER BY random() LIMIT 1
-                            """),
-                            {"did": disease_row[0]}
-                        ).fetchone()
-                        
-                        # Try to pick a random, human-like template (disease-specific or general)
-                        tmpl = db.execute(
-                            text("""
-                                SELECT text FROM templates 
-                                WHERE template_type='disease' 
-                                AND is_active=TRUE 
-                                AND (disease_id=:did OR disease_id IS NULL)
-                                ORDER BY random() LIMIT 1
-                            """),
-                            {"did": disease_row[0]}
-                        ).fetchone()
-
-                        if tmpl:
-                            tmpl_text = tmpl[0]
-                        else:
-                            tmpl_text = "Based on your symptoms, the likely cause is {disease_name}: {disease_desc}.\nHere’s what you can try:\n{advice}"
-
-                        tmpl_text = tmpl_text.replace("{disease_name}", disease_row[1]).replace("{disease_desc}", disease_row[2])
-
-                        # Filter out generic suggestions and use specific ones
-                        specific_suggestions = [
-                            s for s in suggestions 
-                            if not s.lower().startswith("please consult") and 
-                            not s.lower().startswith("it's always best") and
-                            not s.lower().startswith("stay hydrated") and
-                            len(s) > 20  # Avoid very short generic responses
-                        ]
-
-                        # Use specific suggestions if available, otherwise use all suggestions
-                        final_suggestions = specific_suggestions[:3] if specific_suggestions else suggestions[:3]
-
-                        # If still empty, add some general advice (guaranteed to never be blank)
-                        if not final_suggestions:
-                            advice_rows = db.execute(text(
-                                "SELECT text FROM suggestions WHERE is_general_advice=TRUE AND text NOT LIKE '%consult%' AND text NOT LIKE '%doctor%' ORDER BY random() LIMIT 2"
-                            )).fetchall()
-                            final_suggestions = [s[0] for s in advice_rows] if advice_rows else ["Try to get plenty of rest and stay hydrated."]
-
-                        advice = "\n".join(f"- {s}" for s in final_suggestions)
-                        tmpl_text = tmpl_text.replace("{advice}", advice)
-                        bot_response_content = tmpl_text
-                        
-                    except Exception as e:
-                        print(f"DEBUG: Error with disease templates: {e}")
-                        # Simple fallback response with better suggestions
-                        specific_suggestions = [
-                            s for s in suggestions 
-                            if not s.lower().startswith("please consult") and 
-                               not s.lower().startswith("it's always best") and
-                               not s.lower().startswith("stay hydrated") and
-                               len(s) > 20
-                        ]
-                        final_suggestions = specific_suggestions[:2] if specific_suggestions else suggestions[:2]
-                        advice = "\n".join(f"- {s}" for s in final_suggestions)
-                        bot_response_content = f"Based on your symptoms, you might be experiencing {disease_row[1].lower()}. {disease_row[2]} Here are some recommendations:\n{advice}"
-                        
-            except Exception as e:
-                print(f"DEBUG: Error in disease matching: {e}")
-                bot_response_content = "I understand you're not feeling well. Please consult a healthcare provider if your symptoms persist or worsen."
-                
-        except Exception as e:
-            print(f"DEBUG: General embedding model error: {e}")
-            traceback.print_exc()
-            bot_response_content = "I'm having trouble processing your request right now. Please try again or use a different model."
-    else:
-        raise HTTPException(status_code=400, detail="Invalid model_choice. Must be 'openai', 'flan-t5', or 'embedding'.")
+                    with stage_timer("encode"):
+                        user_vec = await encode_batcher.encode(question)
+                    # Off the event loop: the first call builds the disease index with the embedder
+                    retrieved = await inference_executor.run(find_best_disease_by_embedding, question, user_vec)
+                if retrieved[0] is not None:
+                    # Re-keyed: the first request is what builds the index and sets its version
+                    retrieval_cache.set(_embedding_cache_key(question), retrieved)
+            except (ExecutorSaturated, inference_client.InferenceServerUnavailable):
+                raise
+            except Exception:
+                logger.exception("Error in disease matching")
+                record_error("encode")
+        if retrieved is None:
+            bot_response_content = "I understand you're not feeling well. Please consult a healthcare provider if your symptoms persist or worsen."
+        else:
+            # Templates and suggestion order are still randomized per reply
+            disease_row, suggestions, ranking = retrieved
+            bot_response_content, follow_up = _embedding_reply(disease_row, suggestions)
+            if ranking is not None:
+                extracted_symptoms = ranking.extracted_symptoms()
+                recommendations = ranking.recommendations(suggestions)
+            if follow_up is not None:
+                recommendations["follow_up"] = follow_up
+    except (ExecutorSaturated, inference_client.InferenceServerUnavailable):
+        raise
+    except Exception:
+        logger.exception("General embedding model error")
+        record_error("embedding")
+        bot_response_content = "I'm having trouble processing your request right now. Please try again or use a different model."
+    return bot_response_content, extracted_symptoms, recommendations
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), separators=(',', ':'))}\n\n"
+
+
+async def _single(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+def _matched_payload(extracted_symptoms: Dict[str, Any], recommendations: Dict[str, Any]) -> Dict[str, Any]:
+    """Data of the "matched" event: the disease the reply is about (None if no match) and the symptoms found."""
+    disease_id = recommendations.get("follow_up", {}).get("disease_id")
+    disease_row = knowledge_base.get().disease(disease_id) if disease_id is not None else None
+    return {
+        "disease": {"id": disease_row[0], "name": disease_row[1], "description": disease_row[2]} if disease_row else None,
+        "extracted_symptoms": extracted_symptoms,
+    }
+
+
+async def _open_turn(request: schemas.ChatRequest, current_user: models.User, db: Session) -> AsyncIterator:
+    """
+    Starts a streamed chat turn: admission, then everything up to the first token (history, retrieval).
+    Failures up to here are HTTP errors like those of /ai/chat/.
+    :returns: The turn's (event, data) pairs, "matched", "token"... and "done"; see stream_chat().
+    """
+    current_model_choice.set(request.model_choice)
+    observe_stage("auth", auth.last_auth_seconds.get())
+    ticket = admission.admit(current_user.id, "chat", request.model_choice)
+    user_message = message_writer.build(current_user.id, "user", request.message)
+    extracted_symptoms: Dict[str, Any] = {}
+    recommendations: Dict[str, Any] = {}
+    try:
+        if request.model_choice == "openai":
+            if not openai_client:
+                raise HTTPException(status_code=503, detail="OpenAI API not configured (OPENAI_API_KEY missing).")
+            history_as_list = await db_executor.run(_recent_history, db, current_user.id, LLM_CONTEXT_MESSAGES, user_message)
+            tokens = _openai_tokens(request.message, history_as_list)
+        elif request.model_choice == "flan-t5":
+            fallback, extracted_symptoms, recommendations, prompt = await _flan_t5_turn(request, current_user, db)
+            tokens = _flan_tokens(prompt, fallback)
+        elif request.model_choice == "embedding":
+            reply, extracted_symptoms, recommendations = await _embedding_turn(request, current_user.id, db)
+            tokens = _single(reply)
+        else:
+            raise HTTPException(status_code=400, detail="Invalid model_choice. Must be 'openai', 'flan-t5', or 'embedding'.")
+    except HTTPException:
+        ticket.release()
+        await message_writer.persist(user_message)
+        raise
+    except BaseException:
+        ticket.release()
+        raise
+    user_id = current_user.id
+
+    async def events():
+        # Routed replies (greetings, follow-ups, ...) ran no retrieval and have nothing to announce
+        if recommendations:
+            yield "matched", _matched_payload(extracted_symptoms, recommendations)
+        parts = []
+        completed = False
+        try:
+            async for chunk in tokens:
+                parts.append(chunk)
+                yield "token", {"text": chunk}
+            completed = True
+        finally:
+            # What the client saw is what gets saved, also when it disconnected mid-reply (then
+            # only the part sent so far). Shielded: on a disconnect the request task is being cancelled.
+            reply = "".join(parts).strip()
+            messages = [user_message]
+            if completed or reply:
+                messages.append(message_writer.build(user_id, "assistant", reply, extracted_symptoms, recommendations))
+            await asyncio.shield(message_writer.persist(*messages))
+        yield "done", schemas.ChatMessageResponse.model_validate(messages[-1])
+
+    return ticket.hold_while(events())
+
+
+async def _sse_events(events: AsyncIterator) -> AsyncIterator[str]:
+    async for event, data in events:
+        yield _sse(event, data)
+
+
+async def _reply_text(events: AsyncIterator) -> AsyncIterator[str]:
+    async for event, data in events:
+        if event == "token":
+            yield data["text"]
 
-    db_bot_message = models.ChatMessage(
-        user_id=current_user.id,
-        role="assistant",
-        content=bot_response_content,
-        extracted_symptoms=extracted_symptoms,
-        recommendations=recommendations
+
+@router.post("/chat/stream/")
+async def stream_chat(
+    request: schemas.ChatRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    /ai/chat/ for every model_choice as server-sent events:
+    - `matched` {"disease", "extracted_symptoms"}: as soon as retrieval has ranked the diseases (flan-t5, embedding)
+    - `token` {"text"}: pieces of the reply as they are generated; templated replies come in one piece
+    - `done`: the saved assistant message, as /ai/chat/ returns it
+    Failures before the first event are HTTP errors like those of /ai/chat/.
+    """
+    events = await _open_turn(request, current_user, db)
+    # No-cache and no proxy buffering, or events would arrive all at once
+    return StreamingResponse(
+        _sse_events(events), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    db.add(db_bot_message)
-    db.commit()
-    db.refresh(db_bot_message)
 
-    return db_bot_message
+
+@router.post("/chat/openai/stream/")
+async def stream_chat_with_openai(
+    request: schemas.ChatRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """/ai/chat/stream/ for model_choice "openai" as plain text: only the reply, while it is generated."""
+    request = request.model_copy(update={"model_choice": "openai"})
+    events = await _open_turn(request, current_user, db)
+    return StreamingResponse(_reply_text(events), media_type="text/plain; charset=utf-8")
+
+
+@router.post("/chat/flan-t5/stream/")
+async def stream_chat_with_flan(
+    request: schemas.ChatRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """/ai/chat/stream/ for model_choice "flan-t5" as plain text: only the reply, word by word as it is generated."""
+    request = request.model_copy(update={"model_choice": "flan-t5"})
+    events = await _open_turn(request, current_user, db)
+    return StreamingResponse(_reply_text(events), media_type="text/plain; charset=utf-8")
 
 # --- Embedding Endpoint (leave as is for now, we’ll wire up MiniLM later) ---
 @router.post("/embed/", response_model=schemas.EmbeddingResponse)
@@ -473,32 +702,138 @@ async def get_embedding(
     # Make sure input is not empty
     if not request.text or not request.text.strip():
         raise HTTPException(status_code=400, detail="Input text is empty.")
-    # Compute embedding
-    embedding = embedder.encode(request.text)
+    # Compute embedding (batched with concurrent requests on the inference executor)
+    with admission.admit(current_user.id, "embed", "embed"):
+        embedding = await encode_batcher.encode(request.text)
     # Convert to list for JSON response
     return {"embedding": embedding.tolist()}
 
+@router.get("/embed/stats/")
+async def embedding_batch_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Micro-batching metrics of the shared encode queue (batch sizes, queue depth, wait times).
+    """
+    return encode_batcher.stats()
+
+@router.get("/generation/stats/")
+async def generation_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Batching metrics of the FLAN-T5 generation service (batch sizes, tokens/s, deadlines hit).
+    """
+    return generation_service().stats()
+
+def encode_history_cursor(message: models.ChatMessage) -> str:
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_history_cursor(cursor: str):
+    """:returns: (timestamp, id) of the message the cursor points at. Raises ValueError if malformed."""
+    raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    timestamp, message_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(timestamp), int(message_id)
+
+
+def _chat_history_page(db: Session, user_id: int, limit: int, before=None):
+    """
+    One page of history using keyset pagination on (timestamp, id).
+    :returns: (messages oldest-first, cursor for the next older page or None)
+    """
+    with stage_timer("history_load", model_choice="history"):
+        query = db.query(models.ChatMessage).filter(models.ChatMessage.user_id == user_id)
+        if before is not None:
+            query = query.filter(tuple_(models.ChatMessage.timestamp, models.ChatMessage.id) < tuple_(*before))
+        rows = query.order_by(models.ChatMessage.timestamp.desc(), models.ChatMessage.id.desc())\
+            .limit(limit + 1).all()
+    # Messages still queued for writing belong on the newest pages
+    pending = message_writer.pending(user_id)
+    if before is not None:
+        before_key = (as_utc(before[0]), before[1])
+        pending = [m for m in pending if history_key(m) < before_key]
+    rows = merge_pending(rows, pending)[-(limit + 1):]
+    has_more = len(rows) > limit
+    rows = rows[-limit:]
+    next_cursor = encode_history_cursor(rows[0]) if has_more else None
+    return rows, next_cursor
+
 @router.get("/chat/history/", response_model=List[schemas.ChatMessageResponse])
 async def chat_history(
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    before: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    messages = db.query(models.ChatMessage).filter_by(user_id=current_user.id).order_by(models.ChatMessage.timestamp).all()
+    """
+    The user's most recent `limit` messages, oldest first.
+
+    If older messages exist, the `X-Next-Cursor` response header holds a cursor;
+    pass it back as `before` to fetch the page preceding this one.
+    """
+    cursor = None
+    if before:
+        try:
+            cursor = decode_history_cursor(before)
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(status_code=400, detail="Invalid history cursor.")
+    messages, next_cursor = await db_executor.run(_chat_history_page, db, current_user.id, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return messages
 
+@router.get("/executors/")
+async def executor_status(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Worker, queue and rejection counts of the DB and inference executors.
+    """
+    return executor_stats()
+
+@router.get("/cache/")
+async def retrieval_cache_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Size, hit/miss counters and evictions of the disease retrieval cache.
+    """
+    return retrieval_cache.stats()
+
+@router.get("/knowledge-base/")
+async def knowledge_base_info(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Version (content hash) of each in-memory knowledge-base snapshot and the size of the knowledge base.
+    """
+    return knowledge_base_status()
+
+@router.post("/knowledge-base/refresh/")
+async def refresh_knowledge_base_now(
+    force: bool = False,
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Re-reads the medical tables and swaps in rebuilt snapshots for those that changed. Admin only.
+    Use after reseeding when change notifications are unavailable; `force` rebuilds every snapshot built so far.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only administrators can refresh the knowledge base.")
+    rebuilt = await db_executor.run(refresh_knowledge_base, force)
+    return {"rebuilt": rebuilt, "versions": knowledge_base_status()}
+
+@router.get("/models/")
+async def model_status(current_user: models.User = Depends(auth.get_current_user)):
+    """
+    Load state, load time, weight footprint and idle time of each local model.
+    """
+    return model_registry.status()
+
 @router.get("/test-embed/")
 def test_embed(prompt: str = "test"):
     try:
-        print(f"Received prompt for embedding: {prompt}")
+        logger.debug("Received prompt for embedding: %s", prompt)
         try:
-            print(f"Generating embedding...")
-            vector = embedder.encode(prompt)
-            print(f"Vector generated: {vector[:5]}...")  # preview only
+            vector = get_embedder().encode(prompt)
+            logger.debug("Vector generated: %s...", vector[:5])  # preview only
             return {"message": "Embedding worked", "vector": vector}
         except Exception as e:
-            print(f"Error during embedding: {e}")
+            logger.exception("Error during embedding")
             return {"message": "Embedding failed", "error": str(e)}
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error in test_embed")
         return {"error": str(e)}
\ No newline at end of file
@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# How often (in seconds) background pollers re-check their source tables for changes
+KB_REFRESH_SECONDS = float(os.getenv("KB_REFRESH_SECONDS", 60))
+
+
+def fingerprint_rows(rows) -> str:
+    """Returns a short, stable content hash for a list of DB rows."""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()[:16]
+
+
+class RefreshingSnapshot:
+    """
+    Holds an immutable value derived from one or more DB tables and rebuilds it when they change.
+
+    :param name: Label used in log lines.
+    :param load_rows: Callable(db) returning the source rows (must be deterministic in order).
+    :param build: Callable(rows, version) returning the immutable value to serve.
+    :param poll_seconds: Interval of the background change check. 0 disables polling.
+
+    Readers call get() and never block on a rebuild once the first value exists:
+    a new value is fully built off to the side and then swapped in with a single assignment.
+    """
+
+    def __init__(self, name, load_rows, build, poll_seconds: float = KB_REFRESH_SECONDS):
+        self.name = name
+        self._load_rows = load_rows
+        self._build = build
+        self._poll_seconds = poll_seconds
+        self._value = None
+        self._version = None
+        self._build_lock = threading.Lock()
+        self._poller = None
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def built(self) -> bool:
+        """True once a value exists (get() has been called or a refresh has built one)."""
+        return self._value is not None
+
+    def get(self):
+        """Returns the current value, building it synchronously on first use."""
+        value = self._value
+        if value is None:
+            self.refresh()
+            value = self._value
+        self._ensure_poller()
+        return value
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Re-reads the source rows and rebuilds the value if their content hash changed.
+        :returns: True if a new value was swapped in.
+        """
+        with self._build_lock:
+            db = SessionLocal()
+            try:
+                rows = [tuple(r) for r in self._load_rows(db)]
+            finally:
+                db.close()
+
+            version = fingerprint_rows(rows)
+            if not force and self._value is not None and version == self._version:
+                return False
+
+            started = time.perf_counter()
+            value = self._build(rows, version)
+            # Single reference swap: concurrent readers see either the old or the new value
+            self._value, self._version = value, version
+            logger.info("Rebuilt %s (version %s, %d rows) in %.2fs", self.name, version, len(rows), time.perf_counter() - started)
+            return True
+
+    def _ensure_poller(self):
+        if self._poller is not None or self._poll_seconds <= 0:
+            return
+        with self._build_lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name=f"{self.name}-refresh", daemon=True)
+                self._poller.start()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self._poll_seconds)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Background refresh of %s failed", self.name)
@@ -0,0 +1,120 @@
+from collections import deque
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy import text
+
+from .snapshot import RefreshingSnapshot
+
+
+class SymptomMatch(NamedTuple):
+    symptom_id: int
+    keyword: str
+    start: int
+    end: int
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _is_boundary(text_: str, pos: int) -> bool:
+    """Same rule as regex \\b: a word character on exactly one side of `pos`."""
+    before = pos > 0 and _is_word_char(text_[pos - 1])
+    after = pos < len(text_) and _is_word_char(text_[pos])
+    return before != after
+
+
+class SymptomMatcher:
+    """
+    Aho-Corasick automaton over every symptom keyword (and symptom name).
+
+    One left-to-right pass over the lowercased text reports all keyword occurrences,
+    including overlapping ones, which are then filtered to whole-word matches. This
+    keeps the semantics of the old per-keyword `\\bkeyword\\b` regex scan.
+    """
+
+    def __init__(self, rows, version=None):
+        """
+        :param rows: Iterable of (symptom_id, name, keywords_csv) rows from the symptoms table.
+        """
+        self.version = version
+        # Trie stored as parallel lists indexed by state number
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[tuple]] = [[]]  # state -> [(keyword, (symptom_id, ...))]
+
+        keyword_symptoms: Dict[str, list] = {}
+        self.symptom_names: Dict[int, str] = {}
+        for symptom_id, name, keywords in rows:
+            self.symptom_names[symptom_id] = name
+            keyword_list = [kw.strip().lower() for kw in (keywords or "").split(",") if kw.strip()]
+            keyword_list.append(name.lower())
+            for kw in keyword_list:
+                ids = keyword_symptoms.setdefault(kw, [])
+                if symptom_id not in ids:
+                    ids.append(symptom_id)
+
+        for kw, ids in keyword_symptoms.items():
+            self._add(kw, tuple(ids))
+        self._link()
+        self.keyword_count = len(keyword_symptoms)
+
+    def _add(self, keyword: str, symptom_ids: tuple):
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((keyword, symptom_ids))
+
+    def _link(self):
+        """Breadth-first construction of failure links and merged outputs."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, question: str) -> List[SymptomMatch]:
+        """Every whole-word keyword occurrence in `question`, ordered by end position."""
+        text_ = question.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        state = 0
+        for i, ch in enumerate(text_):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for kw, symptom_ids in out[state]:
+                    start = end - len(kw)
+                    if _is_boundary(text_, start) and _is_boundary(text_, end):
+                        for sid in symptom_ids:
+                            matches.append(SymptomMatch(sid, kw, start, end))
+        return matches
+
+    def match(self, question: str) -> Dict[int, List[SymptomMatch]]:
+        """Groups find_all() results by symptom id."""
+        grouped: Dict[int, List[SymptomMatch]] = {}
+        for m in self.find_all(question):
+            grouped.setdefault(m.symptom_id, []).append(m)
+        return grouped
+
+
+def _load_symptom_rows(db):
+    return db.execute(text("SELECT id, name, keywords FROM symptoms ORDER BY id")).fetchall()
+
+
+# Shared per-process matcher, rebuilt in the background when the symptoms table changes
+symptom_matcher = RefreshingSnapshot("symptom matcher", _load_symptom_rows, SymptomMatcher)
@@ -18,6 +18,17 @@ CREATE TABLE diseases (
     confidence_score NUMERIC(3,2)
 );
 
+-- Table: disease_embeddings (precomputed vectors per embedding model, see app/disease_index.py)
+CREATE TABLE disease_embeddings (
+    disease_id INTEGER NOT NULL REFERENCES diseases(id) ON DELETE CASCADE,
+    model VARCHAR(128) NOT NULL,
+    text_hash VARCHAR(64) NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BYTEA NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (disease_id, model)
+);
+
 -- Table: symptoms
 CREATE TABLE symptoms (
     id SERIAL PRIMARY KEY,
@@ -59,4 +70,6 @@ CREATE TABLE chat_messages (
     extracted_symptoms JSONB,
     recommendations JSONB,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+CREATE INDEX ix_chat_messages_user_timestamp_id ON chat_messages (user_id, timestamp, id);
\ No newline at end of file
@@ -0,0 +1,32 @@
+-- Knowledge-base change notifications (Postgres only).
+-- Every write to a knowledge-base table sends one NOTIFY per statement on the kb_changed channel
+-- (KB_NOTIFY_CHANNEL), so web workers refresh their in-memory snapshots without waiting for a poll.
+-- Runs after schema.sql and seed.sql in docker-entrypoint-initdb.d (files run in name order);
+-- on an existing database run it once with `python -m scripts.install_kb_triggers`.
+
+CREATE OR REPLACE FUNCTION notify_kb_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('kb_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS diseases_notify_kb_changed ON diseases;
+CREATE TRIGGER diseases_notify_kb_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON diseases
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_kb_changed();
+
+DROP TRIGGER IF EXISTS symptoms_notify_kb_changed ON symptoms;
+CREATE TRIGGER symptoms_notify_kb_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON symptoms
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_kb_changed();
+
+DROP TRIGGER IF EXISTS disease_symptoms_notify_kb_changed ON disease_symptoms;
+CREATE TRIGGER disease_symptoms_notify_kb_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON disease_symptoms
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_kb_changed();
+
+DROP TRIGGER IF EXISTS suggestions_notify_kb_changed ON suggestions;
+CREATE TRIGGER suggestions_notify_kb_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON suggestions
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_kb_changed();
+
+DROP TRIGGER IF EXISTS templates_notify_kb_changed ON templates;
+CREATE TRIGGER templates_notify_kb_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON templates
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_kb_changed();
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Embedder latency / throughput benchmark.
+
+Loads each backend in turn and times encode() at several batch sizes over the
+labeled queries, reporting p50/p95 latency per call, texts per second, load
+time and the process RSS growth caused by loading the model:
+
+    python -m scripts.bench_embedder --backends onnx,torch --batch-sizes 1,8,32
+"""
+
+import argparse
+import gc
+import json
+import resource
+import statistics
+import time
+
+from app.routers.llm_models import load_embedder
+from scripts.embedder_parity import DEFAULT_QUERIES
+
+
+def _rss_mb() -> float:
+    # Peak RSS; ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench(model, texts, batch_size: int, rounds: int):
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    for batch in batches[:2]:
+        model.encode(batch)  # warm-up
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for batch in batches:
+            t0 = time.perf_counter()
+            model.encode(batch)
+            latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (
+        statistics.median(latencies),
+        latencies[int(0.95 * (len(latencies) - 1))],
+        rounds * len(texts) / elapsed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="onnx,torch", help="Comma-separated backends to compare")
+    parser.add_argument("--batch-sizes", default="1,8,32", help="Comma-separated encode() batch sizes")
+    parser.add_argument("--rounds", type=int, default=5, help="Passes over the query set per batch size")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="JSON list of {query, disease}")
+    args = parser.parse_args()
+
+    with open(args.queries) as f:
+        texts = [item["query"] for item in json.load(f)]
+    # Enough texts to fill the largest batch a few times
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    while len(texts) < 4 * max(batch_sizes):
+        texts = texts * 2
+
+    # Peak RSS only grows, so list the smaller backend first for a meaningful delta
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        model = load_embedder(backend)
+        load_seconds = time.perf_counter() - started
+        print(f"{backend}: loaded in {load_seconds:.2f}s, peak RSS +{_rss_mb() - rss_before:.0f} MB")
+        for batch_size in batch_sizes:
+            p50, p95, rate = bench(model, texts, batch_size, args.rounds)
+            print(f"  batch {batch_size:>3}: p50 {p50 * 1000:8.2f} ms  p95 {p95 * 1000:8.2f} ms  {rate:8.1f} texts/s")
+        del model
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main()
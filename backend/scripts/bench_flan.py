@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+FLAN-T5 generation benchmark.
+
+For each batch size, fires that many concurrent rephrase prompts at a
+FlanGenerator configured to batch exactly that many, and reports time to first
+word, full reply latency (p50/p95) and aggregate generated tokens per second:
+
+    python -m scripts.bench_flan --batch-sizes 1,2,4,8,16 --rounds 3
+
+Uses the same model loader as the app, so FLAN_QUANTIZE / FLAN_TORCH_THREADS apply.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.flan_generator import FlanGenerator, rephrase_prompt
+
+# (disease, description, suggestions) in the shape the chat handler builds them
+SAMPLE_FACTS = [
+    ("Common Cold", "A viral infection of your nose and throat.",
+     ["Get plenty of rest and drink fluids.", "Use saline nasal drops to relieve congestion."]),
+    ("Migraine", "A neurological condition with intense, often one-sided headaches.",
+     ["Rest in a quiet, dark room.", "Apply a cold compress to your forehead."]),
+    ("Gastroenteritis", "Inflammation of the stomach and intestines causing nausea and diarrhea.",
+     ["Sip water or an oral rehydration solution.", "Eat bland foods such as toast and rice."]),
+    ("Strep Throat", "A bacterial infection that makes your throat sore and scratchy.",
+     ["See a doctor for a strep test.", "Gargle with warm salt water."]),
+]
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+async def _one(generator: FlanGenerator, prompt: str, max_new_tokens: int):
+    started = time.perf_counter()
+    first = None
+    async for _ in generator.stream(prompt, max_new_tokens=max_new_tokens, deadline_seconds=600):
+        if first is None:
+            first = time.perf_counter() - started
+    return first if first is not None else time.perf_counter() - started, time.perf_counter() - started
+
+
+async def bench(batch_size: int, rounds: int, max_new_tokens: int):
+    # A long max wait so every round forms exactly one full batch
+    generator = FlanGenerator(max_batch_size=batch_size, max_wait_ms=200, max_queue=batch_size * 2)
+    prompts = [rephrase_prompt(*SAMPLE_FACTS[i % len(SAMPLE_FACTS)]) for i in range(batch_size)]
+    await generator.generate(prompts[0], max_new_tokens=4, deadline_seconds=600)  # load model / warm up
+    tokens_before = generator.stats()["tokens"]
+
+    first_word, latency = [], []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        results = await asyncio.gather(*(_one(generator, p, max_new_tokens) for p in prompts))
+        first_word.extend(r[0] for r in results)
+        latency.extend(r[1] for r in results)
+    elapsed = time.perf_counter() - started
+    tokens = generator.stats()["tokens"] - tokens_before
+    return first_word, latency, tokens / elapsed
+
+
+async def run(args):
+    print(f"{'batch':>5}  {'first word p50':>14}  {'reply p50':>10}  {'reply p95':>10}  {'tokens/s':>9}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        first_word, latency, rate = await bench(batch_size, args.rounds, args.max_new_tokens)
+        print(
+            f"{batch_size:>5}  {statistics.median(first_word) * 1000:>11.0f} ms  "
+            f"{statistics.median(latency) * 1000:>7.0f} ms  {_percentile(latency, 0.95) * 1000:>7.0f} ms  "
+            f"{rate:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16", help="Comma-separated batch sizes")
+    parser.add_argument("--rounds", type=int, default=3, help="Batches generated per batch size")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="max_new_tokens per reply")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
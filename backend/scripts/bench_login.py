@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Login throughput benchmark.
+
+In-process mode (default) measures bcrypt verifications per second through a
+BoundedExecutor at 1, 2, 4, ... workers up to the core count, together with the
+worst event-loop stall seen while the burst runs:
+
+    python -m scripts.bench_login --logins 64
+
+HTTP mode fires concurrent POST /auth/token requests at a running backend
+(the user is registered first if needed):
+
+    python -m scripts.bench_login --url http://localhost:8000 --logins 200 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from passlib.context import CryptContext
+
+from app.executors import BoundedExecutor
+
+PASSWORD = "bench-password"
+
+
+async def _loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Largest delay beyond `interval` between scheduled wake-ups of the event loop."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def bench_pool(workers: int, logins: int, hashed: str, pwd_context: CryptContext):
+    executor = BoundedExecutor("bench", workers, logins)
+    stop = asyncio.Event()
+    lag = asyncio.create_task(_loop_lag(stop))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(executor.run(pwd_context.verify, PASSWORD, hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    assert all(results)
+    return logins / elapsed, await lag
+
+
+async def bench_inline(logins: int, hashed: str, pwd_context: CryptContext):
+    """The old behaviour: verify() called directly on the event loop."""
+    stop = asyncio.Event()
+    lag = asyncio.create_task(_loop_lag(stop))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    for _ in range(logins):
+        pwd_context.verify(PASSWORD, hashed)
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return logins / elapsed, await lag
+
+
+async def run_in_process(args):
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    hashed = pwd_context.hash(PASSWORD)
+    cores = os.cpu_count() or 1
+
+    rate, lag = await bench_inline(args.logins, hashed, pwd_context)
+    print(f"{'inline (event loop)':>22}: {rate:8.1f} logins/s   max loop stall {lag * 1000:8.1f} ms")
+
+    workers = 1
+    while True:
+        rate, lag = await bench_pool(workers, args.logins, hashed, pwd_context)
+        print(f"{f'pool, {workers} worker(s)':>22}: {rate:8.1f} logins/s   max loop stall {lag * 1000:8.1f} ms")
+        if workers >= cores:
+            break
+        workers = min(workers * 2, cores)
+
+
+async def run_http(args):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        await client.post("/auth/register/", json={
+            "username": args.username, "email": f"{args.username}@example.com", "password": PASSWORD,
+        })
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def login():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/auth/token", data={"username": args.username, "password": PASSWORD})
+                latencies.append(time.perf_counter() - started)
+                return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{args.logins} logins, concurrency {args.concurrency}: {args.logins / elapsed:.1f} logins/s")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+    print("status codes:", {code: statuses.count(code) for code in sorted(set(statuses))})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64, help="Number of password verifications / logins")
+    parser.add_argument("--url", help="Base URL of a running backend; enables HTTP mode")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent requests in HTTP mode")
+    parser.add_argument("--username", default="bench_login_user", help="Account used in HTTP mode")
+    args = parser.parse_args()
+    asyncio.run(run_http(args) if args.url else run_in_process(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Parity check of an embedder backend against the fp32 torch model.
+
+Encodes the labeled queries (scripts/data/labeled_queries.json) and the disease
+texts from the database with both backends and reports:
+
+  * cosine similarity between the two backends' vectors (mean / min / p5)
+  * top-1 disease agreement: how often both backends pick the same disease
+  * top-1 accuracy of each backend against the labels
+
+    python -m scripts.embedder_parity --candidate onnx
+
+Exits non-zero when mean cosine or top-1 agreement fall below the thresholds.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from app.database import SessionLocal
+from app.disease_index import _load_disease_rows, disease_text, normalize_rows
+from app.routers.llm_models import load_embedder
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(__file__), "data", "labeled_queries.json")
+
+
+def _encode(model, texts):
+    return normalize_rows(np.asarray(model.encode(texts), dtype=np.float32))
+
+
+def _top1(queries: np.ndarray, diseases: np.ndarray) -> np.ndarray:
+    return np.argmax(queries @ diseases.T, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reference", default="torch", help="Reference backend (fp32)")
+    parser.add_argument("--candidate", default="onnx", help="Backend under test")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="JSON list of {query, disease}")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Required mean cosine similarity")
+    parser.add_argument("--min-agreement", type=float, default=0.95, help="Required top-1 agreement")
+    args = parser.parse_args()
+
+    with open(args.queries) as f:
+        labeled = json.load(f)
+    db = SessionLocal()
+    try:
+        rows = _load_disease_rows(db)
+    finally:
+        db.close()
+    if not rows:
+        sys.exit("No diseases in the database; load database/seed.sql first")
+
+    names = [r[1] for r in rows]
+    texts = [disease_text(r[1], r[2]) for r in rows]
+    queries = [item["query"] for item in labeled]
+    labels = np.array([names.index(item["disease"]) if item["disease"] in names else -1 for item in labeled])
+
+    results = {}
+    for backend in (args.reference, args.candidate):
+        model = load_embedder(backend)
+        results[backend] = (_encode(model, queries), _encode(model, texts))
+        del model
+
+    ref_queries, ref_diseases = results[args.reference]
+    cand_queries, cand_diseases = results[args.candidate]
+    cosines = np.concatenate([
+        np.sum(ref_queries * cand_queries, axis=1),
+        np.sum(ref_diseases * cand_diseases, axis=1),
+    ])
+    ref_top1 = _top1(ref_queries, ref_diseases)
+    cand_top1 = _top1(cand_queries, cand_diseases)
+    agreement = float(np.mean(ref_top1 == cand_top1))
+    known = labels >= 0
+
+    print(f"{len(queries)} queries, {len(texts)} diseases; {args.candidate} vs {args.reference}")
+    print(f"cosine similarity: mean {cosines.mean():.4f}  min {cosines.min():.4f}  p5 {np.percentile(cosines, 5):.4f}")
+    print(f"top-1 agreement:   {agreement:.1%}")
+    for backend, top1 in ((args.reference, ref_top1), (args.candidate, cand_top1)):
+        print(f"top-1 accuracy ({backend}): {np.mean(top1[known] == labels[known]):.1%} of {int(known.sum())} labeled")
+    for i in np.flatnonzero(ref_top1 != cand_top1):
+        print(f"  disagree: {queries[i]!r}: {names[ref_top1[i]]} vs {names[cand_top1[i]]}")
+
+    if cosines.mean() < args.min_cosine or agreement < args.min_agreement:
+        sys.exit("Parity check FAILED")
+    print("Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
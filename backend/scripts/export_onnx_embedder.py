@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Exports all-MiniLM-L6-v2 to ONNX for EMBEDDER_BACKEND=onnx.
+
+Writes the fp32 graph (model.onnx), its int8 dynamically quantized copy
+(model-int8.onnx) and the tokenizer into the output directory:
+
+    python -m scripts.export_onnx_embedder --out models/minilm-onnx
+
+Only the transformer is exported; mean pooling and normalization run in
+app/onnx_embedder.py. Check the result with scripts/embedder_parity.py.
+"""
+
+import argparse
+import os
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def export(out_dir: str, opset: int):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModel.from_pretrained(MODEL_NAME).eval()
+
+    sample = tokenizer(["a sample sentence to trace the graph"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic = {"batch": 0, "tokens": 1}
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[n] for n in names),
+            fp32_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**{n: dynamic for n in names}, "last_hidden_state": dynamic},
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(out_dir)
+    return fp32_path
+
+
+def quantize(fp32_path: str, out_dir: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = os.path.join(out_dir, "model-int8.onnx")
+    # Dynamic quantization: int8 weights, activations quantized per batch at run time
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="models/minilm-onnx", help="Output directory (EMBEDDER_ONNX_DIR)")
+    parser.add_argument("--opset", type=int, default=14, help="ONNX opset version")
+    parser.add_argument("--skip-quantize", action="store_true", help="Only write the fp32 model")
+    args = parser.parse_args()
+
+    fp32_path = export(args.out, args.opset)
+    print(f"fp32 model: {fp32_path} ({os.path.getsize(fp32_path) / 1e6:.1f} MB)")
+    if not args.skip_quantize:
+        int8_path = quantize(fp32_path, args.out)
+        print(f"int8 model: {int8_path} ({os.path.getsize(int8_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
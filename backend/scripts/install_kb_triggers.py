@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Installs the knowledge-base change triggers (database/triggers.sql) on an existing Postgres database.
+
+Fresh databases get them from docker-entrypoint-initdb.d; databases created before the
+triggers existed need this once, run as the role that owns the tables:
+
+    python -m scripts.install_kb_triggers
+
+The statements are idempotent. Until the triggers are there, workers still pick up
+knowledge-base changes through polling (KB_REFRESH_SECONDS).
+"""
+
+import argparse
+
+from app.database import engine
+from app.knowledge_base import KB_TRIGGERS_SQL, install_change_triggers
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    if engine.dialect.name != "postgresql":
+        raise SystemExit(f"Change triggers are Postgres only; this database is {engine.dialect.name}")
+    install_change_triggers()
+    print(f"Installed {KB_TRIGGERS_SQL}")
+
+
+if __name__ == "__main__":
+    main()
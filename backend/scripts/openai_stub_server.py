@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Local stub of the OpenAI chat-completions API (streaming and non-streaming).
+
+Run it and point the backend at it:
+
+    uvicorn scripts.openai_stub_server:app --port 8099
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://localhost:8099/v1 uvicorn app.main:app
+
+Behaviour is controlled with environment variables:
+- STUB_FIRST_TOKEN_MS: delay before the first chunk (default 200)
+- STUB_TOKEN_MS: delay between chunks (default 20)
+- STUB_FAIL_FIRST: number of initial requests answered with HTTP 500, to exercise retries (default 0)
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FIRST_TOKEN_MS = float(os.getenv("STUB_FIRST_TOKEN_MS", 200))
+TOKEN_MS = float(os.getenv("STUB_TOKEN_MS", 20))
+FAIL_FIRST = int(os.getenv("STUB_FAIL_FIRST", 0))
+
+REPLY = (
+    "Thanks for sharing that. How long have you had these symptoms, and how severe are they on a scale "
+    "from 1 to 10? This sounds mild; rest, fluids and over-the-counter pain relievers usually help, "
+    "but please see a doctor if it gets worse."
+)
+
+app = FastAPI(title="OpenAI stub")
+state = {"requests": 0}
+
+
+def _chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    state["requests"] += 1
+    if state["requests"] <= FAIL_FIRST:
+        return JSONResponse(status_code=500, content={"error": {"message": "stub failure", "type": "server_error"}})
+
+    model = body.get("model", "stub")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    tokens = [t + " " for t in REPLY.split(" ")]
+
+    if not body.get("stream"):
+        await asyncio.sleep((FIRST_TOKEN_MS + TOKEN_MS * len(tokens)) / 1000.0)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+        }
+
+    async def events():
+        await asyncio.sleep(FIRST_TOKEN_MS / 1000.0)
+        yield f"data: {json.dumps(_chunk(completion_id, model, {'role': 'assistant', 'content': ''}))}\n\n"
+        for token in tokens:
+            yield f"data: {json.dumps(_chunk(completion_id, model, {'content': token}))}\n\n"
+            await asyncio.sleep(TOKEN_MS / 1000.0)
+        yield f"data: {json.dumps(_chunk(completion_id, model, {}, 'stop'))}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
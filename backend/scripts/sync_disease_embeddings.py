@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Re-embeds new or changed diseases into the disease_embeddings table.
+
+Run it after editing the catalogue or switching EMBEDDER_BACKEND, e.g. before a
+deploy, so the app starts from stored vectors without encoding anything:
+
+    python -m scripts.sync_disease_embeddings
+
+Only diseases whose text hash differs from the stored one (or that have no vector
+for the configured model yet) are encoded; vectors of deleted diseases are dropped.
+"""
+
+import argparse
+import json
+
+from app.database import create_db_tables
+from app.disease_index import sync_disease_embeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-id", help="Expected model id; refuses to run if the configured embedder's differs")
+    args = parser.parse_args()
+
+    create_db_tables()  # makes sure disease_embeddings exists on databases created before it
+    try:
+        summary = sync_disease_embeddings(args.model_id)
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
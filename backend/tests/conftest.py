@@ -0,0 +1,58 @@
+"""
+Shared test setup.
+
+The app reads its configuration when it is imported, so the environment is set here, before any
+test module imports it: a fresh SQLite database built from database/schema.sql and seed.sql, no
+background refresh, no rate limits, and no FLAN rephrasing. The embedder is the hashing stub of
+scripts/loadtest.py, so no test downloads or loads a model.
+
+    cd backend && python -m pytest -q
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='healthmate-tests-'), 'test.db')}"
+os.environ["SECRET_KEY"] = "test-secret"
+os.environ["KB_REFRESH_SECONDS"] = "0"
+os.environ["KB_LISTEN"] = "false"
+os.environ["FLAN_REPHRASE"] = "false"
+os.environ["RATE_LIMIT_CHAT_PER_MINUTE"] = "0"
+os.environ["RATE_LIMIT_EMBED_PER_MINUTE"] = "0"
+os.environ["INFERENCE_SERVER_SOCKET"] = ""
+os.environ["PRELOAD_MODELS"] = ""
+
+from scripts.loadtest import HashingEmbedder, prepare_database  # noqa: E402
+
+prepare_database(os.environ["DATABASE_URL"])
+
+from app.routers.llm_models import model_registry  # noqa: E402
+
+model_registry.register("embedder", HashingEmbedder, model_id="test-hashing-384")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def user(client):
+    """A newly registered user: {"id", "username", "headers"} (headers carry its bearer token)."""
+    username = f"user-{uuid.uuid4().hex[:12]}"
+    response = client.post("/auth/register/", json={"username": username, "email": f"{username}@example.com", "password": "test-password"})
+    assert response.status_code == 201, response.text
+    token = client.post("/auth/token", data={"username": username, "password": "test-password"}).json()["access_token"]
+    return {"id": response.json()["id"], "username": username, "headers": {"Authorization": f"Bearer {token}"}}
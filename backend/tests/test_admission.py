@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected, TokenBuckets
+from app.routers import llm_router
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _rejection(controller, user_id, rate_scope, scope) -> AdmissionRejected:
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit(user_id, rate_scope, scope)
+    return rejected.value
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    buckets = TokenBuckets(rate_per_minute=60, burst=3, clock=clock)
+    assert [buckets.take("u") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take("u") == pytest.approx(1.0)
+
+    clock.advance(0.5)
+    assert buckets.take("u") == pytest.approx(0.5)
+    clock.advance(0.5)
+    assert buckets.take("u") == 0.0
+
+    # Refill stops at the burst size
+    clock.advance(3600)
+    assert [buckets.take("u") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take("u") > 0
+
+
+def test_rate_limit_is_per_user_and_answers_429_with_retry_after(clock):
+    controller = AdmissionController(
+        rate_limits={"chat": TokenBuckets(rate_per_minute=6, burst=2, clock=clock)},
+        concurrency_limits={}, max_in_flight=0,
+    )
+    for _ in range(2):
+        controller.admit(1, "chat", "openai").release()
+
+    rejected = _rejection(controller, 1, "chat", "openai")
+    assert rejected.status_code == 429
+    # One token every 10 seconds
+    assert rejected.retry_after == 10
+    # Another user has a bucket of their own
+    controller.admit(2, "chat", "openai").release()
+
+    clock.advance(10)
+    controller.admit(1, "chat", "openai").release()
+    assert controller.stats()["rejected_rate_limit"] == 1
+
+
+def test_concurrency_cap_is_per_model_choice_and_answers_503():
+    controller = AdmissionController(rate_limits={}, concurrency_limits={"flan-t5": 2, "embedding": 5},
+                                     max_in_flight=0, retry_after=7)
+    held = [controller.admit(user_id, "chat", "flan-t5") for user_id in (1, 2)]
+
+    rejected = _rejection(controller, 3, "chat", "flan-t5")
+    assert (rejected.status_code, rejected.retry_after) == (503, 7)
+    with controller.admit(3, "chat", "embedding"):
+        assert controller.stats()["embedding"]["scope_in_flight"] == 1
+
+    held[0].release()
+    controller.admit(3, "chat", "flan-t5").release()
+    held[1].release()
+    assert controller.in_flight == 0
+    assert controller.stats()["rejected_concurrency"] == 1
+
+
+def test_global_cap_spans_all_scopes():
+    controller = AdmissionController(rate_limits={}, concurrency_limits={"openai": 10, "embed": 10}, max_in_flight=3)
+    held = [controller.admit(1, "chat", "openai"), controller.admit(2, "chat", "openai"), controller.admit(3, "embed", "embed")]
+
+    assert _rejection(controller, 4, "embed", "embed").status_code == 503
+    assert controller.stats()["rejected_global"] == 1
+
+    for ticket in held:
+        ticket.release()
+    controller.admit(4, "embed", "embed").release()
+
+
+def test_rate_limit_is_checked_before_the_concurrency_caps(clock):
+    controller = AdmissionController(
+        rate_limits={"chat": TokenBuckets(rate_per_minute=60, burst=1, clock=clock)},
+        concurrency_limits={"openai": 1}, max_in_flight=0,
+    )
+    held = controller.admit(1, "chat", "openai")
+    # Over its rate and at the cap: the cheaper check answers, and no slot is taken
+    assert _rejection(controller, 1, "chat", "openai").status_code == 429
+    assert controller.in_flight == 1
+    held.release()
+
+
+def test_ticket_releases_once():
+    controller = AdmissionController(rate_limits={}, concurrency_limits={"openai": 1}, max_in_flight=0)
+    ticket = controller.admit(1, "chat", "openai")
+    ticket.release()
+    ticket.release()
+    assert controller.in_flight == 0
+    assert controller.stats()["openai"]["scope_in_flight"] == 0
+
+
+def test_hold_while_releases_when_the_stream_is_closed_early():
+    controller = AdmissionController(rate_limits={}, concurrency_limits={"openai": 1}, max_in_flight=0)
+
+    async def tokens():
+        for i in range(10):
+            yield i
+
+    async def scenario():
+        stream = controller.admit(1, "chat", "openai").hold_while(tokens())
+        assert await stream.__anext__() == 0
+        assert controller.in_flight == 1
+        # What the server does when the client disconnects mid-stream
+        await stream.aclose()
+        assert controller.in_flight == 0
+
+        # A stream read to the end releases as well
+        stream = controller.admit(1, "chat", "openai").hold_while(tokens())
+        assert [item async for item in stream] == list(range(10))
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_rejections_carry_retry_after_over_http(client, user, clock, monkeypatch):
+    limited = AdmissionController(rate_limits={"embed": TokenBuckets(rate_per_minute=30, burst=1, clock=clock)},
+                                  concurrency_limits={}, max_in_flight=0)
+    monkeypatch.setattr(llm_router, "admission", limited)
+    assert client.post("/ai/embed/", json={"text": "sore throat"}, headers=user["headers"]).status_code == 200
+    response = client.post("/ai/embed/", json={"text": "sore throat"}, headers=user["headers"])
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+    busy = AdmissionController(rate_limits={}, concurrency_limits={"embed": 1}, max_in_flight=0, retry_after=4)
+    monkeypatch.setattr(llm_router, "admission", busy)
+    with busy.admit("someone else", "embed", "embed"):
+        response = client.post("/ai/embed/", json={"text": "sore throat"}, headers=user["headers"])
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "4"
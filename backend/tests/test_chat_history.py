@@ -0,0 +1,83 @@
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.message_writer import ChatMessageWriter
+from app.routers import llm_router
+
+from tests.test_message_writer import _gate_inserts
+
+
+def _save_messages(user_id, n, writer=None):
+    """`n` committed messages, three to a timestamp so that pages also split ties on id."""
+    writer = writer or ChatMessageWriter(mode="sync")
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    messages = [writer.build(user_id, "user" if i % 2 == 0 else "assistant", f"message {i}") for i in range(n)]
+    for i, message in enumerate(messages):
+        message.timestamp = start + timedelta(seconds=i // 3)
+    writer.persist_blocking(messages)
+    return [m.id for m in messages]
+
+
+def _all_pages(client, headers, limit):
+    """Follows X-Next-Cursor from the newest page back; returns the pages in the order fetched."""
+    pages, params = [], {"limit": limit}
+    while True:
+        response = client.get("/ai/chat/history/", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append([m["id"] for m in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+        params = {"limit": limit, "before": cursor}
+
+
+def test_pages_cover_the_history_once_in_order(client, user):
+    ids = _save_messages(user["id"], 41)
+
+    pages = _all_pages(client, user["headers"], limit=20)
+
+    assert [len(page) for page in pages] == [20, 20, 1]
+    # Each page is oldest-first; pages go back in time
+    assert [i for page in reversed(pages) for i in page] == ids
+
+
+def test_a_full_last_page_has_no_cursor(client, user):
+    ids = _save_messages(user["id"], 40)
+    assert _all_pages(client, user["headers"], limit=20) == [ids[20:], ids[:20]]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b"2024-01-01T00:00:00").decode(),
+    base64.urlsafe_b64encode(b"yesterday|1").decode(),
+    base64.urlsafe_b64encode(b"2024-01-01T00:00:00|one").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_malformed_cursor_is_a_400(client, user, cursor):
+    response = client.get("/ai/chat/history/", params={"before": cursor}, headers=user["headers"])
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid history cursor."
+
+
+def test_pending_write_behind_messages_lead_the_first_page(client, user, monkeypatch):
+    committed = _save_messages(user["id"], 41)
+    writer = ChatMessageWriter(mode="write_behind")
+    gate = _gate_inserts(writer)
+    monkeypatch.setattr(llm_router, "message_writer", writer)
+    try:
+        pending = [writer.build(user["id"], "user", "still queued"), writer.build(user["id"], "assistant", "me too")]
+        writer.persist_blocking(pending)
+        assert len(writer.pending(user["id"])) == 2
+
+        before_flush = _all_pages(client, user["headers"], limit=20)
+    finally:
+        gate.set()
+        writer.close()
+
+    expected = committed + [m.id for m in pending]
+    assert before_flush[0][-2:] == expected[-2:]
+    assert [i for page in reversed(before_flush) for i in page] == expected
+    # Once committed, the same pages come back from the table alone
+    assert _all_pages(client, user["headers"], limit=20) == before_flush
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+
+from app.main import app
+from app.routers import llm_router
+
+from tests.test_message_writer import _saved
+
+
+def _parse_sse(text):
+    """[(event, data), ...] of a text/event-stream body."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class EndlessGenerator:
+    """Stands in for the generation service: streams words until the caller stops reading."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def stream(self, prompt):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "rest "
+        finally:
+            self.closed = True
+
+
+class SlowWriter:
+    """The shared writer, but each persist() first yields to the event loop for a while, as a busy DB would."""
+
+    def __init__(self, writer):
+        self._writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
+    async def persist(self, *messages):
+        await asyncio.sleep(0.1)
+        await self._writer.persist(*messages)
+
+
+def _wait_for_rows(user_id, n, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(rows := _saved(user_id)) < n and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return rows
+
+
+def test_events_arrive_in_order_and_the_turn_is_saved(client, user):
+    message = "I have a sore throat and fever"
+    with client.stream("POST", "/ai/chat/stream/", json={"model_choice": "embedding", "message": message},
+                       headers=user["headers"]) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = _parse_sse(response.read().decode())
+
+    names = [event for event, _ in events]
+    assert names[0] == "matched" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+    assert events[0][1]["disease"]
+
+    reply = "".join(data["text"] for event, data in events if event == "token").strip()
+    done = events[-1][1]
+    assert (done["role"], done["content"]) == ("assistant", reply)
+    assert [(role, content) for _, role, content in _saved(user["id"])] == [("user", message), ("assistant", reply)]
+    assert _saved(user["id"])[-1].id == done["id"]
+
+
+def _stream_until_first_token(path, headers, payload):
+    """Calls the app directly (not through TestClient, which buffers the response) and disconnects after a token."""
+    body = json.dumps(payload).encode()
+    chunks = []
+
+    async def scenario():
+        got_token = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await got_token.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                chunks.append(message["body"].decode())
+                if "event: token" in chunks[-1]:
+                    got_token.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"testserver"), (b"content-type", b"application/json"),
+                        *((k.lower().encode(), v.encode()) for k, v in headers.items())],
+            "client": ("testclient", 50000), "server": ("testserver", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), 10)
+        # A server's loop keeps running after the request; whatever it left behind gets to finish
+        await asyncio.sleep(0.5)
+
+    asyncio.run(scenario())
+    return _parse_sse("".join(chunks))
+
+
+def test_reply_cut_short_by_a_disconnect_is_saved_as_far_as_it_went(client, user, monkeypatch):
+    generator = EndlessGenerator()
+    monkeypatch.setattr(llm_router, "FLAN_REPHRASE", True)
+    monkeypatch.setattr(llm_router, "generation_service", lambda: generator)
+    # Still saving when the request is cancelled: only the shield lets the write finish
+    monkeypatch.setattr(llm_router, "message_writer", SlowWriter(llm_router.message_writer))
+    message = "I have a sore throat and fever"
+
+    events = _stream_until_first_token("/ai/chat/stream/", user["headers"],
+                                       {"model_choice": "flan-t5", "message": message})
+
+    assert [event for event, _ in events][:2] == ["matched", "token"]
+    assert "done" not in [event for event, _ in events]
+    assert generator.closed
+    # The user message and the part of the reply that was sent, saved despite the cancellation
+    rows = _wait_for_rows(user["id"], 2)
+    assert [(role, content) for _, role, content in rows][0] == ("user", message)
+    assert rows[1].role == "assistant"
+    # At least what the client received; the stream may have got a word further before it was cancelled
+    sent = "".join(data["text"] for event, data in events if event == "token").strip()
+    assert rows[1].content.startswith(sent)
+    assert set(rows[1].content.split()) == {"rest"}
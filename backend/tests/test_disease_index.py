@@ -0,0 +1,18 @@
+import pytest
+
+from app.disease_index import sync_disease_embeddings
+from app.routers.llm_models import embedder_model_id
+
+
+def test_sync_stores_vectors_under_the_configured_embedder():
+    summary = sync_disease_embeddings()
+    assert summary["model"] == embedder_model_id()
+    # Nothing changed since: the second run reuses every stored vector
+    again = sync_disease_embeddings(embedder_model_id())
+    assert (again["encoded"], again["reused"]) == (0, summary["diseases"])
+
+
+def test_sync_refuses_another_model_id():
+    # The vectors would come from the configured embedder and be mislabelled
+    with pytest.raises(ValueError, match="configured embedder"):
+        sync_disease_embeddings("some-other-model")
@@ -0,0 +1,70 @@
+import random
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from app.database import engine
+from app.disease_index import disease_index
+from app.disease_ranker import DiseaseRanker
+from app.routers.llm_models import get_embedder
+
+FILLER = ["i", "have", "a", "bad", "since", "yesterday", "and", "my", "really", "today", "with", "some"]
+
+
+@pytest.fixture(scope="module")
+def keywords():
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT name, keywords FROM symptoms")).all()
+    return sorted({kw.strip().lower() for name, csv in rows for kw in [name, *(csv or "").split(",")] if kw.strip()})
+
+
+@pytest.fixture(scope="module")
+def links():
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT disease_id, symptom_id, weight FROM disease_symptoms")).all()
+
+
+def _queries(keywords, n=200, seed=7):
+    rng = random.Random(seed)
+    for _ in range(n):
+        words = rng.sample(FILLER, rng.randint(0, 5)) + rng.sample(keywords, rng.randint(1, 4))
+        rng.shuffle(words)
+        yield " ".join(words)
+
+
+def _best_by_votes(links, symptom_ids):
+    """Reference: per-disease sum of link weights over the matched symptoms; ties go to the lower id."""
+    votes = {}
+    for disease_id, symptom_id, weight in links:
+        if symptom_id in symptom_ids:
+            votes[disease_id] = votes.get(disease_id, 0.0) + float(weight)
+    votes = {disease_id: v for disease_id, v in votes.items() if v > 0}
+    if not votes:
+        return None
+    return min(votes.items(), key=lambda item: (-item[1], item[0]))
+
+
+def test_keyword_ranking_top1_is_the_best_voted_disease(keywords, links):
+    ranker = DiseaseRanker()
+    for question in _queries(keywords):
+        result = ranker.rank(question)
+        expected = _best_by_votes(links, set(result.symptom_matches))
+        assert (result.best is None) == (expected is None), question
+        if expected is not None:
+            assert result.best.disease[0] == expected[0], question
+            assert result.best.keyword_score == pytest.approx(expected[1]), question
+
+
+def test_embedding_ranking_top1_is_the_most_similar_disease(keywords):
+    ranker = DiseaseRanker(keyword_weight=0.0, embedding_weight=1.0)
+    index = disease_index.get()
+    embedder = get_embedder()
+    for question in _queries(keywords, n=100, seed=11):
+        vector = embedder.encode(question)
+        best = ranker.rank(question, vector).best
+        similarities = index.vectors @ (vector / np.linalg.norm(vector))
+        assert best.similarity == pytest.approx(similarities.max(), abs=1e-6), question
+        # Equal similarities may be ordered either way; the chosen disease must have the top one
+        row = int(np.flatnonzero(index.disease_ids == best.disease[0])[0])
+        assert similarities[row] == pytest.approx(similarities.max(), abs=1e-6), question
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from app import encode_batcher as encode_batcher_module
+from app.encode_batcher import EncodeBatcher
+from scripts.loadtest import HashingEmbedder
+
+
+class FlakyExecutor:
+    """Stands in for inference_executor: refuses the first batch, then runs batches inline."""
+
+    def __init__(self):
+        self.failures = 1
+
+    def submit(self, fn, *args, block=False):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        fn(*args)
+
+
+def test_batch_that_cannot_be_scheduled_fails_its_callers_only(monkeypatch):
+    monkeypatch.setattr(encode_batcher_module, "inference_executor", FlakyExecutor())
+    embedder = HashingEmbedder()
+    batcher = EncodeBatcher(get_model=lambda: embedder, max_wait_ms=0)
+
+    with pytest.raises(RuntimeError, match="after shutdown"):
+        batcher.submit("sore throat").result(timeout=2)
+    # The collector thread survived and serves the next batch
+    np.testing.assert_allclose(batcher.submit("fever").result(timeout=2), embedder.encode(["fever"])[0])
+    assert batcher.stats()["errors"] == 1
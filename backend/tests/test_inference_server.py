@@ -0,0 +1,144 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app import inference_server
+from app.disease_ranker import RankResult, disease_ranker
+from app.inference_client import InferenceClient, InferenceServerUnavailable, RemoteEmbedder, unpack_vectors
+from app.routers.llm_models import model_registry
+from scripts.loadtest import HashingEmbedder
+
+
+class StubGenerator:
+    """Stands in for flan_generator on the server: yields the body back word by word, slowly."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+        self.completed = False
+
+    async def stream(self, body, prefix=None, max_new_tokens=None, deadline_seconds=None):
+        try:
+            for word in body.split():
+                await asyncio.sleep(0.01)
+                yield word + " "
+            self.completed = True
+        finally:
+            self.closed.set()
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    stub = StubGenerator()
+    monkeypatch.setattr(inference_server, "flan_generator", stub)
+    return stub
+
+
+async def _cancel_all():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.fixture(scope="module")
+def socket_path(tmp_path_factory):
+    """An inference server on a temporary socket, on its own event loop thread, using the stub embedder."""
+    path = str(tmp_path_factory.mktemp("inference") / "inference.sock")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="inference-server", daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(inference_server.serve(path), loop)
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, "inference server did not start"
+        time.sleep(0.01)
+    yield path
+    asyncio.run_coroutine_threadsafe(_cancel_all(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+@pytest.fixture
+def inference(socket_path):
+    return InferenceClient(socket_path, timeout=5)
+
+
+def test_embed(inference):
+    texts = ["sore throat", "high fever and chills"]
+    vectors = unpack_vectors(asyncio.run(inference.request("embed", texts=texts)))
+    np.testing.assert_allclose(vectors, HashingEmbedder().encode(texts), atol=1e-6)
+    # Worker threads use the blocking path, one connection per call
+    np.testing.assert_allclose(RemoteEmbedder(inference).encode(texts[0]), vectors[0], atol=1e-6)
+
+
+def test_rank(inference):
+    question = "i have a sore throat and a fever"
+    ranking = RankResult.from_payload(asyncio.run(inference.request("rank", question=question, k=3)))
+    local = disease_ranker.rank(question, HashingEmbedder().encode(question), 3)
+    assert [c.disease[0] for c in ranking.candidates] == [c.disease[0] for c in local.candidates]
+    assert set(ranking.symptom_matches) == set(local.symptom_matches)
+
+
+def test_generate_streams_chunks(inference, generator):
+    async def generate():
+        return [chunk async for chunk in inference.stream("generate", 5, body="rest and drink fluids")]
+
+    assert asyncio.run(generate()) == ["rest ", "and ", "drink ", "fluids "]
+
+
+def test_cancelled_generation_stops_on_the_server(inference, generator):
+    async def read_one_chunk():
+        stream = inference.stream("generate", 60, body=" ".join(["word"] * 5000))
+        first = await stream.__anext__()
+        # The caller goes away: the client sends a cancel frame
+        await stream.aclose()
+        assert inference._pending == {}
+        # Checked while the connection is still open: closing it would stop the generation anyway
+        stopped = await asyncio.get_running_loop().run_in_executor(None, generator.closed.wait, 2)
+        return first, stopped
+
+    first, stopped = asyncio.run(read_one_chunk())
+    assert first == "word "
+    assert stopped, "server kept generating after the cancel"
+    assert not generator.completed
+
+
+def test_unknown_op_is_an_error(inference):
+    with pytest.raises(RuntimeError, match="Unknown op"):
+        asyncio.run(inference.request("nonsense"))
+
+
+def test_dead_socket_is_unavailable(tmp_path):
+    # A socket file left behind by a server that is gone: connections are refused
+    path = str(tmp_path / "dead.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(path)
+    client = InferenceClient(path, timeout=1)
+
+    with pytest.raises(InferenceServerUnavailable):
+        asyncio.run(client.request("ping"))
+    with pytest.raises(InferenceServerUnavailable):
+        client.request_blocking("embed", texts=["x"])
+    with pytest.raises(InferenceServerUnavailable):
+        InferenceClient(str(tmp_path / "missing.sock")).request_blocking("ping")
+    assert client.stats()["errors"] == 2
+
+
+def test_dead_socket_is_a_503(client, user, tmp_path, monkeypatch):
+    # Route the embedder to a server that is not there, as a web worker with INFERENCE_SERVER_SOCKET would
+    monkeypatch.setattr(model_registry, "_entries", dict(model_registry._entries))
+    dead = InferenceClient(str(tmp_path / "missing.sock"), timeout=1)
+    model_registry.register("embedder", lambda: RemoteEmbedder(dead), model_id=model_registry.model_id("embedder"))
+
+    response = client.post("/ai/embed/", json={"text": "sore throat"}, headers=user["headers"])
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
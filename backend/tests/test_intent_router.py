@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.intent_router import AFFIRMATION, GREETING, OFF_TOPIC, SYMPTOMS, THANKS, IntentRouter
+from app.response_cache import TTLCache, normalize_message
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(use_classifier=False, cache=TTLCache(16, 60))
+
+
+def _rule(router, message):
+    return router.match_rules(normalize_message(message))
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("Hi!", GREETING),
+    ("good morning there", GREETING),
+    ("Thank you so much.", THANKS),
+    ("ok", AFFIRMATION),
+    ("go ahead", AFFIRMATION),
+])
+def test_short_messages(router, message, intent):
+    assert _rule(router, message) == intent
+
+
+@pytest.mark.parametrize("message", ["this is weird", "I think so", "hey, what do you think", "thanks but no"])
+def test_only_whole_messages_are_small_talk(router, message):
+    # "hi" in "this", "ty"/"ok" inside longer words or sentences are not greetings/thanks
+    assert _rule(router, message) not in (GREETING, THANKS, AFFIRMATION)
+
+
+@pytest.mark.parametrize("message", [
+    "I don't feel well",
+    "I dont feel well today",
+    "I feel unwell",
+    "not feeling myself lately",
+    "I feel awful",
+    "my head is pounding",
+    "I have a headache",
+])
+def test_ways_of_feeling_unwell_are_symptoms(router, message):
+    assert _rule(router, message) == SYMPTOMS
+
+
+@pytest.mark.parametrize("message", ["which headphones should I buy", "heading home now", "I feel great"])
+def test_health_words_match_whole_words(router, message):
+    assert _rule(router, message) is None
+
+
+def test_route_falls_back_to_off_topic_without_the_classifier(router):
+    assert asyncio.run(router.route("what is the capital of france")) == OFF_TOPIC
+    assert asyncio.run(router.route("I don't feel well")) == SYMPTOMS
@@ -0,0 +1,30 @@
+from app.knowledge_base import knowledge_base, seed_random
+from app.routers.llm_router import _embedding_reply
+
+
+def _replies():
+    """A run of templated replies: every disease once, then the no-match fallback a few times."""
+    kb = knowledge_base.get()
+    replies = []
+    for disease_id in kb.disease_ids.tolist():
+        reply, _ = _embedding_reply(kb.disease(disease_id), kb.suggestions_for(disease_id))
+        replies.append(reply)
+    for _ in range(5):
+        replies.append(_embedding_reply(None, [])[0])
+    return replies
+
+
+def test_seeded_replies_are_reproducible():
+    seed_random(1234)
+    first = _replies()
+    seed_random(1234)
+    assert _replies() == first
+
+
+def test_replies_depend_on_the_seed():
+    # Otherwise the test above would pass without the RNG being used at all
+    seed_random(1234)
+    first = _replies()
+    assert any(_replies() != first for _ in range(5))
+    seed_random(4321)
+    assert _replies() != first
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+
+from sqlalchemy import select
+
+from app import models
+from app.database import engine
+from app.message_writer import ChatMessageWriter, MessageIdAllocator, history_key
+from app.routers import llm_router
+
+
+def _saved(user_id):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(models.ChatMessage.id, models.ChatMessage.role, models.ChatMessage.content)
+            .where(models.ChatMessage.user_id == user_id)
+            .order_by(models.ChatMessage.id)
+        ).all()
+
+
+def _gate_inserts(writer):
+    """Holds the writer's background flushes until the returned event is set."""
+    gate = threading.Event()
+    insert = writer._insert
+
+    def gated_insert(messages):
+        if threading.current_thread().name == "chat-writer":
+            gate.wait(10)
+        insert(messages)
+
+    writer._insert = gated_insert
+    return gate
+
+
+def test_sync_persists_both_messages_of_a_turn_with_ordered_ids(user):
+    writer = ChatMessageWriter(mode="sync")
+    user_message = writer.build(user["id"], "user", "I have a sore throat")
+    bot_message = writer.build(user["id"], "assistant", "Try warm salt water.")
+
+    asyncio.run(writer.persist(user_message, bot_message))
+
+    assert bot_message.id == user_message.id + 1
+    assert history_key(user_message) < history_key(bot_message)
+    assert _saved(user["id"]) == [
+        (user_message.id, "user", "I have a sore throat"),
+        (bot_message.id, "assistant", "Try warm salt water."),
+    ]
+    assert writer.pending(user["id"]) == []
+    assert writer.stats()["transactions"] == 1
+
+
+def test_write_behind_messages_are_in_history_before_the_flush(client, user, monkeypatch):
+    writer = ChatMessageWriter(mode="write_behind")
+    gate = _gate_inserts(writer)
+    monkeypatch.setattr(llm_router, "message_writer", writer)
+    try:
+        response = client.post("/ai/chat/", json={"model_choice": "embedding", "message": "hello"}, headers=user["headers"])
+        assert response.status_code == 200, response.text
+
+        history = client.get("/ai/chat/history/", headers=user["headers"]).json()
+        assert [(m["role"], m["content"]) for m in history] == [("user", "hello"), ("assistant", response.json()["content"])]
+        assert history[-1]["id"] == response.json()["id"]
+        assert _saved(user["id"]) == []
+    finally:
+        gate.set()
+        writer.close()
+
+    assert [row.id for row in _saved(user["id"])] == [m["id"] for m in history]
+
+
+def test_close_flushes_everything_still_queued(user):
+    writer = ChatMessageWriter(mode="write_behind", batch_size=3)
+    gate = _gate_inserts(writer)
+    messages = [writer.build(user["id"], "user", f"message {i}") for i in range(10)]
+    for message in messages:
+        writer.persist_blocking([message])
+    assert len(writer.pending(user["id"])) == 10
+
+    threading.Timer(0.2, gate.set).start()
+    writer.close()
+
+    assert writer.pending(user["id"]) == []
+    assert [row.content for row in _saved(user["id"])] == [f"message {i}" for i in range(10)]
+
+
+def test_two_writers_never_hand_out_the_same_id(user):
+    writers = [ChatMessageWriter(mode="sync", allocator=MessageIdAllocator(block_size=7)) for _ in range(2)]
+    ids = [[], []]
+
+    def write(index):
+        writer = writers[index]
+        for i in range(40):
+            message = writer.build(user["id"], "user", f"writer {index} message {i}")
+            writer.persist_blocking([message])
+            ids[index].append(message.id)
+
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids[0]) | set(ids[1])) == 80
+    assert len(_saved(user["id"])) == 80
+    # SQLite has no sequence: both allocators reserved their blocks from MAX(id) and the shared counter
+    assert all(writer.allocator.reservations > 1 for writer in writers)
@@ -0,0 +1,102 @@
+import random
+import re
+
+import pytest
+from sqlalchemy import text
+
+from app.database import engine
+from app.symptom_matcher import SymptomMatcher
+
+# Overlapping ("sore throat" / "throat pain"), prefix ("head" / "headache" / "headaches") and
+# punctuation-bearing ("covid-19", "e. coli") keywords
+ROWS = [
+    (1, "Sore throat", "sore,throat,scratchy throat"),
+    (2, "Throat pain", "pain,painful,throat pain"),
+    (3, "Headache", "head,headache,headaches,ache"),
+    (4, "Stomach ache", "stomach,stomach ache,tummy"),
+    (5, "Covid", "covid,covid-19,19"),
+    (6, "Infection", "e. coli,e,b12"),
+    (7, "Runny nose", "runny,nose,runny nose,nose bleed"),
+]
+
+SENTENCES = [
+    "I have a sore throat and throat pain",
+    "sore throat pain",
+    "headaches, head-ache and a headache!",
+    "my head hurts (headache)",
+    "stomach-ache; stomachache; stomach ache.",
+    "tested positive for covid-19 on day 19",
+    "covid19 or covid_19 or covid-190?",
+    "e. coli in the water, e.coli, b12 deficiency",
+    "runny nose bleed, nosebleed, runny-nose",
+    "painful painless pain's PAIN",
+    "_pain pain_ -pain- 'pain'",
+    "",
+]
+
+SEPARATORS = [" ", " ", "", "-", ",", ".", "_", "'", "(", ")", "!", "  ", ". "]
+
+
+def _keywords_of(name, csv):
+    return {kw.strip().lower() for kw in [name, *(csv or "").split(",")] if kw.strip()}
+
+
+def _keywords(rows):
+    return sorted(set().union(*(_keywords_of(name, csv) for _, name, csv in rows)))
+
+
+def _random_questions(rows, n, seed):
+    rng = random.Random(seed)
+    keywords = _keywords(rows)
+    pieces = keywords + [kw[: rng.randint(1, len(kw))] for kw in keywords] + ["x", "ed", "s", "ing", "pre"]
+    for _ in range(n):
+        parts = [rng.choice(pieces) for _ in range(rng.randint(1, 8))]
+        question = parts[0]
+        for part in parts[1:]:
+            question += rng.choice(SEPARATORS) + part
+        yield question.upper() if rng.random() < 0.2 else question
+
+
+def _assert_same_as_regex(matcher, rows, question):
+    # Every occurrence, overlapping ones included (a lookahead finds each start position)
+    expected = {
+        (kw, m.start(1), m.end(1))
+        for kw in _keywords(rows)
+        for m in re.finditer(rf"(?=(\b{re.escape(kw)}\b))", question, re.I)
+    }
+    assert {(m.keyword, m.start, m.end) for m in matcher.find_all(question)} == expected, question
+    # ...and the symptoms the old per-keyword scan reported
+    expected_ids = {
+        symptom_id for symptom_id, name, csv in rows
+        if any(re.search(rf"\b{re.escape(kw)}\b", question, re.I) for kw in _keywords_of(name, csv))
+    }
+    assert set(matcher.match(question)) == expected_ids, question
+
+
+@pytest.fixture(scope="module")
+def crafted():
+    return SymptomMatcher(ROWS), ROWS
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    with engine.connect() as conn:
+        rows = [tuple(r) for r in conn.execute(text("SELECT id, name, keywords FROM symptoms ORDER BY id"))]
+    return SymptomMatcher(rows), rows
+
+
+@pytest.mark.parametrize("question", SENTENCES)
+def test_matches_regex_on_crafted_sentences(crafted, question):
+    _assert_same_as_regex(*crafted, question)
+
+
+def test_matches_regex_on_random_keyword_mashups(crafted):
+    matcher, rows = crafted
+    for question in _random_questions(rows, n=1000, seed=3):
+        _assert_same_as_regex(matcher, rows, question)
+
+
+def test_matches_regex_with_the_seeded_keywords(seeded):
+    matcher, rows = seeded
+    for question in _random_questions(rows, n=500, seed=5):
+        _assert_same_as_regex(matcher, rows, question)
@@ -44,4 +44,48 @@ api.interceptors.response.use(
 );
 
 
+// Streams a chat turn from /ai/chat/stream/ (server-sent events over POST, so fetch rather
+// than EventSource). Calls onEvent(event, data) for every `matched`, `token` and `done` event.
+// Rejects with an Error carrying `status` when the request itself fails (e.g. 401 or 503).
+export async function streamChat(body, onEvent, { signal } = {}) {
+  const headers = { 'Content-Type': 'application/json', Accept: 'text/event-stream' };
+  const token = localStorage.getItem('access_token');
+  if (token) {
+    headers.Authorization = `Bearer ${token}`;
+  }
+  const response = await fetch(`${api.defaults.baseURL}/ai/chat/stream/`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify(body),
+    signal,
+  });
+  if (!response.ok) {
+    const error = new Error(`Chat stream failed with status ${response.status}`);
+    error.status = response.status;
+    throw error;
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      const data = [];
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+      }
+      if (data.length) onEvent(event, JSON.parse(data.join('\n')));
+    }
+  }
+}
+
 export default api;
\ No newline at end of file
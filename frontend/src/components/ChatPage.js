@@ -1,7 +1,7 @@
 // frontend/src/components/ChatPage.js
 import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import api from '../api'; // Your Axios instance
+import { streamChat } from '../api';
 import './ChatPage.css'; // We'll create this file for styling
 
 const MODEL_OPTIONS = [
@@ -73,20 +73,42 @@ const ChatPage = ({ onLogout }) => {
         setNewMessage('');
         setError('');
 
+        // Placeholder for the reply, filled in as events arrive and replaced by the saved message
+        const localId = `pending-${Date.now()}`;
+        setMessages(prevMessages => [
+            ...prevMessages,
+            { localId, role: 'assistant', content: '', timestamp: new Date().toISOString(), streaming: true }
+        ]);
+        const updatePending = (update) => setMessages(prevMessages =>
+            prevMessages.map(msg => msg.localId === localId ? { ...msg, ...update(msg) } : msg)
+        );
+
         try {
             setLoading(true);
-            const response = await api.post('/ai/chat/', {
-                message: userMessage.content, // NOT "content", your backend expects "message"
-                model_choice: modelChoice
-            });
-            setMessages(prevMessages => [...prevMessages, response.data]);
+            await streamChat(
+                {
+                    message: userMessage.content, // NOT "content", your backend expects "message"
+                    model_choice: modelChoice
+                },
+                (event, data) => {
+                    if (event === 'matched') {
+                        updatePending(() => ({ matched: data.disease }));
+                    } else if (event === 'token') {
+                        updatePending(msg => ({ content: msg.content + data.text }));
+                    } else if (event === 'done') {
+                        updatePending(() => ({ ...data, streaming: false }));
+                    }
+                }
+            );
         } catch (err) {
             setError('Failed to send message. Please try again.');
-            setMessages(prevMessages => prevMessages.filter(msg => msg !== userMessage));
-            if (err.response && err.response.status === 401) {
+            setMessages(prevMessages => prevMessages.filter(msg => msg !== userMessage && msg.localId !== localId));
+            if (err.status === 401) {
                 navigate('/');
             }
         } finally {
+            // A stream that ended without `done` (connection dropped) must not keep its cursor
+            updatePending(() => ({ streaming: false }));
             setLoading(false);
         }
     };
@@ -140,8 +162,12 @@ const ChatPage = ({ onLogout }) => {
                 {messages.map((msg, index) => (
                     <div key={index} className={`chat-message ${msg.role}`}>
                         <div className="message-bubble">
+                            {msg.matched && (
+                                <div className="message-matched">Possible match: {msg.matched.name}</div>
+                            )}
                             <span className="message-role">{msg.role === 'user' ? 'You' : 'AI'}:</span> {msg.content}
-                            {msg.role !== 'user' && msg.content && (
+                            {msg.streaming && <span className="typing-cursor">▍</span>}
+                            {msg.role !== 'user' && msg.content && !msg.streaming && (
                                 <button
                                     className="tts-btn"
                                     title="Play text-to-speech"